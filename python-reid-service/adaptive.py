@@ -0,0 +1,160 @@
+"""
+Adaptive Temporal Search
+Coarse-to-fine frame sampling: a sparse first pass over the whole video, then
+denser passes only in time windows around detections that look promising
+"""
+
+import math
+from typing import Dict, List, Optional, Tuple
+
+
+# analyze() search modes: one fixed sampling rate, or coarse-to-fine
+SEARCH_MODES = ("fixed", "adaptive")
+
+# Default interest threshold: this far below the match threshold
+INTEREST_MARGIN = 0.10
+
+
+class AdaptiveSampler:
+    """
+    Plans the refinement passes of a coarse-to-fine search
+
+    Pass 1 is the regular sampling (every `step` frames). Every later pass
+    divides the step by refine_factor, down to every frame, and samples only
+    the windows of +/- the previous step around frames where a detection
+    scored at least interest_threshold in the pass before. A person seen on
+    one coarse sample may have been in view anywhere between its neighbours,
+    which is the window the next pass looks at. Frames already processed are
+    never sampled again, and the search stops when a pass finds nothing
+    interesting or the step reaches 1.
+
+    Cost is the coarse pass plus the windows: close to sparse sampling on
+    long empty footage, and never more frames than sampling everything at
+    the finest step (plus the coarse pass) when people are always in view.
+    """
+
+    def __init__(
+        self,
+        step: float,
+        interest_threshold: float,
+        total_frames: int = 0,
+        refine_factor: float = 4.0
+    ):
+        """
+        Args:
+            step: Frames between samples of the coarse pass (fps / samples_per_second
+                or frame_interval)
+            interest_threshold: Detections scoring at least this (best identity)
+                are refined around; usually a little below the match threshold
+            total_frames: Frame count from the container (<= 0 if unknown)
+            refine_factor: Step divisor from one pass to the next
+        """
+        if step <= 0:
+            raise ValueError("step must be > 0")
+        if refine_factor <= 1:
+            raise ValueError("refine_factor must be > 1")
+        self.step = float(step)
+        self.interest_threshold = interest_threshold
+        self.total_frames = total_frames
+        self.refine_factor = refine_factor
+        self.passes: List[Dict] = []
+        self._processed = set()
+        self._interesting = set()
+        # Windows sampled by the current pass
+        self.windows: List[Tuple[int, int]] = []
+
+    def observe(self, frame_data: Dict):
+        """Record one scored frame of the current pass"""
+        frame_num = int(frame_data['frame_num'])
+        self._processed.add(frame_num)
+        for person in frame_data['persons']:
+            if person.get('similarity', -1.0) >= self.interest_threshold:
+                self._interesting.add(frame_num)
+                return
+
+    def finish_pass(self, frames: int):
+        """
+        Close the current pass
+
+        Args:
+            frames: Frames it processed (including frames a motion gate skipped)
+        """
+        self.passes.append({
+            "pass": len(self.passes) + 1,
+            "step": round(self.step, 3),
+            "frames": frames,
+            "interesting_frames": len(self._interesting),
+            "windows": len(self.windows)
+        })
+
+    def next_pass(self) -> Optional[List[int]]:
+        """
+        Frame numbers of the next refinement pass, in increasing order
+
+        Returns:
+            frame_numbers: None when the search is finished
+        """
+        while self._interesting and self.step > 1:
+            radius = self.step
+            self.step = max(self.step / self.refine_factor, 1.0)
+            self.windows = self.merge_windows(sorted(self._interesting), radius)
+            self._interesting = set()
+
+            frame_numbers = [
+                frame_num for frame_num in self.grid(self.windows, self.step)
+                if frame_num not in self._processed
+            ]
+            if frame_numbers:
+                return frame_numbers
+            # Everything in the windows was already sampled: nothing new at this step
+            self.finish_pass(0)
+        return None
+
+    def merge_windows(self, frame_nums: List[int], radius: float) -> List[Tuple[int, int]]:
+        """Merged [start, end] frame ranges of +/- radius around sorted frame numbers"""
+        last = self.total_frames - 1 if self.total_frames > 0 else None
+        merged: List[Tuple[int, int]] = []
+        for frame_num in frame_nums:
+            start = max(int(math.floor(frame_num - radius)), 0)
+            end = int(math.ceil(frame_num + radius))
+            if last is not None:
+                end = min(end, last)
+            if merged and start <= merged[-1][1] + 1:
+                merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+            else:
+                merged.append((start, end))
+        return merged
+
+    @staticmethod
+    def grid(windows: List[Tuple[int, int]], step: float) -> List[int]:
+        """
+        Frames of a global every-`step` grid that fall inside the windows
+
+        Using one grid for the whole video (rather than one per window) keeps
+        the spacing even where windows meet.
+        """
+        frame_nums = []
+        for start, end in windows:
+            k = int(math.ceil(start / step))
+            while True:
+                frame_num = int(round(k * step))
+                k += 1
+                if frame_num > end:
+                    break
+                if frame_num >= start and (not frame_nums or frame_num > frame_nums[-1]):
+                    frame_nums.append(frame_num)
+        return frame_nums
+
+    @property
+    def frames_processed(self) -> int:
+        return sum(p["frames"] for p in self.passes)
+
+    def summary(self) -> Dict:
+        """Per-pass frame counts for the response"""
+        return {
+            "mode": "adaptive",
+            "interest_threshold": self.interest_threshold,
+            "refine_factor": self.refine_factor,
+            "frames_processed": self.frames_processed,
+            "passes": self.passes
+        }
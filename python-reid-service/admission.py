@@ -0,0 +1,334 @@
+"""
+Admission Control
+Estimates what an analysis will cost from the video's container metadata,
+before any frame is decoded, and starts jobs only while the node has the
+memory and worker slots for them
+"""
+
+import math
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from profiling import REGISTRY, Counter, Gauge, Histogram, SECONDS_BUCKETS
+
+
+# Priority classes, most urgent first
+PRIORITIES = ("interactive", "normal", "batch")
+
+# Memory of one analysis besides its buffered frames: model activations,
+# decoder state, crops and scores
+JOB_BASE_MB = 200
+# Coarse pass plus refinement windows, relative to the coarse pass alone
+ADAPTIVE_WORK_FACTOR = 1.5
+# Bitrate assumed when the container has no frame count (duration from file size)
+FALLBACK_BITRATE = 4_000_000
+FALLBACK_FPS = 25.0
+
+# Analysis seconds per work unit until jobs have been timed, and the weight
+# of each finished job in the running average
+DEFAULT_SECONDS_PER_UNIT = 0.03
+RATE_SMOOTHING = 0.2
+
+QUEUED_GAUGE = REGISTRY.register(Gauge(
+    "reid_admission_queued", "Jobs waiting for admission by priority", ("priority",)
+))
+MEMORY_GAUGE = REGISTRY.register(Gauge(
+    "reid_admission_memory_mb", "Estimated memory of admitted jobs, and the budget", ("kind",)
+))
+WAIT_SECONDS = REGISTRY.register(Histogram(
+    "reid_admission_wait_seconds", "Time from submission to start by priority", SECONDS_BUCKETS, ("priority",)
+))
+REJECTED = REGISTRY.register(Counter(
+    "reid_admission_rejected_total", "Submissions turned away (429) by priority and reason", ("priority", "reason")
+))
+
+
+def default_memory_budget(fraction: float = 0.6) -> float:
+    """A share of physical memory in MB (4 GB if it cannot be read)"""
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") * fraction / 2**20
+    except (AttributeError, ValueError, OSError):
+        return 4096.0
+
+
+class AdmissionRejected(Exception):
+    """The node is saturated; the client should retry after retry_after seconds"""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(f"Server busy ({reason}), retry in {retry_after}s")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class JobCost:
+    """Estimated resources of one analysis"""
+
+    def __init__(self, memory_mb: float, work: float, frames: int = 0, parallel: int = 1):
+        """
+        Args:
+            memory_mb: Peak memory while it runs
+            work: Work units (sampled frames weighted by resolution)
+            frames: Frames it will sample
+            parallel: Worker processes it keeps busy at once (segments)
+        """
+        self.memory_mb = memory_mb
+        self.work = work
+        self.frames = frames
+        self.parallel = max(1, parallel)
+
+    def to_dict(self) -> Dict:
+        return {
+            "memory_mb": round(self.memory_mb, 1),
+            "work_units": round(self.work, 1),
+            "frames": self.frames,
+            "parallel": self.parallel
+        }
+
+
+def estimate_cost(
+    video_info: Optional[Dict],
+    file_size: int,
+    buffered_frames: int,
+    frame_interval: int = 30,
+    samples_per_second: Optional[float] = None,
+    search: str = "fixed",
+    segments: int = 0
+) -> JobCost:
+    """
+    Cost of analyzing one video, from its container metadata
+
+    A work unit is one sampled frame at 0 megapixels plus one per megapixel:
+    YOLO and OSNet cost about the same per frame at any resolution (fixed
+    input size), while decoding, colour conversion and cropping grow with
+    the pixel count. Memory is the frames the pipeline buffers between its
+    stages, at the video's resolution, on top of JOB_BASE_MB.
+
+    Args:
+        video_info: get_video_info() result (None if the container could not be read)
+        file_size: Bytes on disk, for containers without a frame count
+        buffered_frames: Frames one pipeline holds at most (its queue and batch sizes)
+        frame_interval, samples_per_second: Sampling of the analysis
+        search: "fixed" or "adaptive"
+        segments: Time segments analyzed in parallel (0 or 1: one pipeline)
+    """
+    width, height = (video_info["width"], video_info["height"]) if video_info else (0, 0)
+    if width <= 0 or height <= 0:
+        width, height = 1920, 1080
+    fps = video_info["fps"] if video_info and video_info["fps"] > 0 else FALLBACK_FPS
+    if video_info and video_info["total_frames"] > 0:
+        duration = video_info["total_frames"] / fps
+    else:
+        duration = file_size * 8 / FALLBACK_BITRATE
+
+    per_second = samples_per_second if samples_per_second else fps / max(frame_interval, 1)
+    frames = int(math.ceil(duration * min(per_second, fps)))
+    megapixels = width * height / 1e6
+    work = frames * (1.0 + megapixels)
+    if search == "adaptive":
+        work *= ADAPTIVE_WORK_FACTOR
+
+    parallel = segments if segments > 1 else 1
+    memory = parallel * (JOB_BASE_MB + buffered_frames * width * height * 3 / 2**20)
+    return JobCost(memory, work, frames, parallel)
+
+
+class _Ticket:
+    """A job waiting for, or holding, its share of the budget"""
+
+    def __init__(self, key: str, cost: JobCost, priority: str, pool: str, start: Callable[[], bool], sequence: int):
+        self.key = key
+        self.cost = cost
+        self.priority = priority
+        self.rank = PRIORITIES.index(priority)
+        self.pool = pool
+        self.start = start
+        self.sequence = sequence
+        self.submitted = time.monotonic()
+        self.started: Optional[float] = None
+
+
+class AdmissionController:
+    """
+    Memory budget, worker slots and priority queue for analysis jobs
+
+    A queued job starts once its estimated memory fits in what the running
+    jobs leave of the budget, and its pool (JobManager) has a free worker.
+    The queue is ordered by priority class, then submission. Jobs are not
+    overtaken on memory: when the first job that is short of memory has to
+    wait, everything behind it waits too, so large videos are not starved
+    by a stream of small ones. A job larger than the whole budget runs
+    alone.
+
+    A submission is rejected (AdmissionRejected, HTTP 429) when the queue is
+    full or its estimated wait exceeds max_wait_seconds. The wait is the
+    remaining work of the pool's running jobs plus the work queued ahead of
+    it (same or higher priority), spread over the pool's workers. Work is
+    converted to seconds with the average measured on finished jobs, so the
+    estimate follows the real speed of the node.
+    """
+
+    def __init__(self, memory_budget_mb: float, max_wait_seconds: float = 300, max_queued: int = 64):
+        """
+        Args:
+            memory_budget_mb: Estimated memory all running analyses may use together
+            max_wait_seconds: Longest estimated queue wait a submission is accepted with
+            max_queued: Jobs allowed to wait at once
+        """
+        self.memory_budget_mb = memory_budget_mb
+        self.max_wait_seconds = max_wait_seconds
+        self.max_queued = max_queued
+        self.seconds_per_unit = DEFAULT_SECONDS_PER_UNIT
+        self._pools: Dict[str, int] = {}
+        self._queue: List[_Ticket] = []
+        self._running: Dict[str, _Ticket] = {}
+        self._sequence = 0
+        self._lock = threading.Lock()
+        MEMORY_GAUGE.set(memory_budget_mb, kind="budget")
+
+    def register_pool(self, pool: str, workers: int):
+        """A JobManager that runs admitted jobs on `workers` threads"""
+        with self._lock:
+            self._pools[pool] = workers
+
+    def estimated_seconds(self, cost: JobCost) -> float:
+        return cost.work * self.seconds_per_unit / cost.parallel
+
+    def _estimated_wait(self, pool: str, rank: int, memory_mb: float = 0.0) -> float:
+        """
+        Queue wait of a new job of this pool, priority rank and memory (caller holds the lock)
+
+        The pool runs as many jobs at once as it has workers, or as fit in
+        the memory budget at their average size, whichever is fewer.
+        """
+        now = time.monotonic()
+        running = [ticket for ticket in self._running.values() if ticket.pool == pool]
+        ahead = [ticket for ticket in self._queue if ticket.pool == pool and ticket.rank <= rank]
+        reserved = sum(ticket.cost.memory_mb for ticket in self._running.values())
+        workers = self._pools.get(pool, 1)
+        if not ahead and len(running) < workers and (not self._running or reserved + memory_mb <= self.memory_budget_mb):
+            return 0.0
+
+        remaining = sum(max(self.estimated_seconds(ticket.cost) - (now - ticket.started), 0.0) for ticket in running)
+        queued = sum(self.estimated_seconds(ticket.cost) for ticket in ahead)
+        sizes = [ticket.cost.memory_mb for ticket in running + ahead] + ([memory_mb] if memory_mb else [])
+        fit = int(self.memory_budget_mb // (sum(sizes) / len(sizes))) if sizes and sum(sizes) > 0 else workers
+        return (remaining + queued) / max(min(workers, fit), 1)
+
+    def check(self, pool: str, priority: str):
+        """
+        Reject early, before an upload is read, if a job would be turned away anyway
+
+        Raises:
+            AdmissionRejected
+        """
+        with self._lock:
+            self._reject_if_saturated(pool, PRIORITIES.index(priority), priority)
+
+    def _reject_if_saturated(self, pool: str, rank: int, priority: str, memory_mb: float = 0.0):
+        if len(self._queue) >= self.max_queued:
+            # About one job's time before a place frees up
+            wait = self._estimated_wait(pool, len(PRIORITIES))
+            REJECTED.inc(priority=priority, reason="queue_full")
+            raise AdmissionRejected("queue full", self._retry_after(wait / max(len(self._queue), 1)))
+        wait = self._estimated_wait(pool, rank, memory_mb)
+        if wait > self.max_wait_seconds:
+            REJECTED.inc(priority=priority, reason="wait")
+            raise AdmissionRejected(f"estimated wait {wait:.0f}s", self._retry_after(wait - self.max_wait_seconds))
+
+    @staticmethod
+    def _retry_after(seconds: float) -> int:
+        return int(min(max(math.ceil(seconds), 1), 3600))
+
+    def submit(self, key: str, cost: JobCost, priority: str, pool: str, start: Callable[[], bool]) -> Dict:
+        """
+        Queue a job; start() is called (on some thread) once it is admitted
+
+        Args:
+            key: Job id
+            start: Hands the job to its pool; returns False if it was cancelled meanwhile
+        Returns:
+            estimate: Estimated wait and run time in seconds
+        Raises:
+            AdmissionRejected: Queue full or estimated wait over max_wait_seconds
+        """
+        if priority not in PRIORITIES:
+            raise ValueError(f"priority must be one of {PRIORITIES}")
+        with self._lock:
+            rank = PRIORITIES.index(priority)
+            self._reject_if_saturated(pool, rank, priority, cost.memory_mb)
+            wait = self._estimated_wait(pool, rank, cost.memory_mb)
+            self._sequence += 1
+            ticket = _Ticket(key, cost, priority, pool, start, self._sequence)
+            self._queue.append(ticket)
+            self._queue.sort(key=lambda queued: (queued.rank, queued.sequence))
+        self._admit()
+        return {"wait_seconds": round(wait, 1), "run_seconds": round(self.estimated_seconds(cost), 1)}
+
+    def remove(self, key: str):
+        """Drop a job cancelled while queued"""
+        with self._lock:
+            self._queue = [ticket for ticket in self._queue if ticket.key != key]
+        self._admit()
+
+    def release(self, key: str, seconds: Optional[float] = None):
+        """
+        A job finished and gives back its share
+
+        Args:
+            seconds: Its run time, to calibrate the work rate (None to skip,
+                e.g. for a gallery hit that decoded nothing)
+        """
+        with self._lock:
+            ticket = self._running.pop(key, None)
+            if ticket is not None and seconds is not None and ticket.cost.work > 0:
+                observed = seconds * ticket.cost.parallel / ticket.cost.work
+                self.seconds_per_unit += RATE_SMOOTHING * (observed - self.seconds_per_unit)
+        self._admit()
+
+    def _admit(self):
+        """Start every queued job that fits now"""
+        admitted = []
+        with self._lock:
+            reserved = sum(ticket.cost.memory_mb for ticket in self._running.values())
+            busy = {pool: 0 for pool in self._pools}
+            for ticket in self._running.values():
+                busy[ticket.pool] = busy.get(ticket.pool, 0) + 1
+            for ticket in list(self._queue):
+                if busy.get(ticket.pool, 0) >= self._pools.get(ticket.pool, 1):
+                    continue
+                if self._running and reserved + ticket.cost.memory_mb > self.memory_budget_mb:
+                    break
+                self._queue.remove(ticket)
+                ticket.started = time.monotonic()
+                self._running[ticket.key] = ticket
+                reserved += ticket.cost.memory_mb
+                busy[ticket.pool] = busy.get(ticket.pool, 0) + 1
+                admitted.append(ticket)
+            self._update_gauges(reserved)
+
+        for ticket in admitted:
+            WAIT_SECONDS.observe(ticket.started - ticket.submitted, priority=ticket.priority)
+            if not ticket.start():
+                self.release(ticket.key)
+
+    def _update_gauges(self, reserved: float):
+        for priority in PRIORITIES:
+            QUEUED_GAUGE.set(sum(ticket.priority == priority for ticket in self._queue), priority=priority)
+        MEMORY_GAUGE.set(round(reserved, 1), kind="reserved")
+
+    def stats(self) -> Dict:
+        with self._lock:
+            now = time.monotonic()
+            return {
+                "memory_budget_mb": round(self.memory_budget_mb, 1),
+                "memory_reserved_mb": round(sum(ticket.cost.memory_mb for ticket in self._running.values()), 1),
+                "running": len(self._running),
+                "queued": {priority: sum(ticket.priority == priority for ticket in self._queue) for priority in PRIORITIES},
+                "oldest_wait_seconds": round(max((now - ticket.submitted for ticket in self._queue), default=0.0), 1),
+                "estimated_wait_seconds": {
+                    pool: round(self._estimated_wait(pool, len(PRIORITIES)), 1) for pool in self._pools
+                },
+                "seconds_per_work_unit": round(self.seconds_per_unit, 4)
+            }
@@ -0,0 +1,757 @@
+"""
+Footage Archive
+Approximate nearest-neighbour search over the person crops of every analyzed
+video: an IVF-PQ index on the OSNet features, sharded by camera and day
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from datetime import time as day_start
+from typing import Callable, ContextManager, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from gallery import FEATURE_DIM, FEATURE_DTYPE
+from scoring import normalize_rows
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process locking, use one process
+    fcntl = None
+
+
+# Rows stored before the quantizer is trained; until then searches are exact
+TRAIN_SIZE = 20000
+# Retrained once the archive has grown this much since the last training:
+# lists learned on early footage fit people who show up later poorly
+RETRAIN_GROWTH = 4
+# Inverted lists (coarse k-means centroids), capped by the training rows
+MAX_LISTS = 1024
+# Product quantizer: subspaces per feature, 256 codewords each (one byte)
+PQ_SUBSPACES = 32
+PQ_CENTROIDS = 256
+KMEANS_ITERATIONS = 12
+
+# Per-row files of a shard: name -> (dtype, values per row). Appended only;
+# info.json holds the row count, so a partly written append is never read.
+ROW_FILES = {
+    "vectors.f16": (FEATURE_DTYPE, FEATURE_DIM),
+    "times.f64": (np.float64, 1),
+    "frames.i64": (np.int64, 1),
+    "bboxes.i32": (np.int32, 4),
+    "videos.i32": (np.int32, 1)
+}
+# Written for every row once the archive is trained
+CODE_FILES = {
+    "lists.i32": (np.int32, 1),
+    "codes.u8": (np.uint8, PQ_SUBSPACES)
+}
+
+SHARD_INFO = "info.json"
+ARCHIVE_INFO = "archive.json"
+QUANTIZER_FILE = "quantizer.npz"
+LOCK_FILE = "archive.lock"
+TRAIN_LOCK_FILE = "train.lock"
+
+# Rows scored per matrix product in exact search
+EXACT_CHUNK = 65536
+
+
+def camera_dirname(camera: str) -> str:
+    """Filesystem-safe shard directory for a camera name"""
+    return re.sub(r"[^A-Za-z0-9._-]", "_", camera) or "_"
+
+
+def nearest(vectors: np.ndarray, centroids: np.ndarray, spherical: bool = False, chunk: int = 8192) -> np.ndarray:
+    """Index of the closest centroid per row (largest inner product if spherical, else L2)"""
+    labels = np.empty(len(vectors), dtype=np.int64)
+    norms = None if spherical else (centroids ** 2).sum(axis=1)
+    for start in range(0, len(vectors), chunk):
+        products = vectors[start:start + chunk] @ centroids.T
+        if spherical:
+            labels[start:start + chunk] = products.argmax(axis=1)
+        else:
+            labels[start:start + chunk] = (norms - 2 * products).argmin(axis=1)
+    return labels
+
+
+def kmeans(vectors: np.ndarray, k: int, iterations: int = KMEANS_ITERATIONS, spherical: bool = False, seed: int = 0) -> np.ndarray:
+    """
+    Lloyd's k-means in numpy
+
+    Args:
+        vectors: (N, D) float32 training rows, N >= k
+        k: Number of centroids
+        spherical: Keep centroids unit-length and assign by inner product
+            (for L2-normalized features)
+    Returns:
+        centroids: (k, D) float32
+    """
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), k, replace=False)].astype(np.float32)
+    for _ in range(iterations):
+        labels = nearest(vectors, centroids, spherical)
+        order = np.argsort(labels, kind="stable")
+        counts = np.bincount(labels, minlength=k)
+        filled = np.flatnonzero(counts)
+        starts = np.concatenate([[0], np.cumsum(counts[filled])[:-1]])
+        centroids[filled] = np.add.reduceat(vectors[order], starts, axis=0) / counts[filled, None]
+        # Empty clusters restart from random rows
+        empty = np.flatnonzero(counts == 0)
+        if len(empty):
+            centroids[empty] = vectors[rng.choice(len(vectors), len(empty), replace=False)]
+        if spherical:
+            centroids = normalize_rows(centroids).astype(np.float32)
+    return centroids
+
+
+class IVFPQQuantizer:
+    """
+    Coarse lists plus a residual product quantizer, shared by every shard
+
+    A feature x in list c is stored as c's id and the PQ code of x - c.
+    For a unit query q, q·x = q·c + q·(x - c), and the second term is a sum
+    of per-subspace table lookups, so one (M x 256) table per query scores
+    every candidate in every list without decoding it.
+    """
+
+    def __init__(self, centroids: np.ndarray, codebooks: np.ndarray, version: int = 1):
+        """
+        Args:
+            centroids: (L, D) unit-length list centroids
+            codebooks: (M, 256, D / M) residual codewords per subspace
+            version: Training round; shards record the version their codes use
+        """
+        self.centroids = centroids.astype(np.float32)
+        self.codebooks = codebooks.astype(np.float32)
+        self.version = version
+
+    @property
+    def lists(self) -> int:
+        return len(self.centroids)
+
+    @property
+    def subspaces(self) -> int:
+        return len(self.codebooks)
+
+    @classmethod
+    def train(cls, vectors: np.ndarray, lists: int, subspaces: int = PQ_SUBSPACES, version: int = 1) -> "IVFPQQuantizer":
+        vectors = normalize_rows(np.asarray(vectors, dtype=np.float32)).astype(np.float32)
+        centroids = kmeans(vectors, lists, spherical=True)
+        residuals = vectors - centroids[nearest(vectors, centroids, spherical=True)]
+        width = vectors.shape[1] // subspaces
+        codebooks = np.stack([
+            kmeans(np.ascontiguousarray(residuals[:, m * width:(m + 1) * width]), PQ_CENTROIDS, seed=m)
+            for m in range(subspaces)
+        ])
+        return cls(centroids, codebooks, version)
+
+    def assign(self, vectors: np.ndarray) -> np.ndarray:
+        """List of each row"""
+        return nearest(np.asarray(vectors, dtype=np.float32), self.centroids, spherical=True).astype(np.int32)
+
+    def encode(self, vectors: np.ndarray, lists: np.ndarray) -> np.ndarray:
+        """PQ codes (N, M) of each row's residual to its list centroid"""
+        residuals = np.asarray(vectors, dtype=np.float32) - self.centroids[lists]
+        width = residuals.shape[1] // self.subspaces
+        codes = np.empty((len(residuals), self.subspaces), dtype=np.uint8)
+        for m in range(self.subspaces):
+            codes[:, m] = nearest(np.ascontiguousarray(residuals[:, m * width:(m + 1) * width]), self.codebooks[m])
+        return codes
+
+    def tables(self, queries: np.ndarray) -> np.ndarray:
+        """(K, M, 256) inner products of each query's subvectors with every codeword"""
+        width = queries.shape[1] // self.subspaces
+        return np.einsum("kmd,mcd->kmc", queries.reshape(len(queries), self.subspaces, width), self.codebooks)
+
+    def save(self, path: str):
+        tmp = f"{path}.tmp.npz"
+        np.savez(tmp, centroids=self.centroids, codebooks=self.codebooks, version=self.version)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> "IVFPQQuantizer":
+        data = np.load(path)
+        return cls(data["centroids"], data["codebooks"], int(data["version"]))
+
+
+class ArchiveShard:
+    """
+    Detections of one camera on one day
+
+    Rows live in append-only files (ROW_FILES, CODE_FILES) that are memory
+    mapped for search. The rows of each inverted list are found through one
+    argsort of the list ids, rebuilt whenever the shard has grown.
+    info["encoded"] is the quantizer version of the codes (0: none yet); a
+    shard whose codes are from another version is searched exactly.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.info: Dict = {}
+        self.count = 0
+        self.rows: Dict[str, np.ndarray] = {}
+        self.order = None
+        self.offsets = None
+        self._version = None
+        self._lock = threading.Lock()
+
+    @property
+    def camera(self) -> str:
+        return self.info.get("camera", "")
+
+    @property
+    def day(self) -> str:
+        return self.info.get("day", "")
+
+    def encoded_with(self, quantizer: Optional[IVFPQQuantizer]) -> bool:
+        return quantizer is not None and self.info.get("encoded") == quantizer.version
+
+    def read_info(self) -> Dict:
+        path = os.path.join(self.path, SHARD_INFO)
+        if not os.path.exists(path):
+            return {"count": 0, "videos": [], "encoded": 0}
+        with open(path) as f:
+            return json.load(f)
+
+    def write_info(self, info: Dict):
+        path = os.path.join(self.path, SHARD_INFO)
+        with open(f"{path}.tmp", "w") as f:
+            json.dump(info, f)
+        os.replace(f"{path}.tmp", path)
+
+    def refresh(self, quantizer: Optional[IVFPQQuantizer]):
+        """Re-map the row files if the shard grew or the archive was trained since the last look"""
+        path = os.path.join(self.path, SHARD_INFO)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return
+        version = (stat.st_mtime_ns, stat.st_size, id(quantizer))
+        with self._lock:
+            if version == self._version:
+                return
+            info = self.read_info()
+            count = info["count"]
+            files = dict(ROW_FILES, **CODE_FILES) if info.get("encoded") else ROW_FILES
+            rows = {}
+            for name, (dtype, width) in files.items():
+                shape = (count, width) if width > 1 else (count,)
+                if count:
+                    rows[name] = np.memmap(os.path.join(self.path, name), dtype=dtype, mode="r", shape=shape)
+                else:
+                    rows[name] = np.empty(shape, dtype=dtype)
+
+            order, offsets = None, None
+            if quantizer is not None and info.get("encoded") == quantizer.version:
+                lists = np.asarray(rows["lists.i32"])
+                order = np.argsort(lists, kind="stable")
+                offsets = np.searchsorted(lists[order], np.arange(quantizer.lists + 1))
+
+            self.info, self.count, self.rows = info, count, rows
+            self.order, self.offsets = order, offsets
+            self._version = version
+
+    def append(self, columns: Dict[str, np.ndarray], video: Dict, quantizer: Optional[IVFPQQuantizer]):
+        """
+        Add rows (caller holds the archive lock)
+
+        Args:
+            columns: Arrays for every ROW_FILES name (and CODE_FILES once trained)
+            video: Video record; the rows' "videos.i32" index into info["videos"]
+        """
+        os.makedirs(self.path, exist_ok=True)
+        info = self.read_info()
+        count = info["count"]
+        # A shard waiting to be (re-)encoded takes raw rows; encode() codes them all
+        encoded = quantizer is not None and (count == 0 or info.get("encoded") == quantizer.version)
+        files = dict(ROW_FILES, **CODE_FILES) if encoded else ROW_FILES
+        for name, (dtype, width) in files.items():
+            row_bytes = np.dtype(dtype).itemsize * width
+            with open(os.path.join(self.path, name), "ab") as f:
+                # Drop the tail of an append that died before updating info.json
+                f.truncate(count * row_bytes)
+                f.write(np.ascontiguousarray(columns[name], dtype=dtype).tobytes())
+
+        info["count"] = count + len(columns["vectors.f16"])
+        info["encoded"] = quantizer.version if encoded else 0
+        info["videos"].append(video)
+        info.update(camera=video["camera"], day=columns["day"])
+        self.write_info(info)
+
+    def encode(self, quantizer: IVFPQQuantizer, locked: Callable[[], ContextManager], chunk: int = 65536):
+        """
+        Rewrite list ids and PQ codes of every row
+
+        The rows stored so far are encoded into new files without the
+        archive lock; under it (locked()), rows appended meanwhile are
+        encoded too and the new files replace the old ones. Searches that
+        mapped the previous codes keep reading them until they refresh.
+        """
+        info = self.read_info()
+        if info["count"] == 0 or info.get("encoded") == quantizer.version:
+            return
+        lists_path, codes_path = os.path.join(self.path, "lists.i32"), os.path.join(self.path, "codes.u8")
+        with open(f"{lists_path}.tmp", "wb") as lists_file, open(f"{codes_path}.tmp", "wb") as codes_file:
+            done = self._encode_rows(quantizer, 0, info["count"], lists_file, codes_file, chunk)
+            with locked():
+                info = self.read_info()
+                if info.get("encoded") == quantizer.version:
+                    # Encoded by an add meanwhile (another process's maintenance)
+                    os.remove(f"{lists_path}.tmp")
+                    os.remove(f"{codes_path}.tmp")
+                    return
+                self._encode_rows(quantizer, done, info["count"], lists_file, codes_file, chunk)
+                lists_file.close()
+                codes_file.close()
+                os.replace(f"{lists_path}.tmp", lists_path)
+                os.replace(f"{codes_path}.tmp", codes_path)
+                info["encoded"] = quantizer.version
+                self.write_info(info)
+
+    def _encode_rows(self, quantizer: IVFPQQuantizer, start: int, end: int, lists_file, codes_file, chunk: int) -> int:
+        """Append the codes of rows [start, end) to open files; returns end"""
+        if end > start:
+            vectors = np.memmap(os.path.join(self.path, "vectors.f16"), dtype=FEATURE_DTYPE, mode="r", shape=(end, FEATURE_DIM))
+            for first in range(start, end, chunk):
+                block = np.asarray(vectors[first:min(first + chunk, end)], dtype=np.float32)
+                lists = quantizer.assign(block)
+                lists_file.write(lists.tobytes())
+                codes_file.write(quantizer.encode(block, lists).tobytes())
+        return end
+
+    def list_rows(self, lists: np.ndarray) -> np.ndarray:
+        """Row indices in the given inverted lists"""
+        parts = [self.order[self.offsets[l]:self.offsets[l + 1]] for l in lists]
+        return np.concatenate(parts) if parts else np.empty(0, dtype=np.int64)
+
+    def exact_scores(self, queries: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Best cosine similarity over the queries, for all rows or the given ones"""
+        vectors = self.rows["vectors.f16"]
+        if rows is not None:
+            return (np.asarray(vectors[rows], dtype=np.float32) @ queries.T).max(axis=1)
+        scores = np.empty(self.count, dtype=np.float32)
+        for start in range(0, self.count, EXACT_CHUNK):
+            block = np.asarray(vectors[start:start + EXACT_CHUNK], dtype=np.float32)
+            scores[start:start + EXACT_CHUNK] = (block @ queries.T).max(axis=1)
+        return scores
+
+
+class FootageArchive:
+    """
+    Cross-video person search over every indexed video
+
+    Layout: <root>/<model>/<camera>/<YYYY-MM-DD>/{row files, info.json}, plus
+    archive.json (videos already added) and quantizer.npz at <root>/<model>.
+    <model> is a hash of the model tag, so features of other weights are
+    never mixed in.
+
+    Searches are exact until TRAIN_SIZE rows are stored. Once an add
+    passes that, maintain() trains the IVF-PQ quantizer on the rows so far
+    and encodes every shard; it is retrained whenever the archive has grown
+    RETRAIN_GROWTH times since (re-encoding is linear in the rows, so the
+    total cost stays proportional to the archive size). A search probes the
+    nprobe lists closest to the query, scores their rows from the 32-byte
+    codes, and re-scores the best rerank candidates with the stored float16
+    features. Shards not encoded with the current quantizer are searched
+    exactly.
+
+    Rows are appended by any process that analyzes a video (worker processes
+    included); writes are serialized with a file lock, and readers pick up
+    new rows on their next search. add() only appends: training and
+    re-encoding run on a background thread (one process at a time), and
+    hold the lock only to swap in each shard's new codes.
+    """
+
+    def __init__(self, root: str = "archive", model_tag: str = "", train_size: int = TRAIN_SIZE, max_lists: int = MAX_LISTS):
+        """
+        Args:
+            root: Directory holding the archive
+            model_tag: Identifies the embedding model (one archive per model)
+            train_size: Rows stored before the quantizer is trained
+            max_lists: Upper bound on the number of inverted lists
+        """
+        self.model_tag = model_tag
+        self.root = os.path.join(root, hashlib.sha1(model_tag.encode()).hexdigest()[:12])
+        self.train_size = train_size
+        self.max_lists = max_lists
+        os.makedirs(self.root, exist_ok=True)
+
+        self._shards: Dict[str, ArchiveShard] = {}
+        self._quantizer: Optional[IVFPQQuantizer] = None
+        self._quantizer_mtime = None
+        self._lock = threading.Lock()
+        self._maintenance: Optional[threading.Thread] = None
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        """Exclusive write access across threads and processes"""
+        with self._lock:
+            with open(os.path.join(self.root, LOCK_FILE), "a") as lock_file:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read_registry(self) -> Dict:
+        path = os.path.join(self.root, ARCHIVE_INFO)
+        if not os.path.exists(path):
+            return {"model_tag": self.model_tag, "rows": 0, "videos": {}}
+        with open(path) as f:
+            return json.load(f)
+
+    def _write_registry(self, registry: Dict):
+        path = os.path.join(self.root, ARCHIVE_INFO)
+        with open(f"{path}.tmp", "w") as f:
+            json.dump(registry, f)
+        os.replace(f"{path}.tmp", path)
+
+    def quantizer(self) -> Optional[IVFPQQuantizer]:
+        """The trained quantizer (reloaded if another process trained it), or None"""
+        path = os.path.join(self.root, QUANTIZER_FILE)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+        if mtime != self._quantizer_mtime:
+            self._quantizer = IVFPQQuantizer.load(path)
+            self._quantizer_mtime = mtime
+        return self._quantizer
+
+    def shard(self, camera: str, day: str) -> ArchiveShard:
+        path = os.path.join(self.root, camera_dirname(camera), day)
+        if path not in self._shards:
+            self._shards[path] = ArchiveShard(path)
+        return self._shards[path]
+
+    def shards(
+        self,
+        cameras: Optional[Sequence[str]] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None
+    ) -> List[ArchiveShard]:
+        """Shards of the given cameras whose day overlaps [since, until]"""
+        wanted = {camera_dirname(camera) for camera in cameras} if cameras else None
+        first = since.date().isoformat() if since else ""
+        last = until.date().isoformat() if until else "9999"
+        selected = []
+        for camera in sorted(os.listdir(self.root)):
+            camera_path = os.path.join(self.root, camera)
+            if not os.path.isdir(camera_path) or (wanted is not None and camera not in wanted):
+                continue
+            for day in sorted(os.listdir(camera_path)):
+                if first <= day <= last and os.path.exists(os.path.join(camera_path, day, SHARD_INFO)):
+                    selected.append(self.shard(camera, day))
+        return selected
+
+    def contains(self, video_hash: str) -> bool:
+        return video_hash in self._read_registry()["videos"]
+
+    def add(
+        self,
+        features: np.ndarray,
+        frame_nums: np.ndarray,
+        bboxes: np.ndarray,
+        video_hash: str,
+        camera: str,
+        recorded_at: datetime,
+        fps: float,
+        name: str = ""
+    ) -> int:
+        """
+        Add one video's detections (a video already in the archive is skipped)
+
+        Args:
+            features: (N, 512) L2-normalized features, e.g. a GalleryEntry's
+            frame_nums, bboxes: Frame number and box of each row
+            video_hash: Content hash of the video
+            camera: Camera name (shard)
+            recorded_at: Wall-clock time of frame 0
+            fps: Video frame rate
+            name: Video file name, returned with search results
+        Returns:
+            rows: Number of rows added
+        """
+        frame_nums = np.asarray(frame_nums, dtype=np.int64)
+        times = recorded_at.timestamp() + frame_nums / fps
+        # Rows are filed under the day they were recorded (a video may cross midnight)
+        midnight = datetime.combine(recorded_at.date(), day_start()).timestamp()
+        day_offsets = np.floor((times - midnight) / 86400).astype(np.int64)
+
+        with self._locked():
+            registry = self._read_registry()
+            if video_hash in registry["videos"]:
+                return 0
+            quantizer = self.quantizer()
+
+            days = []
+            for offset in np.unique(day_offsets):
+                rows = np.flatnonzero(day_offsets == offset)
+                day = (recorded_at.date() + timedelta(days=int(offset))).isoformat()
+                shard = self.shard(camera, day)
+                video = {
+                    "video_hash": video_hash,
+                    "name": name,
+                    "camera": camera,
+                    "recorded_at": recorded_at.isoformat(),
+                    "fps": float(fps)
+                }
+                vectors = normalize_rows(np.asarray(features[rows], dtype=np.float32))
+                columns = {
+                    "day": day,
+                    "vectors.f16": vectors,
+                    "times.f64": times[rows],
+                    "frames.i64": frame_nums[rows],
+                    "bboxes.i32": np.asarray(bboxes, dtype=np.int32)[rows].reshape(-1, 4),
+                    "videos.i32": np.full(len(rows), len(shard.read_info()["videos"]), dtype=np.int32)
+                }
+                if quantizer is not None:
+                    columns["lists.i32"] = quantizer.assign(vectors)
+                    columns["codes.u8"] = quantizer.encode(vectors, columns["lists.i32"])
+                shard.append(columns, video, quantizer)
+                days.append(day)
+
+            registry["videos"][video_hash] = {"camera": camera, "days": days, "rows": len(frame_nums), "name": name}
+            registry["rows"] += len(frame_nums)
+            self._write_registry(registry)
+            stale = quantizer is not None and any(
+                self.shard(camera, day).read_info().get("encoded") != quantizer.version for day in days
+            )
+
+        if self._training_due(registry, quantizer) or stale:
+            self.maintain_in_background()
+        return len(frame_nums)
+
+    def _training_due(self, registry: Dict, quantizer: Optional[IVFPQQuantizer]) -> bool:
+        if quantizer is None:
+            return registry["rows"] >= self.train_size
+        return registry["rows"] >= RETRAIN_GROWTH * registry.get("trained_rows", 0)
+
+    def maintain_in_background(self):
+        """Run maintain() on a daemon thread, unless one is already running"""
+        with self._lock:
+            if self._maintenance is not None and self._maintenance.is_alive():
+                return
+            self._maintenance = threading.Thread(target=self.maintain, name="archive-maintenance", daemon=True)
+            self._maintenance.start()
+
+    def wait(self, timeout: Optional[float] = None):
+        """Block until background maintenance (if any) has finished"""
+        thread = self._maintenance
+        if thread is not None:
+            thread.join(timeout)
+
+    def maintain(self) -> bool:
+        """
+        Train the quantizer if it is due, and encode every shard whose codes are stale
+
+        Runs in one process at a time (others return at once). Adds and
+        searches go on meanwhile: the lock is only taken to save the
+        quantizer and to swap in each shard's codes.
+
+        Returns:
+            False if another process was already maintaining the archive
+        """
+        with open(os.path.join(self.root, TRAIN_LOCK_FILE), "a") as lock_file:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    return False
+            try:
+                start = time.perf_counter()
+                registry = self._read_registry()
+                quantizer = self.quantizer()
+                if self._training_due(registry, quantizer):
+                    quantizer = self._train(registry.get("version", 0) + 1)
+                if quantizer is None:
+                    return True
+                stale = [shard for shard in self.shards() if shard.read_info().get("encoded") != quantizer.version]
+                for shard in stale:
+                    shard.encode(quantizer, self._locked)
+                if stale:
+                    print(f"✅ Archive index up to date in {time.perf_counter() - start:.1f}s ({len(stale)} shards encoded)")
+                return True
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _train(self, version: int, max_rows: int = 64 * MAX_LISTS) -> IVFPQQuantizer:
+        """
+        Train a quantizer on a sample of the stored rows and save it
+
+        Until a shard is re-encoded with it, searches score that shard exactly.
+        """
+        shards = self.shards()
+        counts = [shard.read_info()["count"] for shard in shards]
+        total = sum(counts)
+        rng = np.random.default_rng(0)
+        sample = []
+        for shard, count in zip(shards, counts):
+            if count == 0:
+                continue
+            vectors = np.memmap(os.path.join(shard.path, "vectors.f16"), dtype=FEATURE_DTYPE, mode="r", shape=(count, FEATURE_DIM))
+            take = max(1, round(count * min(1.0, max_rows / total)))
+            rows = np.sort(rng.choice(count, take, replace=False))
+            sample.append(np.asarray(vectors[rows], dtype=np.float32))
+        sample = np.concatenate(sample)
+
+        lists = int(min(self.max_lists, max(16, len(sample) // 39)))
+        print(f"🧭 Training archive index: {lists} lists, {PQ_SUBSPACES}x{PQ_CENTROIDS} PQ on {len(sample)} rows...")
+        quantizer = IVFPQQuantizer.train(sample, lists, version=version)
+        with self._locked():
+            quantizer.save(os.path.join(self.root, QUANTIZER_FILE))
+            registry = self._read_registry()
+            registry.update(version=quantizer.version, trained_rows=total)
+            self._write_registry(registry)
+        return quantizer
+
+    def search(
+        self,
+        queries: np.ndarray,
+        top_k: int = 20,
+        nprobe: int = 16,
+        rerank: int = 200,
+        exact: bool = False,
+        cameras: Optional[Sequence[str]] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        min_similarity: Optional[float] = None
+    ) -> Dict:
+        """
+        Most similar stored detections to one person
+
+        Args:
+            queries: (K, 512) reference features of the person; a row's
+                score is its best similarity to any of them
+            top_k: Results to return
+            nprobe: Inverted lists probed per query (higher: better recall, slower)
+            rerank: Candidates re-scored with the stored features (0: PQ scores only)
+            exact: Score every row of the selected shards (ground truth, slow)
+            cameras: Only these cameras
+            since, until: Only detections recorded in this interval
+            min_similarity: Drop results scoring below this
+        Returns:
+            results: {"results": [...], "search": counts and timing}
+        """
+        start = time.perf_counter()
+        queries = normalize_rows(np.atleast_2d(np.asarray(queries, dtype=np.float32))).astype(np.float32)
+        quantizer = self.quantizer()
+        mode = "exact" if exact or quantizer is None else "ivfpq"
+        shards = self.shards(cameras, since, until)
+        for shard in shards:
+            shard.refresh(quantizer)
+
+        if mode == "ivfpq":
+            nprobe = max(1, min(nprobe, quantizer.lists))
+            coarse = queries @ quantizer.centroids.T
+            probes = np.argpartition(-coarse, nprobe - 1, axis=1)[:, :nprobe]
+            tables = quantizer.tables(queries)
+            subspaces = np.arange(quantizer.subspaces)
+        keep = max(top_k, rerank if mode == "ivfpq" else 0)
+        low = since.timestamp() if since else -np.inf
+        high = until.timestamp() if until else np.inf
+
+        candidates: List[Tuple[ArchiveShard, np.ndarray, np.ndarray]] = []
+        rows_total, scanned = 0, 0
+        for shard in shards:
+            rows_total += shard.count
+            if shard.count == 0:
+                continue
+            if mode == "exact" or not shard.encoded_with(quantizer):
+                rows = np.arange(shard.count)
+                scores = shard.exact_scores(queries)
+            else:
+                lists, codes = shard.rows["lists.i32"], shard.rows["codes.u8"]
+                parts_rows, parts_scores = [], []
+                for k in range(len(queries)):
+                    rows_k = shard.list_rows(probes[k])
+                    if len(rows_k) == 0:
+                        continue
+                    parts_rows.append(rows_k)
+                    parts_scores.append(coarse[k, lists[rows_k]] + tables[k][subspaces, codes[rows_k]].sum(axis=1))
+                if not parts_rows:
+                    continue
+                rows, scores = np.concatenate(parts_rows), np.concatenate(parts_scores)
+                if len(queries) > 1:
+                    # Best query per row
+                    order = np.argsort(-scores, kind="stable")
+                    rows, first = np.unique(rows[order], return_index=True)
+                    scores = scores[order][first]
+            scanned += len(rows)
+
+            times = shard.rows["times.f64"][rows]
+            in_range = (times >= low) & (times <= high)
+            rows, scores = rows[in_range], scores[in_range]
+            if len(rows) > keep:
+                best = np.argpartition(-scores, keep - 1)[:keep]
+                rows, scores = rows[best], scores[best]
+            candidates.append((shard, rows, scores.astype(np.float32)))
+
+        # Global best `keep` over all shards
+        flat = [(shard, int(row), float(score)) for shard, rows, scores in candidates for row, score in zip(rows, scores)]
+        flat.sort(key=lambda item: -item[2])
+        flat = flat[:keep]
+
+        reranked = 0
+        if mode == "ivfpq" and rerank > 0 and flat:
+            by_shard: Dict[int, List[int]] = {}
+            for i, (shard, row, _) in enumerate(flat):
+                by_shard.setdefault(id(shard), []).append(i)
+            for indices in by_shard.values():
+                shard = flat[indices[0]][0]
+                rows = np.array([flat[i][1] for i in indices])
+                exact_scores = shard.exact_scores(queries, rows)
+                for i, score in zip(indices, exact_scores):
+                    flat[i] = (shard, flat[i][1], float(score))
+            reranked = len(flat)
+            flat.sort(key=lambda item: -item[2])
+
+        results = []
+        for shard, row, score in flat[:top_k]:
+            if min_similarity is not None and score < min_similarity:
+                break
+            video = shard.info["videos"][int(shard.rows["videos.i32"][row])]
+            frame_num = int(shard.rows["frames.i64"][row])
+            results.append({
+                "similarity": round(score, 4),
+                "camera": video["camera"],
+                "recorded_at": datetime.fromtimestamp(float(shard.rows["times.f64"][row])).isoformat(timespec="milliseconds"),
+                "video_hash": video["video_hash"],
+                "video_name": video["name"],
+                "frame_number": frame_num,
+                "timestamp_seconds": round(frame_num / video["fps"], 3),
+                "bbox": [int(x) for x in shard.rows["bboxes.i32"][row]]
+            })
+
+        search = {
+            "mode": mode,
+            "shards": len(shards),
+            "rows": rows_total,
+            "candidates": scanned,
+            "reranked": reranked,
+            "seconds": round(time.perf_counter() - start, 4)
+        }
+        if mode == "ivfpq":
+            search.update(nprobe=nprobe, lists=quantizer.lists)
+        return {"results": results, "search": search}
+
+    def stats(self) -> Dict:
+        registry = self._read_registry()
+        quantizer = self.quantizer()
+        return {
+            "videos": len(registry["videos"]),
+            "rows": registry["rows"],
+            "shards": len(self.shards()),
+            "trained": quantizer is not None,
+            "lists": quantizer.lists if quantizer is not None else 0
+        }
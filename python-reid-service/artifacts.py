@@ -0,0 +1,133 @@
+"""
+Artifact Store
+Content-addressed JPEG thumbnails of match crops, so results carry short
+references instead of inline base64 images
+"""
+
+import hashlib
+import os
+import re
+import tempfile
+import time
+from io import BytesIO
+from typing import Dict, Optional, Tuple
+
+from PIL import Image
+
+
+ARTIFACT_ID = re.compile(r"^[0-9a-f]{64}$")
+
+
+class ArtifactStore:
+    """
+    Thumbnails keyed by the SHA-256 of their JPEG bytes
+
+    The same crop encoded with the same settings always gets the same id, so
+    repeat analyses of a video write nothing new, and a stored file never
+    changes (clients can cache it forever). A file's mtime is the last time
+    a result referenced it or it was served (touch()); purge() deletes the
+    ones unused for too long, so purging breaks old stored references.
+
+    Layout: <root>/<id[:2]>/<id>.jpg
+    """
+
+    def __init__(self, root: str, max_size: Tuple[int, int] = (128, 256), quality: int = 80):
+        """
+        Args:
+            root: Directory holding the thumbnails (created if missing)
+            max_size: (width, height) bounding box; larger crops are downscaled
+                keeping their aspect ratio, smaller ones are stored as they are
+            quality: JPEG quality (1-95)
+        """
+        if not 1 <= quality <= 95:
+            raise ValueError("quality must be between 1 and 95")
+
+        self.root = root
+        self.max_size = tuple(max_size)
+        self.quality = quality
+        os.makedirs(root, exist_ok=True)
+
+    def encode(self, img: Image.Image) -> Tuple[bytes, Tuple[int, int]]:
+        """Downscaled JPEG bytes of one crop and the thumbnail's (width, height)"""
+        thumbnail = img.convert("RGB")
+        thumbnail.thumbnail(self.max_size, Image.BILINEAR)
+        buffered = BytesIO()
+        thumbnail.save(buffered, format="JPEG", quality=self.quality, optimize=True)
+        return buffered.getvalue(), thumbnail.size
+
+    def path(self, artifact_id: str) -> Optional[str]:
+        """File of a stored thumbnail, None for malformed ids or unknown thumbnails"""
+        if not ARTIFACT_ID.match(artifact_id):
+            return None
+        path = os.path.join(self.root, artifact_id[:2], f"{artifact_id}.jpg")
+        return path if os.path.exists(path) else None
+
+    def touch(self, path: str):
+        """Mark a stored thumbnail as used now (it was served)"""
+        try:
+            os.utime(path)
+        except OSError:
+            # Purged meanwhile; the caller already has the file open
+            pass
+
+    def put(self, img: Image.Image) -> Dict:
+        """
+        Store one crop's thumbnail (no-op if already stored)
+
+        Returns:
+            ref: {"id", "url", "width", "height", "bytes"}; url is relative to the service
+        """
+        data, (width, height) = self.encode(img)
+        artifact_id = hashlib.sha256(data).hexdigest()
+
+        directory = os.path.join(self.root, artifact_id[:2])
+        path = os.path.join(directory, f"{artifact_id}.jpg")
+        try:
+            # Referenced again: restarts its retention period
+            os.utime(path)
+        except FileNotFoundError:
+            os.makedirs(directory, exist_ok=True)
+            # Write-then-rename: concurrent writers of the same id never expose a partial file
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+
+        return {
+            "id": artifact_id,
+            "url": f"/artifacts/{artifact_id}.jpg",
+            "width": width,
+            "height": height,
+            "bytes": len(data)
+        }
+
+    def purge(self, max_age_seconds: float) -> Dict:
+        """
+        Delete thumbnails no result has referenced for max_age_seconds
+
+        Also removes temp files left by interrupted writes.
+
+        Returns:
+            {"removed": files deleted, "bytes": bytes freed}
+        """
+        cutoff = time.time() - max_age_seconds
+        removed, freed = 0, 0
+        for directory in os.scandir(self.root):
+            if not directory.is_dir():
+                continue
+            for entry in os.scandir(directory.path):
+                try:
+                    stat = entry.stat()
+                    if stat.st_mtime < cutoff:
+                        os.remove(entry.path)
+                        removed += 1
+                        freed += stat.st_size
+                except FileNotFoundError:
+                    # Purged concurrently (another worker's /cleanup)
+                    pass
+        return {"removed": removed, "bytes": freed}
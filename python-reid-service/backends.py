@@ -0,0 +1,286 @@
+"""
+Inference Backends
+Runs OSNet and YOLOv8 as eager PyTorch, TorchScript or ONNX Runtime graphs,
+selected by the "runtime" section of models/config.json
+"""
+
+import json
+import os
+from typing import Dict, List, Optional
+
+import cv2
+import numpy as np
+import torch
+
+from embedding import BatchEmbedder, NORMALIZE_MEAN, NORMALIZE_STD, resize_crop
+
+
+BACKENDS = ("eager", "torchscript", "onnx")
+
+# Used for any key missing from config.json
+DEFAULT_RUNTIME = {
+    "osnet_backend": "eager",
+    "yolo_backend": "eager",
+    # Static int8 quantization of OSNet (onnx backend only)
+    "quantize": False,
+    # Intra-op threads for torch / ONNX Runtime (0 = library default)
+    "num_threads": 0,
+    # Compare exported OSNet against eager at startup
+    "check_parity": True,
+    # Max cosine distance between exported and eager features
+    "parity_tolerance": 0.01
+}
+
+OSNET_WEIGHTS = "osnet_ibn_x1_0.pth"
+YOLO_WEIGHTS = "yolov8n.pt"
+
+
+def load_runtime_config(model_dir: str) -> Dict:
+    """Read the "runtime" section of <model_dir>/config.json, filled in with defaults"""
+    runtime = dict(DEFAULT_RUNTIME)
+    path = os.path.join(model_dir, "config.json")
+    if os.path.exists(path):
+        with open(path) as f:
+            runtime.update(json.load(f).get("runtime", {}))
+
+    for key in ("osnet_backend", "yolo_backend"):
+        if runtime[key] not in BACKENDS:
+            raise ValueError(f"runtime.{key} must be one of {BACKENDS}")
+    if runtime["quantize"] and runtime["osnet_backend"] != "onnx":
+        raise ValueError("runtime.quantize requires osnet_backend 'onnx'")
+    return runtime
+
+
+def configure_threads(num_threads: int):
+    """Pin torch's intra-op thread pool (ONNX Runtime sessions get it per session)"""
+    if num_threads > 0:
+        torch.set_num_threads(num_threads)
+
+
+def osnet_filename(backend: str, quantize: bool = False) -> str:
+    """OSNet model file for a backend"""
+    if backend == "torchscript":
+        return "osnet_ibn_x1_0.torchscript.pt"
+    if backend == "onnx":
+        return "osnet_ibn_x1_0.int8.onnx" if quantize else "osnet_ibn_x1_0.onnx"
+    return OSNET_WEIGHTS
+
+
+def yolo_filename(backend: str) -> str:
+    """YOLOv8 model file for a backend (ultralytics export naming)"""
+    if backend == "torchscript":
+        return "yolov8n.torchscript"
+    if backend == "onnx":
+        return "yolov8n.onnx"
+    return YOLO_WEIGHTS
+
+
+def build_eager_osnet(model_dir: str, device: torch.device) -> torch.nn.Module:
+    """OSNet-IBN from the .pth weights, in eval mode"""
+    # Imported on first use: torchreid alone takes seconds to import
+    import torchreid
+
+    model = torchreid.models.build_model(
+        name='osnet_ibn_x1_0',
+        num_classes=751,
+        loss='softmax',
+        pretrained=False  # We'll load our weights
+    )
+    state_dict = torch.load(os.path.join(model_dir, OSNET_WEIGHTS), map_location=device)
+    model.load_state_dict(state_dict)
+    model = model.to(device)
+    model.eval()
+    return model
+
+
+class OnnxEmbeddingModel:
+    """
+    ONNX Runtime OSNet session with the call interface BatchEmbedder expects
+
+    Takes a (N, 3, 256, 128) float tensor, returns (N, 512) features as a tensor.
+    """
+
+    def __init__(self, path: str, num_threads: int = 0):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads > 0:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def eval(self):
+        return self
+
+    def __call__(self, batch: torch.Tensor) -> torch.Tensor:
+        features = self.session.run(None, {self.input_name: batch.cpu().numpy()})[0]
+        return torch.from_numpy(features)
+
+
+def _require(path: str) -> str:
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"{path} not found; run `python export_models.py` first")
+    return path
+
+
+def load_osnet(model_dir: str, device: torch.device, runtime: Dict):
+    """OSNet for the configured backend"""
+    backend = runtime["osnet_backend"]
+    if backend == "eager":
+        return build_eager_osnet(model_dir, device)
+
+    path = _require(os.path.join(model_dir, osnet_filename(backend, runtime["quantize"])))
+    if backend == "torchscript":
+        model = torch.jit.load(path, map_location=device)
+        model.eval()
+        return model
+    return OnnxEmbeddingModel(path, runtime["num_threads"])
+
+
+def load_yolo(model_dir: str, runtime: Dict):
+    """YOLOv8 for the configured backend (ultralytics runs all three formats)"""
+    from ultralytics import YOLO
+
+    path = os.path.join(model_dir, yolo_filename(runtime["yolo_backend"]))
+    if runtime["yolo_backend"] == "eager":
+        return YOLO(path)
+    return YOLO(_require(path), task="detect")
+
+
+def synthetic_crops(count: int, seed: int = 0) -> List[np.ndarray]:
+    """Smooth random RGB crops of person-like sizes (parity checks, fallback calibration)"""
+    rng = np.random.default_rng(seed)
+    crops = []
+    for _ in range(count):
+        height, width = int(rng.integers(64, 400)), int(rng.integers(32, 200))
+        noise = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+        # Smooth, image-like content rather than pure noise
+        crops.append(cv2.GaussianBlur(noise, (0, 0), 3))
+    return crops
+
+
+def _calibration_batches(crops: List[np.ndarray], batch_size: int = 8) -> List[Dict[str, np.ndarray]]:
+    """OSNet inputs for ONNX Runtime calibration, preprocessed like BatchEmbedder"""
+    mean = np.array(NORMALIZE_MEAN, dtype=np.float32).reshape(1, 3, 1, 1)
+    std = np.array(NORMALIZE_STD, dtype=np.float32).reshape(1, 3, 1, 1)
+    batches = []
+    for start in range(0, len(crops), batch_size):
+        resized = np.stack([
+            resize_crop(crop)
+            for crop in crops[start:start + batch_size]
+        ])
+        batch = resized.transpose(0, 3, 1, 2).astype(np.float32) / 255.0
+        batches.append({"images": (batch - mean) / std})
+    return batches
+
+
+def export_osnet(
+    model_dir: str,
+    backend: str,
+    quantize: bool = False,
+    calibration_crops: Optional[List[np.ndarray]] = None
+) -> str:
+    """
+    Export the eager OSNet weights for a backend
+
+    Args:
+        model_dir: Directory with osnet_ibn_x1_0.pth, also receives the export
+        backend: "torchscript" or "onnx"
+        quantize: Write the static int8 ONNX model (needs the fp32 one first)
+        calibration_crops: RGB person crops for int8 activation ranges
+            (synthetic crops if None; real footage gives better accuracy)
+    Returns:
+        path: Written model file
+    """
+    model = build_eager_osnet(model_dir, torch.device("cpu"))
+    example = torch.randn(1, 3, 256, 128)
+
+    if backend == "torchscript":
+        path = os.path.join(model_dir, osnet_filename(backend))
+        with torch.no_grad():
+            # Frozen: weights become constants and batch norms fold into convolutions
+            traced = torch.jit.freeze(torch.jit.trace(model, example))
+        traced.save(path)
+        return path
+
+    if backend != "onnx":
+        raise ValueError("backend must be 'torchscript' or 'onnx'")
+
+    path = os.path.join(model_dir, osnet_filename("onnx"))
+    torch.onnx.export(
+        model, example, path,
+        input_names=["images"], output_names=["features"],
+        dynamic_axes={"images": {0: "batch"}, "features": {0: "batch"}},
+        opset_version=17, dynamo=False
+    )
+    if not quantize:
+        return path
+
+    from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_static
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    class Calibration(CalibrationDataReader):
+        def __init__(self, batches):
+            self._batches = iter(batches)
+
+        def get_next(self):
+            return next(self._batches, None)
+
+    crops = calibration_crops if calibration_crops else synthetic_crops(64, seed=1)
+    prepared_path = path.replace(".onnx", ".prep.onnx")
+    quantized_path = os.path.join(model_dir, osnet_filename("onnx", quantize=True))
+
+    # Static QDQ int8: weights per channel, activations from calibration ranges
+    quant_pre_process(path, prepared_path)
+    try:
+        quantize_static(
+            prepared_path, quantized_path, Calibration(_calibration_batches(crops)),
+            quant_format=QuantFormat.QDQ, activation_type=QuantType.QUInt8,
+            weight_type=QuantType.QInt8, per_channel=True
+        )
+    finally:
+        os.remove(prepared_path)
+    return quantized_path
+
+
+def export_yolo(model_dir: str, backend: str) -> str:
+    """
+    Export YOLOv8 with ultralytics
+
+    ONNX is exported with a dynamic batch axis so batched detection keeps
+    working; TorchScript is traced for single frames.
+    """
+    if backend not in ("torchscript", "onnx"):
+        raise ValueError("backend must be 'torchscript' or 'onnx'")
+
+    from ultralytics import YOLO
+
+    yolo = YOLO(os.path.join(model_dir, YOLO_WEIGHTS))
+    return yolo.export(format=backend, dynamic=(backend == "onnx"))
+
+
+def check_parity(reference, candidate, device: torch.device, samples: int = 32, seed: int = 0) -> float:
+    """
+    Largest cosine distance between two OSNet models' features
+
+    Both models embed the same synthetic crops through BatchEmbedder, so the
+    whole preprocessing path is exercised.
+
+    Returns:
+        distance: max(1 - cos) over the crops
+    """
+    crops = synthetic_crops(samples, seed)
+    features = [
+        BatchEmbedder(model, device, max_batch_size=8).embed(crops)
+        for model in (reference, candidate)
+    ]
+    a, b = (f / np.maximum(np.linalg.norm(f, axis=1, keepdims=True), 1e-12) for f in features)
+    return float(np.max(1.0 - np.sum(a * b, axis=1)))
+
+
+def runtime_tag(runtime: Optional[Dict]) -> str:
+    """Short description of the OSNet runtime, part of the gallery model tag"""
+    if runtime is None:
+        return "eager"
+    return runtime["osnet_backend"] + ("-int8" if runtime["quantize"] else "")
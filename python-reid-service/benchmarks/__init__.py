@@ -0,0 +1,5 @@
+"""
+Benchmark Suite
+Synthetic CCTV fixtures, stub models and a runner that writes machine-readable
+results (python -m benchmarks.run, python -m benchmarks.compare)
+"""
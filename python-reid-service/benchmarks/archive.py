@@ -0,0 +1,192 @@
+"""
+Archive Benchmark
+Recall and latency of the footage archive's IVF-PQ search against exact
+search, on synthetic identity-clustered features (no models or video needed)
+
+Usage (from python-reid-service/):
+    python -m benchmarks.archive                                  # 100k rows
+    python -m benchmarks.archive --rows 1000000 --nprobe 8 --nprobe 32 --rerank 0 --rerank 500
+    python -m benchmarks.compare before.json after.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from archive import FootageArchive
+from gallery import FEATURE_DIM
+
+SCHEMA_VERSION = 1
+
+# Per-dimension noise around an identity's center; a view then has cosine
+# ~0.75 to its center, about what OSNet gives two crops of one person
+VIEW_NOISE = 0.04
+
+
+def synthetic_views(rng: np.random.Generator, centers: np.ndarray, identities: np.ndarray) -> np.ndarray:
+    views = centers[identities] + rng.normal(0, VIEW_NOISE, (len(identities), FEATURE_DIM)).astype(np.float32)
+    return views / np.linalg.norm(views, axis=1, keepdims=True)
+
+
+def fill(archive: FootageArchive, args, rng: np.random.Generator, centers: np.ndarray) -> Tuple[float, np.ndarray]:
+    """
+    Add args.rows detections as videos of args.video_rows rows, spread over cameras and days
+
+    Returns:
+        seconds, identities: Time taken and the people who appear
+    """
+    start = time.perf_counter()
+    seen = set()
+    first_day = datetime(2024, 1, 1, 8, 0)
+    for video in range((args.rows + args.video_rows - 1) // args.video_rows):
+        count = min(args.video_rows, args.rows - video * args.video_rows)
+        # A video shows a handful of people, many times each
+        people = rng.choice(len(centers), args.people_per_video, replace=False)
+        seen.update(people.tolist())
+        features = synthetic_views(rng, centers, rng.choice(people, count))
+        frame_nums = np.sort(rng.integers(0, 25 * 600, count))
+        bboxes = np.tile([100, 100, 160, 280], (count, 1))
+        archive.add(
+            features, frame_nums, bboxes, f"video{video:06d}", f"cam{video % args.cameras}",
+            first_day + timedelta(days=video // args.cameras % args.days, minutes=10 * (video // (args.cameras * args.days))),
+            25.0, f"video{video:06d}.mp4"
+        )
+    return time.perf_counter() - start, np.array(sorted(seen))
+
+
+def search_run(archive: FootageArchive, queries: List[np.ndarray], top_k: int, **options) -> Tuple[List[List[Dict]], List[float]]:
+    results, seconds = [], []
+    for query in queries:
+        start = time.perf_counter()
+        found = archive.search(query, top_k, **options)
+        seconds.append(time.perf_counter() - start)
+        results.append(found["results"])
+    return results, seconds
+
+
+def recall(truth: List[List[Dict]], found: List[List[Dict]]) -> float:
+    """Fraction of the exact top-k detections that were returned"""
+    hits, total = 0, 0
+    for exact, approx in zip(truth, found):
+        wanted = {(r["video_hash"], r["frame_number"]) for r in exact}
+        hits += len(wanted & {(r["video_hash"], r["frame_number"]) for r in approx})
+        total += len(wanted)
+    return hits / total if total else 1.0
+
+
+def latency_metrics(seconds: List[float]) -> Dict:
+    return {
+        "search_seconds": round(float(np.median(seconds)), 5),
+        "search_seconds_p95": round(float(np.percentile(seconds, 95)), 5),
+        "searches_per_second": round(len(seconds) / sum(seconds), 2) if sum(seconds) > 0 else 0.0
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark footage archive search (IVF-PQ vs exact)")
+    parser.add_argument("--rows", type=int, default=100000, help="Stored detections")
+    parser.add_argument("--identities", type=int, default=5000, help="Distinct people in the footage")
+    parser.add_argument("--video-rows", type=int, default=2000, help="Detections per video")
+    parser.add_argument("--people-per-video", type=int, default=20)
+    parser.add_argument("--cameras", type=int, default=8)
+    parser.add_argument("--days", type=int, default=7)
+    parser.add_argument("--train-size", type=int, default=20000, help="Rows stored before the index is trained")
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--photos", type=int, default=1, help="Reference photos per query")
+    parser.add_argument("--top-k", type=int, default=20)
+    parser.add_argument("--nprobe", type=int, action="append", help="Repeatable (default: 4, 16, 64)")
+    parser.add_argument("--rerank", type=int, action="append", help="Repeatable (default: 0, 200)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Results file (default: benchmarks/results/archive-<commit>-<time>.json)")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    centers = rng.normal(size=(args.identities, FEATURE_DIM)).astype(np.float32)
+    centers /= np.linalg.norm(centers, axis=1, keepdims=True)
+    fixture = f"{args.rows}x{args.identities}"
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix="reid-archive-bench-") as root:
+        archive = FootageArchive(root, "bench", train_size=args.train_size)
+        print(f"🗄️  Filling archive with {args.rows} rows...")
+        add_seconds, present = fill(archive, args, rng, centers)
+        # Training runs in the background while rows are added; finish it
+        # (and a retraining that is due) before searching
+        print("🧭 Waiting for index maintenance...")
+        start = time.perf_counter()
+        archive.wait()
+        archive.maintain()
+        maintain_seconds = time.perf_counter() - start
+        # Query photos are fresh views of people who appear in the footage
+        queries = [
+            synthetic_views(rng, centers, np.full(args.photos, person))
+            for person in rng.choice(present, args.queries)
+        ]
+        stats = archive.stats()
+        index_bytes = sum(
+            os.path.getsize(os.path.join(directory, name))
+            for directory, _, names in os.walk(archive.root) for name in names
+        )
+        results.append({"benchmark": "archive_add", "fixture": fixture, "metrics": {
+            "rows_per_second": round(args.rows / add_seconds, 1),
+            "add_seconds": round(add_seconds, 3),
+            "maintain_seconds": round(maintain_seconds, 3),
+            "archive_mb": round(index_bytes / 2**20, 2),
+            "shards": stats["shards"],
+            "lists": stats["lists"]
+        }})
+        print(f"   {json.dumps(results[-1]['metrics'])}")
+
+        print("⏱️  exact...")
+        truth, seconds = search_run(archive, queries, args.top_k, exact=True)
+        results.append({"benchmark": "archive_exact", "fixture": fixture, "metrics": latency_metrics(seconds)})
+        print(f"   {json.dumps(results[-1]['metrics'])}")
+
+        for nprobe in args.nprobe or [4, 16, 64]:
+            for rerank in args.rerank or [0, 200]:
+                name = f"archive_nprobe{nprobe}_rerank{rerank}"
+                print(f"⏱️  {name}...")
+                found, seconds = search_run(archive, queries, args.top_k, nprobe=nprobe, rerank=rerank)
+                metrics = latency_metrics(seconds)
+                metrics["recall"] = round(recall(truth, found), 4)
+                results.append({"benchmark": name, "fixture": fixture, "metrics": metrics})
+                print(f"   {json.dumps(metrics)}")
+
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    meta = {
+        "timestamp": datetime.now().isoformat(),
+        "git_commit": commit,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "settings": {key: value for key, value in vars(args).items() if key != "output"}
+    }
+
+    output = args.output
+    if output is None:
+        os.makedirs("benchmarks/results", exist_ok=True)
+        output = os.path.join("benchmarks/results", f"archive-{(commit or 'nogit')[:8]}-{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    with open(output, "w") as f:
+        json.dump({
+            "schema": SCHEMA_VERSION,
+            "environment": meta,
+            "fixtures": [{"name": fixture, "rows": args.rows, "identities": args.identities}],
+            "results": results
+        }, f, indent=2)
+    print(f"\n✅ Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
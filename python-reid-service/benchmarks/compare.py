@@ -0,0 +1,84 @@
+"""
+Benchmark Comparison
+Diffs two results files from benchmarks.run and flags regressions beyond a
+tolerance; exits with status 1 if any metric regressed
+
+Usage (from python-reid-service/):
+    python -m benchmarks.compare before.json after.json --tolerance 0.1
+"""
+
+import argparse
+import json
+import sys
+from typing import Dict, Optional, Tuple
+
+
+def direction(metric: str) -> int:
+    """+1 if higher is better, -1 if lower is better, 0 if informational"""
+    if metric.endswith(("_per_second", "hit_rate", "recall")):
+        return 1
+    if metric.endswith(("_seconds", "_seconds_min", "_mb", "_distance", "_max_diff", "response_bytes")):
+        return -1
+    return 0
+
+
+def load(path: str) -> Tuple[Dict, Dict[Tuple[str, str, str], float]]:
+    """Results file -> (environment, {(benchmark, fixture, metric): value})"""
+    with open(path) as f:
+        data = json.load(f)
+    values = {}
+    for result in data["results"]:
+        for metric, value in result["metrics"].items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                values[(result["benchmark"], result["fixture"], metric)] = value
+    return data.get("environment", {}), values
+
+
+def relative_change(before: float, after: float) -> Optional[float]:
+    if before == 0:
+        return None if after == 0 else float("inf")
+    return (after - before) / abs(before)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files")
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Relative change allowed before a metric counts as regressed")
+    parser.add_argument("--all", action="store_true", help="Also list informational and unchanged metrics")
+    args = parser.parse_args()
+
+    base_env, baseline = load(args.baseline)
+    cand_env, candidate = load(args.candidate)
+    print(f"📊 {(base_env.get('git_commit') or '?')[:8]} -> {(cand_env.get('git_commit') or '?')[:8]}")
+    for key in ("cpu_count", "device", "models", "torch"):
+        if base_env.get(key) != cand_env.get(key):
+            print(f"⚠️  {key} differs: {base_env.get(key)} vs {cand_env.get(key)}")
+
+    regressions = 0
+    for key in sorted(baseline.keys() & candidate.keys()):
+        better = direction(key[2])
+        change = relative_change(baseline[key], candidate[key])
+        if change is None or (better == 0 and not args.all):
+            continue
+
+        if better and change * better < -args.tolerance:
+            flag = "❌ regressed"
+            regressions += 1
+        elif better and change * better > args.tolerance:
+            flag = "✅ improved"
+        elif args.all:
+            flag = ""
+        else:
+            continue
+        print(f"{key[0]:<18} {key[1]:<24} {key[2]:<44} {baseline[key]:>12.4g} -> {candidate[key]:>12.4g} ({change:+.1%}) {flag}")
+
+    for benchmark, fixture in sorted({key[:2] for key in baseline} - {key[:2] for key in candidate}):
+        print(f"{benchmark:<18} {fixture:<24} not in candidate")
+
+    print(f"\n{regressions} regression(s) beyond {args.tolerance:.0%}")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
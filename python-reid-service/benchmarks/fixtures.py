@@ -0,0 +1,207 @@
+"""
+Synthetic CCTV Fixtures
+Deterministic videos of person-like figures walking over a static textured
+background, with per-frame ground-truth boxes and a reference image of one
+figure, generated offline from a small spec
+"""
+
+import hashlib
+import json
+import os
+from typing import Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+
+# Named fixture specs: (width, height, fps, duration_seconds, figures)
+PRESETS = {
+    "small": (640, 360, 15, 10, 3),
+    "hd": (1280, 720, 25, 20, 6),
+    "crowd": (1280, 720, 25, 10, 20),
+    "empty": (1280, 720, 25, 10, 0),
+}
+
+# Saturated clothing colors (RGB); the background is kept grey, which is what
+# the stub detector keys on
+PALETTE = [
+    (200, 30, 30), (30, 160, 40), (40, 60, 200), (220, 180, 20), (170, 40, 170),
+    (20, 170, 170), (230, 110, 20), (120, 200, 40), (90, 40, 160), (200, 40, 110),
+]
+
+
+class FixtureSpec:
+    """What to render; equal specs always produce identical files"""
+
+    def __init__(
+        self,
+        width: int,
+        height: int,
+        fps: float,
+        duration: float,
+        figures: int,
+        seed: int = 0,
+        name: Optional[str] = None
+    ):
+        """
+        Args:
+            width, height: Frame size in pixels
+            fps: Frame rate
+            duration: Length in seconds
+            figures: Number of moving person-like figures (figure 0 is the target)
+            seed: Random seed for the background, colors and paths
+            name: Label used in results (default: derived from the spec)
+        """
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.duration = duration
+        self.figures = figures
+        self.seed = seed
+        self.name = name or f"{width}x{height}@{fps:g}-{duration:g}s-{figures}p"
+
+    @classmethod
+    def parse(cls, text: str) -> "FixtureSpec":
+        """A preset name, or "WIDTHxHEIGHT,FPS,SECONDS,FIGURES[,SEED]" """
+        if text in PRESETS:
+            return cls(*PRESETS[text], name=text)
+        try:
+            size, fps, duration, figures, *rest = text.split(",")
+            width, height = (int(x) for x in size.lower().split("x"))
+            return cls(width, height, float(fps), float(duration), int(figures), int(rest[0]) if rest else 0)
+        except ValueError:
+            raise ValueError(f"Unknown fixture '{text}': use {', '.join(PRESETS)} or WIDTHxHEIGHT,FPS,SECONDS,FIGURES")
+
+    def to_dict(self) -> Dict:
+        return {
+            "name": self.name,
+            "width": self.width,
+            "height": self.height,
+            "fps": self.fps,
+            "duration": self.duration,
+            "figures": self.figures,
+            "seed": self.seed
+        }
+
+    def key(self) -> str:
+        spec = {k: v for k, v in self.to_dict().items() if k != "name"}
+        return hashlib.sha1(json.dumps(spec, sort_keys=True).encode()).hexdigest()[:12]
+
+
+def _background(spec: FixtureSpec, rng: np.random.Generator) -> np.ndarray:
+    """Grey, blurred-noise texture standing in for a static scene"""
+    noise = rng.integers(70, 170, (spec.height // 4 + 1, spec.width // 4 + 1), dtype=np.uint8)
+    texture = cv2.resize(cv2.GaussianBlur(noise, (0, 0), 2), (spec.width, spec.height), interpolation=cv2.INTER_CUBIC)
+    return cv2.cvtColor(texture, cv2.COLOR_GRAY2RGB)
+
+
+class Figure:
+    """One walking figure: head, torso and legs in its own colors, bouncing off the frame edges"""
+
+    def __init__(self, index: int, spec: FixtureSpec, rng: np.random.Generator):
+        self.height = int(spec.height * rng.uniform(0.25, 0.4))
+        self.width = max(8, int(self.height / rng.uniform(2.4, 3.0)))
+        self.torso = PALETTE[index % len(PALETTE)]
+        self.legs = PALETTE[(index * 3 + 5) % len(PALETTE)]
+        self.x = rng.uniform(0, spec.width - self.width)
+        self.y = rng.uniform(0, spec.height - self.height)
+        # Pixels per second: walking pace relative to the frame size
+        speed = spec.width * rng.uniform(0.05, 0.15)
+        angle = rng.uniform(0, 2 * np.pi)
+        self.vx, self.vy = speed * np.cos(angle), speed * np.sin(angle) * 0.3
+
+    def step(self, dt: float, spec: FixtureSpec):
+        self.x += self.vx * dt
+        self.y += self.vy * dt
+        if not 0 <= self.x <= spec.width - self.width:
+            self.vx = -self.vx
+            self.x = float(np.clip(self.x, 0, spec.width - self.width))
+        if not 0 <= self.y <= spec.height - self.height:
+            self.vy = -self.vy
+            self.y = float(np.clip(self.y, 0, spec.height - self.height))
+
+    def bbox(self) -> List[int]:
+        x1, y1 = int(self.x), int(self.y)
+        return [x1, y1, x1 + self.width, y1 + self.height]
+
+    def draw(self, frame: np.ndarray, bbox: Optional[List[int]] = None):
+        x1, y1, x2, y2 = bbox or self.bbox()
+        height, width = y2 - y1, x2 - x1
+        head = height // 6
+        cx = x1 + width // 2
+        cv2.circle(frame, (cx, y1 + head // 2), max(head // 2, 1), (230, 150, 110), -1)
+        cv2.rectangle(frame, (x1, y1 + head), (x2 - 1, y1 + head + int(height * 0.4)), self.torso, -1)
+        cv2.rectangle(frame, (x1 + width // 8, y1 + head + int(height * 0.4)), (x2 - 1 - width // 8, y2 - 1), self.legs, -1)
+
+
+def generate(spec: FixtureSpec, directory: str) -> Dict:
+    """
+    Render a fixture (or reuse an earlier render of the same spec)
+
+    Returns:
+        fixture: {"spec", "video", "reference", "ground_truth"}; ground_truth
+            maps frame number (str) to the [x1, y1, x2, y2] box of every figure
+    """
+    os.makedirs(directory, exist_ok=True)
+    base = os.path.join(directory, f"{spec.name}-{spec.key()}")
+    paths = {"video": base + ".mp4", "reference": base + "-ref.jpg", "meta": base + ".json"}
+    if all(os.path.exists(path) for path in paths.values()):
+        with open(paths["meta"]) as f:
+            return json.load(f)
+
+    rng = np.random.default_rng(spec.seed)
+    background = _background(spec, rng)
+    figures = [Figure(i, spec, rng) for i in range(spec.figures)]
+
+    writer = cv2.VideoWriter(paths["video"], cv2.VideoWriter_fourcc(*"mp4v"), spec.fps, (spec.width, spec.height))
+    if not writer.isOpened():
+        raise RuntimeError("OpenCV cannot write mp4v video")
+
+    ground_truth = {}
+    dt = 1.0 / spec.fps
+    try:
+        for frame_num in range(int(round(spec.fps * spec.duration))):
+            frame = background.copy()
+            # Far figures (higher up) first, so nearer ones occlude them
+            for figure in sorted(figures, key=lambda f: f.y + f.height):
+                figure.draw(frame)
+            ground_truth[str(frame_num)] = [figure.bbox() for figure in figures]
+            writer.write(cv2.cvtColor(frame, cv2.COLOR_RGB2BGR))
+            for figure in figures:
+                figure.step(dt, spec)
+    finally:
+        writer.release()
+
+    if figures:
+        # The target at a different scale than in the video, on its own background
+        target = figures[0]
+        scale = 1.3
+        width, height = int(target.width * scale), int(target.height * scale)
+        reference = cv2.resize(background[:height + 20, :width + 20], (width + 20, height + 20))
+        target.draw(reference, [10, 10, 10 + width, 10 + height])
+        cv2.imwrite(paths["reference"], cv2.cvtColor(reference, cv2.COLOR_RGB2BGR))
+    else:
+        cv2.imwrite(paths["reference"], cv2.cvtColor(background[:200, :80], cv2.COLOR_RGB2BGR))
+
+    fixture = {
+        "spec": spec.to_dict(),
+        "video": paths["video"],
+        "reference": paths["reference"],
+        "ground_truth": ground_truth
+    }
+    with open(paths["meta"], "w") as f:
+        json.dump(fixture, f)
+    return fixture
+
+
+def target_boxes(fixture: Dict) -> Dict[int, List[int]]:
+    """Frame number -> box of figure 0 (the reference person)"""
+    return {int(frame): boxes[0] for frame, boxes in fixture["ground_truth"].items() if boxes}
+
+
+def box_iou(a: List[int], b: List[int]) -> float:
+    x1, y1 = max(a[0], b[0]), max(a[1], b[1])
+    x2, y2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0, x2 - x1) * max(0, y2 - y1)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
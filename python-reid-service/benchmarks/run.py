@@ -0,0 +1,417 @@
+"""
+Benchmark Runner
+Measures throughput, per-stage timings, peak RSS and embedding parity of the
+service on synthetic fixtures and writes one JSON file per run
+
+Usage (from python-reid-service/):
+    python -m benchmarks.run                                  # stub models, small + crowd
+    python -m benchmarks.run --fixture hd --fixture 1920x1080,25,30,12
+    python -m benchmarks.run --models real --output before.json
+    python -m benchmarks.compare before.json after.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+import cv2
+import numpy as np
+import torch
+from PIL import Image
+
+from benchmarks.fixtures import FixtureSpec, box_iou, generate, target_boxes
+from pipeline import AnalysisPipeline
+
+# Bumped when the layout of the results file changes
+SCHEMA_VERSION = 1
+
+BENCHMARKS = ("extract", "detect_and_match", "analyze", "analyze_cached", "http", "parity")
+
+
+class MemorySampler:
+    """Peak resident set size while a block runs, sampled from a background thread"""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.start_mb = 0.0
+        self.peak_mb = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def rss_mb() -> float:
+        try:
+            import psutil
+            return psutil.Process().memory_info().rss / 2 ** 20
+        except ImportError:
+            pass
+        try:
+            with open("/proc/self/statm") as f:
+                return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+        except (OSError, ValueError, AttributeError):
+            # Lifetime peak only (KiB on Linux, bytes on macOS)
+            import resource
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            return peak / 2 ** 20 if sys.platform == "darwin" else peak / 2 ** 10
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self.peak_mb = max(self.peak_mb, self.rss_mb())
+
+    def __enter__(self) -> "MemorySampler":
+        self.start_mb = self.peak_mb = self.rss_mb()
+        self._thread = threading.Thread(target=self._sample, name="bench-rss", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        self.peak_mb = max(self.peak_mb, self.rss_mb())
+
+    def to_dict(self) -> Dict:
+        return {"peak_rss_mb": round(self.peak_mb, 1), "rss_growth_mb": round(self.peak_mb - self.start_mb, 1)}
+
+
+def measure(run: Callable[[], Dict], repeat: int) -> Dict:
+    """
+    Run a benchmark body `repeat` times
+
+    Returns:
+        metrics: From the median-time run, plus wall_seconds (median),
+            wall_seconds_min and the memory figures of the first run
+    """
+    runs = []
+    memory = None
+    for _ in range(repeat):
+        with MemorySampler() as sampler:
+            start = time.perf_counter()
+            metrics = run()
+            seconds = time.perf_counter() - start
+        memory = memory or sampler.to_dict()
+        runs.append((seconds, metrics))
+
+    runs.sort(key=lambda run: run[0])
+    seconds, metrics = runs[len(runs) // 2]
+    metrics = dict(metrics)
+    for key, value in list(metrics.items()):
+        # Counts turn into rates against the median wall time
+        if key.endswith("_count"):
+            metrics[key[:-len("_count")] + "_per_second"] = round(value / seconds, 2) if seconds > 0 else 0.0
+    metrics["wall_seconds"] = round(seconds, 4)
+    metrics["wall_seconds_min"] = round(runs[0][0], 4)
+    metrics.update(memory)
+    return metrics
+
+
+def stage_metrics(pipeline_report: Dict) -> Dict:
+    """Flatten the response's "pipeline" section: stage.<name>.<field>"""
+    flat = {}
+    for stage, stats in pipeline_report.items():
+        for field in ("busy_seconds", "cpu_seconds", "items_per_second", "model_seconds", "mean_batch_size"):
+            if field in stats:
+                flat[f"stage.{stage}.{field}"] = stats[field]
+    return flat
+
+
+def hit_rate(matches: List[Dict], fixture: Dict) -> Optional[float]:
+    """Share of reported matches that overlap the target figure (IoU >= 0.5)"""
+    if not matches:
+        return None
+    truth = target_boxes(fixture)
+    hits = sum(
+        box_iou(match["bbox"], truth[match["frame_number"]]) >= 0.5
+        for match in matches if match["frame_number"] in truth
+    )
+    return round(hits / len(matches), 3)
+
+
+def colab_features(model: torch.nn.Module, crop: np.ndarray, device: torch.device) -> np.ndarray:
+    """One crop through the original Colab preprocessing (PIL resize, torchvision, batch of one)"""
+    import torchvision
+
+    img = Image.fromarray(crop).resize((128, 256))
+    tensor = torchvision.transforms.ToTensor()(img)
+    tensor = torchvision.transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])(tensor)
+    with torch.no_grad():
+        return model(tensor.unsqueeze(0).to(device)).cpu().numpy()[0]
+
+
+def cosine_distances(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    a = a / np.maximum(np.linalg.norm(a, axis=1, keepdims=True), 1e-12)
+    b = b / np.maximum(np.linalg.norm(b, axis=1, keepdims=True), 1e-12)
+    return 1.0 - np.sum(a * b, axis=1)
+
+
+class Runner:
+    """Runs the selected benchmarks on one service against each fixture"""
+
+    def __init__(self, service, args):
+        self.service = service
+        self.args = args
+        self.sps = args.samples_per_second
+
+    def frames(self, fixture: Dict):
+        return self.service.extract_video_frames(fixture["video"], samples_per_second=self.sps)
+
+    def bench_extract(self, fixture: Dict) -> Dict:
+        def run():
+            count = sum(1 for _ in self.frames(fixture))
+            return {"frames_count": count}
+        return measure(run, self.args.repeat)
+
+    def bench_detect_and_match(self, fixture: Dict) -> Dict:
+        references = self.service.build_references(fixture["reference"])
+
+        def run():
+            frames = crops = 0
+            for frame_data in self.service.detect_and_match(self.frames(fixture), references):
+                frames += 1
+                crops += len(frame_data["persons"])
+            return {"frames_count": frames, "crops_count": crops}
+        return measure(run, self.args.repeat)
+
+    def analyze(self, fixture: Dict, use_gallery: bool) -> Dict:
+        return self.service.analyze(
+            reference_image_path=fixture["reference"],
+            video_path=fixture["video"],
+            threshold=self.args.threshold,
+            top_n=self.args.top_n,
+            samples_per_second=self.sps,
+            use_gallery=use_gallery
+        )
+
+    def result_metrics(self, results: Dict, fixture: Dict) -> Dict:
+        if results["status"] != "success":
+            raise RuntimeError(results.get("message"))
+        embed = results["pipeline"].get("embed", {})
+        metrics = {
+            "frames_count": results["video_info"]["total_frames"],
+            "crops_count": embed.get("items", results["statistics"]["total_detections"]),
+            "matches": len(results["matches"]),
+            "target_hit_rate": hit_rate(results["matches"], fixture),
+            "response_bytes": len(json.dumps(results))
+        }
+        metrics.update(stage_metrics(results["pipeline"]))
+        return metrics
+
+    def bench_analyze(self, fixture: Dict) -> Dict:
+        return measure(lambda: self.result_metrics(self.analyze(fixture, use_gallery=False), fixture), self.args.repeat)
+
+    def bench_analyze_cached(self, fixture: Dict) -> Dict:
+        # Index once (not timed), then time the gallery hits
+        self.analyze(fixture, use_gallery=True)
+        return measure(lambda: self.result_metrics(self.analyze(fixture, use_gallery=True), fixture), self.args.repeat)
+
+    def bench_http(self, fixture: Dict) -> Dict:
+        """
+        POST /analyze (upload and path reference) and POST /jobs through the
+        ASGI app in-process, with the gallery off so every request analyzes
+        """
+        from fastapi.testclient import TestClient
+        import main
+        import model_service
+
+        # main's startup loads the service through get_service(): hand it ours
+        model_service._service_instance = self.service
+        gallery, self.service.gallery = self.service.gallery, None
+        os.environ["LOCAL_MEDIA_ROOTS"] = os.path.dirname(os.path.abspath(fixture["video"]))
+        form = {"threshold": str(self.args.threshold), "top_n": str(self.args.top_n)}
+        if self.sps:
+            form["samples_per_second"] = str(self.sps)
+
+        def upload():
+            return {
+                "reference_image": ("ref.jpg", open(fixture["reference"], "rb"), "image/jpeg"),
+                "video": ("video.mp4", open(fixture["video"], "rb"), "video/mp4")
+            }
+
+        metrics = {}
+        with TestClient(main.app) as client:
+            while client.get("/ready").status_code != 200:
+                time.sleep(0.05)
+
+            def post_upload():
+                response = client.post("/analyze", files=upload(), data=form)
+                response.raise_for_status()
+                return {"response_bytes": len(response.content)}
+
+            def post_paths():
+                data = dict(form, reference_image_path=os.path.abspath(fixture["reference"]),
+                            video_path=os.path.abspath(fixture["video"]), images="ref")
+                response = client.post("/analyze", data=data)
+                response.raise_for_status()
+                return {"response_bytes": len(response.content)}
+
+            def job():
+                response = client.post("/jobs", files=upload(), data=form)
+                response.raise_for_status()
+                job_id = response.json()["job_id"]
+                while True:
+                    status = client.get(f"/jobs/{job_id}").json()
+                    if status["status"] not in ("queued", "running"):
+                        break
+                    time.sleep(0.02)
+                if status["status"] != "completed":
+                    raise RuntimeError(f"Job {status['status']}: {status.get('error')}")
+                return {}
+
+            try:
+                for name, run in (("analyze_upload", post_upload), ("analyze_path_ref", post_paths), ("jobs", job)):
+                    for key, value in measure(run, self.args.repeat).items():
+                        metrics[f"{name}.{key}"] = value
+            finally:
+                self.service.gallery = gallery
+        return metrics
+
+    def bench_parity(self, fixture: Dict) -> Dict:
+        """
+        Embedding parity between code paths (no timing)
+
+        - batched BatchEmbedder features vs the original one-crop Colab preprocessing
+        - staged pipeline vs sequential detect_and_match similarities per detection
+        """
+        service = self.service
+        crops = []
+        for _, frame in self.frames(fixture):
+            crops.extend(crop for _, crop in service.detect_persons([frame])[0])
+            if len(crops) >= 64:
+                break
+        crops = crops[:64]
+
+        metrics = {"parity_crops": len(crops)}
+        if crops:
+            batched = service.embedder.embed(crops)
+            reference = np.stack([colab_features(service.osnet_model, crop, service.device) for crop in crops])
+            metrics["batched_vs_colab_max_distance"] = float(cosine_distances(batched, reference).max())
+
+        references = service.build_references(fixture["reference"])
+
+        def similarities(frame_datas) -> Dict:
+            return {
+                (frame_data["frame_num"], tuple(person["bbox"])): person["similarity"]
+                for frame_data in frame_datas for person in frame_data["persons"]
+            }
+
+        sequential = similarities(service.detect_and_match(self.frames(fixture), references))
+        pipeline = AnalysisPipeline(service, detect_batch_size=service.detect_batch_size)
+        staged = similarities(pipeline.run(self.frames(fixture), references))
+        shared = sequential.keys() & staged.keys()
+        metrics["pipeline_vs_sequential_detections_equal"] = len(shared) == len(sequential) == len(staged)
+        metrics["pipeline_vs_sequential_max_diff"] = (
+            float(max(abs(sequential[key] - staged[key]) for key in shared)) if shared else 0.0
+        )
+        return metrics
+
+
+def environment(args, service) -> Dict:
+    """Versions and settings that affect the numbers"""
+    def git(*command):
+        try:
+            return subprocess.run(["git", *command], capture_output=True, text=True, timeout=10).stdout.strip()
+        except (OSError, subprocess.SubprocessError):
+            return None
+
+    return {
+        "timestamp": datetime.now().isoformat(),
+        "git_commit": git("rev-parse", "HEAD"),
+        "git_dirty": bool(git("status", "--porcelain", "--untracked-files=no")),
+        "python": platform.python_version(),
+        "torch": torch.__version__,
+        "opencv": cv2.__version__,
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "torch_threads": torch.get_num_threads(),
+        "device": str(service.device),
+        "models": args.models,
+        "settings": {
+            "samples_per_second": args.samples_per_second,
+            "threshold": args.threshold,
+            "top_n": args.top_n,
+            "repeat": args.repeat,
+            "embed_batch_size": args.embed_batch_size,
+            "detect_batch_size": service.detect_batch_size
+        }
+    }
+
+
+def build_service(args, gallery_dir: str):
+    options = {"gallery_dir": gallery_dir, "artifact_dir": os.path.join(gallery_dir, "artifacts")}
+    if args.models == "stub":
+        from benchmarks.stubs import StubReIDService
+        return StubReIDService(args.model_dir, args.embed_batch_size, **options)
+
+    from model_service import PersonReIDService
+    service = PersonReIDService(args.model_dir, args.embed_batch_size, **options)
+    service.warm_up()
+    return service
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Re-ID service on synthetic CCTV fixtures")
+    parser.add_argument("--fixture", action="append", help="Preset (small, hd, crowd, empty) or WIDTHxHEIGHT,FPS,SECONDS,FIGURES[,SEED]; repeatable")
+    parser.add_argument("--benchmark", action="append", choices=BENCHMARKS, help="Benchmarks to run (default: all)")
+    parser.add_argument("--models", choices=("stub", "real"), default="stub", help="Stub models (no weights needed) or the weights in --model-dir")
+    parser.add_argument("--model-dir", default="models")
+    parser.add_argument("--fixtures-dir", default="benchmarks/fixtures", help="Rendered fixtures are cached here")
+    parser.add_argument("--samples-per-second", type=float, default=5.0)
+    parser.add_argument("--threshold", type=float, default=0.6)
+    parser.add_argument("--top-n", type=int, default=3)
+    parser.add_argument("--embed-batch-size", type=int, default=32)
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per measurement; the median is reported")
+    parser.add_argument("--output", help="Results file (default: benchmarks/results/<commit>-<time>.json)")
+    parser.add_argument("--verbose", action="store_true", help="Show the service's own log output")
+    args = parser.parse_args()
+
+    specs = [FixtureSpec.parse(text) for text in (args.fixture or ["small", "crowd"])]
+    selected = args.benchmark or list(BENCHMARKS)
+
+    print(f"🎞️  Rendering {len(specs)} fixture(s) into {args.fixtures_dir}...")
+    fixtures = [generate(spec, args.fixtures_dir) for spec in specs]
+
+    quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+    results = []
+    with tempfile.TemporaryDirectory(prefix="reid-bench-") as gallery_dir:
+        with quiet:
+            service = build_service(args, gallery_dir)
+        runner = Runner(service, args)
+        meta = environment(args, service)
+
+        for fixture in fixtures:
+            for name in selected:
+                print(f"⏱️  {name} on {fixture['spec']['name']}...")
+                with contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO()):
+                    metrics = getattr(runner, f"bench_{name}")(fixture)
+                results.append({"benchmark": name, "fixture": fixture["spec"]["name"], "metrics": metrics})
+                summary = {k: v for k, v in metrics.items() if k.endswith(("per_second", "wall_seconds", "peak_rss_mb", "distance", "max_diff"))}
+                print(f"   {json.dumps(summary)}")
+
+    output = args.output
+    if output is None:
+        os.makedirs("benchmarks/results", exist_ok=True)
+        commit = (meta["git_commit"] or "nogit")[:8]
+        output = os.path.join("benchmarks/results", f"{commit}-{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+
+    with open(output, "w") as f:
+        json.dump({
+            "schema": SCHEMA_VERSION,
+            "environment": meta,
+            "fixtures": [fixture["spec"] for fixture in fixtures],
+            "results": results
+        }, f, indent=2)
+    print(f"\n✅ Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
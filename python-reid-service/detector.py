@@ -0,0 +1,251 @@
+"""
+Detector Configuration
+YOLO inference settings (classes, confidence, input size) and per-camera
+regions of interest, from the "detector" section of models/config.json
+"""
+
+import json
+import os
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+
+# Used for any key missing from config.json
+DEFAULT_DETECTOR = {
+    # COCO classes YOLO keeps at inference time (0 = person)
+    "classes": [0],
+    # Minimum detection confidence
+    "conf": 0.3,
+    # YOLO input size in pixels, or "auto" to size it from the ROI
+    "imgsz": 640,
+    # "auto": the ROI is scanned at the scale the whole frame gets at this size
+    "auto_base": 640,
+    # Upper bound for "auto"
+    "max_imgsz": 1280,
+    # Person crops smaller than this (either side, pixels) are dropped
+    "min_size": 20,
+    # Named cameras: {"door-4k": {"roi": [0.35, 0.1, 0.65, 1.0], "imgsz": "auto"}}
+    "cameras": {}
+}
+
+# Keys a camera entry may override
+CAMERA_KEYS = ("classes", "conf", "imgsz", "auto_base", "max_imgsz", "min_size", "roi")
+
+# YOLO strides: input sizes must be a multiple of this
+STRIDE = 32
+MIN_IMGSZ = 160
+
+
+def load_detector_config(model_dir: str) -> Dict:
+    """Read the "detector" section of <model_dir>/config.json, filled in with defaults"""
+    config = dict(DEFAULT_DETECTOR)
+    path = os.path.join(model_dir, "config.json")
+    if os.path.exists(path):
+        with open(path) as f:
+            config.update(json.load(f).get("detector", {}))
+
+    for name, camera in config["cameras"].items():
+        unknown = set(camera) - set(CAMERA_KEYS)
+        if unknown:
+            raise ValueError(f"detector.cameras.{name}: unknown keys {sorted(unknown)}")
+        # Fail at startup rather than on the first request for this camera
+        DetectorSettings.from_config(config, name)
+    return config
+
+
+def parse_roi(text: str) -> List:
+    """
+    ROI from a form field, in fractions of the frame size
+
+    "x1,y1,x2,y2" is a rectangle; "x,y;x,y;x,y[;...]" a polygon.
+    """
+    try:
+        if ";" in text:
+            return [[float(v) for v in point.split(",")] for point in text.split(";") if point.strip()]
+        return [float(v) for v in text.split(",")]
+    except ValueError:
+        raise ValueError("roi must be 'x1,y1,x2,y2' or 'x,y;x,y;x,y' in fractions of the frame")
+
+
+class RegionOfInterest:
+    """
+    Static part of a camera's view to search, in fractions of the frame size
+
+    A rectangle crops the frame. A polygon crops to its bounding box and
+    blanks everything outside it before detection.
+    """
+
+    def __init__(self, spec: Sequence):
+        """
+        Args:
+            spec: [x1, y1, x2, y2] or [[x, y], [x, y], [x, y], ...]
+        """
+        if len(spec) == 4 and all(isinstance(v, (int, float)) for v in spec):
+            x1, y1, x2, y2 = (float(v) for v in spec)
+            self.polygon = None
+        else:
+            try:
+                points = [(float(x), float(y)) for x, y in spec]
+            except (TypeError, ValueError):
+                raise ValueError("ROI must be [x1, y1, x2, y2] or a list of [x, y] points")
+            if len(points) < 3:
+                raise ValueError("ROI polygon needs at least 3 points")
+            self.polygon = points
+            xs, ys = [x for x, _ in points], [y for _, y in points]
+            x1, y1, x2, y2 = min(xs), min(ys), max(xs), max(ys)
+
+        if not (0.0 <= x1 < x2 <= 1.0 and 0.0 <= y1 < y2 <= 1.0):
+            raise ValueError("ROI coordinates must be fractions of the frame (0-1) with x1 < x2, y1 < y2")
+        self.box = (x1, y1, x2, y2)
+
+    def bounds(self, width: int, height: int) -> Tuple[int, int, int, int]:
+        """Pixel rectangle (x1, y1, x2, y2) covering the ROI"""
+        x1, y1, x2, y2 = self.box
+        return (
+            int(np.floor(x1 * width)), int(np.floor(y1 * height)),
+            max(int(np.ceil(x2 * width)), 1), max(int(np.ceil(y2 * height)), 1)
+        )
+
+    def mask(self, width: int, height: int) -> Optional[np.ndarray]:
+        """Polygon mask over bounds() (uint8, 1 inside), None for rectangles"""
+        if self.polygon is None:
+            return None
+        x1, y1, x2, y2 = self.bounds(width, height)
+        points = np.array([[x * width - x1, y * height - y1] for x, y in self.polygon], dtype=np.int32)
+        mask = np.zeros((y2 - y1, x2 - x1), dtype=np.uint8)
+        cv2.fillPoly(mask, [points], 1)
+        return mask
+
+    def to_list(self) -> List:
+        return [list(point) for point in self.polygon] if self.polygon else list(self.box)
+
+
+class DetectorSettings:
+    """Detector configuration for one camera, before the frame size is known"""
+
+    def __init__(
+        self,
+        classes: Optional[List[int]] = None,
+        conf: float = 0.3,
+        imgsz=640,
+        auto_base: int = 640,
+        max_imgsz: int = 1280,
+        min_size: int = 20,
+        roi: Optional[RegionOfInterest] = None
+    ):
+        if imgsz != "auto" and (not isinstance(imgsz, int) or imgsz < STRIDE):
+            raise ValueError(f"imgsz must be 'auto' or an integer >= {STRIDE}")
+        self.classes = list(classes) if classes is not None else None
+        self.conf = conf
+        self.imgsz = imgsz
+        self.auto_base = auto_base
+        self.max_imgsz = max_imgsz
+        self.min_size = min_size
+        self.roi = roi
+
+    @classmethod
+    def from_config(cls, config: Dict, camera: Optional[str] = None, roi: Optional[Sequence] = None) -> "DetectorSettings":
+        """
+        Args:
+            config: load_detector_config() result
+            camera: Name in config["cameras"] whose overrides apply
+            roi: Per-request ROI, replaces the camera's
+        """
+        settings = {key: config[key] for key in CAMERA_KEYS if key in config}
+        if camera is not None:
+            if camera not in config["cameras"]:
+                raise ValueError(f"Unknown camera '{camera}'")
+            settings.update(config["cameras"][camera])
+        if roi is not None:
+            settings["roi"] = roi
+        spec = settings.pop("roi", None)
+        return cls(roi=RegionOfInterest(spec) if spec else None, **settings)
+
+    def image_size(self, region: Tuple[int, int], frame: Tuple[int, int]) -> int:
+        """
+        YOLO input size for a (width, height) region of a (width, height) frame
+
+        "auto" keeps the pixels per person that the whole frame gets at
+        auto_base. A doorway covering a third of the frame is then scanned at a
+        third of the input size, roughly a ninth of the compute, with people
+        just as large as before. The size is rounded up to the stride and
+        clamped between MIN_IMGSZ and max_imgsz.
+        """
+        if self.imgsz != "auto":
+            return self.imgsz
+        size = self.auto_base * max(region) / max(max(frame), 1)
+        size = -(-int(np.ceil(size)) // STRIDE) * STRIDE
+        return int(min(max(size, MIN_IMGSZ), self.max_imgsz))
+
+    def resolve(self, width: int, height: int) -> "DetectorPlan":
+        """Settings for one video's frame size"""
+        if self.roi is not None:
+            bounds = self.roi.bounds(width, height)
+            mask = self.roi.mask(width, height)
+        else:
+            bounds, mask = (0, 0, width, height), None
+        x1, y1, x2, y2 = bounds
+        return DetectorPlan(self, bounds, mask, self.image_size((x2 - x1, y2 - y1), (width, height)))
+
+    def key(self) -> str:
+        """Gallery sampling-key suffix; empty for the defaults, which existing entries used"""
+        parts = []
+        if self.classes != DEFAULT_DETECTOR["classes"] or self.conf != DEFAULT_DETECTOR["conf"]:
+            parts.append(f"c{'.'.join(map(str, self.classes or []))}@{self.conf:g}")
+        if self.imgsz != DEFAULT_DETECTOR["imgsz"]:
+            parts.append(f"i{self.imgsz}" + (f"{self.auto_base}-{self.max_imgsz}" if self.imgsz == "auto" else ""))
+        if self.min_size != DEFAULT_DETECTOR["min_size"]:
+            parts.append(f"m{self.min_size}")
+        if self.roi is not None:
+            parts.append("roi" + "_".join(f"{v:g}" for v in np.ravel(self.roi.to_list())))
+        return "-".join(parts)
+
+
+class DetectorPlan:
+    """
+    DetectorSettings resolved for one frame size
+
+    Frames are cropped to bounds right after decoding (crop()), so color
+    conversion, the frame queues, the motion gate and YOLO only see the ROI.
+    detect_persons maps boxes back to full-frame coordinates (to_frame()).
+    """
+
+    def __init__(self, settings: DetectorSettings, bounds: Tuple[int, int, int, int], mask: Optional[np.ndarray], imgsz: int):
+        self.settings = settings
+        self.bounds = bounds
+        self.mask = mask
+        self.imgsz = imgsz
+
+    @property
+    def cropped(self) -> bool:
+        return self.settings.roi is not None
+
+    def crop(self, frame: np.ndarray) -> np.ndarray:
+        """The ROI part of a full frame (a view, no copy)"""
+        if not self.cropped:
+            return frame
+        x1, y1, x2, y2 = self.bounds
+        return frame[y1:y2, x1:x2]
+
+    def masked(self, frame: np.ndarray) -> np.ndarray:
+        """A cropped frame with everything outside the ROI polygon blanked (detector input)"""
+        if self.mask is None or frame.shape[:2] != self.mask.shape:
+            return frame
+        return frame * self.mask[:, :, None]
+
+    def to_frame(self, bbox: List[int]) -> List[int]:
+        """Box in cropped-frame pixels -> full-frame pixels"""
+        x1, y1 = self.bounds[:2]
+        return [bbox[0] + x1, bbox[1] + y1, bbox[2] + x1, bbox[3] + y1]
+
+    def to_dict(self) -> Dict:
+        settings = self.settings
+        return {
+            "imgsz": self.imgsz,
+            "classes": settings.classes,
+            "conf": settings.conf,
+            "roi": settings.roi.to_list() if settings.roi is not None else None,
+            "roi_pixels": list(self.bounds) if self.cropped else None
+        }
@@ -0,0 +1,174 @@
+"""
+Batched OSNet Embedding Engine
+Gathers person crops (across one or more frames) and runs OSNet once per batch
+"""
+
+import time
+
+import cv2
+import numpy as np
+import torch
+from PIL import Image
+from typing import Any, Callable, List, Optional, Tuple, Union
+
+
+# OSNet-IBN input size (width, height) and ImageNet normalization (see models/config.json)
+OSNET_INPUT_SIZE = (128, 256)
+NORMALIZE_MEAN = [0.485, 0.456, 0.406]
+NORMALIZE_STD = [0.229, 0.224, 0.225]
+
+
+def resize_crop(img: np.ndarray, dst: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Resize an RGB crop to the OSNet input size
+
+    Crops larger than the input are shrunk with INTER_AREA, which averages
+    the source pixels like PIL's (antialiased) bicubic resize; bilinear
+    interpolation would alias fine texture. Smaller crops are enlarged
+    bilinearly.
+    """
+    height, width = img.shape[:2]
+    shrinking = width > OSNET_INPUT_SIZE[0] or height > OSNET_INPUT_SIZE[1]
+    interpolation = cv2.INTER_AREA if shrinking else cv2.INTER_LINEAR
+    return cv2.resize(img, OSNET_INPUT_SIZE, dst=dst, interpolation=interpolation)
+
+
+class BatchEmbedder:
+    """
+    Batched feature extractor for OSNet
+
+    Crops are resized straight from frame arrays (slices, no copies) into a
+    pre-allocated uint8 (N, 256, 128, 3) staging array with cv2. Each batch is
+    converted to a float (N, 3, 256, 128) tensor with a single copy, normalized
+    in place and sent through OSNet with one forward call.
+
+    Resizing is done by resize_crop(). Against the previous PIL bicubic path,
+    the resized crops differ by under 1 grey level on average, from 2x
+    enlargement to 6x reduction (bilinear reduction: up to 8). The effect on
+    features has not been measured with trained OSNet weights.
+    """
+
+    def __init__(
+        self,
+        model: torch.nn.Module,
+        device: torch.device,
+        max_batch_size: int = 32,
+        on_batch: Optional[Callable[[int, float], None]] = None
+    ):
+        """
+        Args:
+            model: Loaded OSNet model (eval mode)
+            device: Device the model lives on
+            max_batch_size: Maximum number of crops per forward pass
+            on_batch: Called with (crops, seconds) after every forward pass
+        """
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be >= 1")
+
+        self.model = model
+        self.device = device
+        self.max_batch_size = max_batch_size
+        self.on_batch = on_batch
+
+        width, height = OSNET_INPUT_SIZE
+        # Resized crops, HWC uint8 as produced by cv2.resize
+        self._staging = np.empty((max_batch_size, height, width, 3), dtype=np.uint8)
+        # Host-side float buffer, reused for every batch (pinned for faster H2D copies on GPU)
+        self._buffer = torch.empty(
+            (max_batch_size, 3, height, width),
+            dtype=torch.float32,
+            pin_memory=(device.type == 'cuda')
+        )
+        self._mean = torch.tensor(NORMALIZE_MEAN, dtype=torch.float32).view(1, 3, 1, 1)
+        self._std = torch.tensor(NORMALIZE_STD, dtype=torch.float32).view(1, 3, 1, 1)
+
+        # Payloads of the crops already resized into staging rows 0..len-1
+        self._pending: List[Any] = []
+
+    def _fill(self, index: int, img: Union[Image.Image, np.ndarray]):
+        """Resize one RGB crop into staging row `index`"""
+        if isinstance(img, Image.Image):
+            img = np.asarray(img.convert('RGB'))
+        resize_crop(img, dst=self._staging[index])
+
+    def _forward(self, count: int) -> np.ndarray:
+        """Normalize the first `count` staging rows and run OSNet on them"""
+        start = time.perf_counter()
+        batch = self._buffer[:count]
+        # HWC uint8 -> CHW float32 in one copy
+        batch.copy_(torch.from_numpy(self._staging[:count]).permute(0, 3, 1, 2))
+        batch.div_(255.0).sub_(self._mean).div_(self._std)
+        batch = batch.to(self.device, non_blocking=True)
+
+        with torch.no_grad():
+            features = self.model(batch)
+
+        features = features.cpu().numpy()
+        if self.on_batch is not None:
+            self.on_batch(count, time.perf_counter() - start)
+        return features
+
+    def embed(self, images: List[Union[Image.Image, np.ndarray]]) -> np.ndarray:
+        """
+        Extract features for a list of RGB crops
+
+        Args:
+            images: PIL Images or RGB numpy arrays (views into a frame are fine)
+        Returns:
+            features: numpy array (N, 512)
+        """
+        if self._pending:
+            raise RuntimeError("embed() cannot run while crops are queued; flush() first")
+
+        self.model.eval()
+        chunks = []
+
+        for start in range(0, len(images), self.max_batch_size):
+            chunk = images[start:start + self.max_batch_size]
+            for i, img in enumerate(chunk):
+                self._fill(i, img)
+            chunks.append(self._forward(len(chunk)))
+
+        if not chunks:
+            return np.empty((0, 512), dtype=np.float32)
+        return np.concatenate(chunks, axis=0)
+
+    @property
+    def pending(self) -> int:
+        """Number of crops queued for the next batch"""
+        return len(self._pending)
+
+    def add(self, img: Union[Image.Image, np.ndarray], payload: Any = None) -> List[Tuple[Any, np.ndarray]]:
+        """
+        Queue a crop for embedding; runs a batch once max_batch_size crops are pending
+
+        The crop is resized immediately, so the caller's frame is not
+        referenced after this returns.
+
+        Args:
+            img: PIL Image or RGB numpy array (e.g. frame[y1:y2, x1:x2])
+            payload: Caller data returned alongside the feature
+        Returns:
+            Flushed (payload, feature) pairs, empty if the batch is not full yet
+        """
+        self._fill(len(self._pending), img)
+        self._pending.append(payload)
+        if len(self._pending) >= self.max_batch_size:
+            return self.flush()
+        return []
+
+    def flush(self) -> List[Tuple[Any, np.ndarray]]:
+        """
+        Embed all pending crops
+
+        Returns:
+            List of (payload, feature) pairs, feature shape (512,)
+        """
+        if not self._pending:
+            return []
+
+        pending, self._pending = self._pending, []
+        self.model.eval()
+        features = self._forward(len(pending))
+
+        return list(zip(pending, features))
@@ -0,0 +1,83 @@
+"""
+Model Export Tool
+Exports OSNet-IBN and YOLOv8 to TorchScript / ONNX for the runtime backends
+in models/config.json, and checks OSNet parity and speed against eager PyTorch
+
+Usage:
+    python export_models.py --backend onnx --quantize
+    python export_models.py --backend torchscript --yolo
+"""
+
+import argparse
+import glob
+import os
+import time
+
+import numpy as np
+import torch
+from PIL import Image
+
+from backends import (
+    build_eager_osnet, check_parity, configure_threads, export_osnet, export_yolo, load_osnet
+)
+from embedding import BatchEmbedder
+
+
+def time_embedder(model, device: torch.device, batch_size: int = 32, repeats: int = 5) -> float:
+    """Crops per second for one model through BatchEmbedder"""
+    crops = [np.random.randint(0, 256, (256, 128, 3), dtype=np.uint8) for _ in range(batch_size)]
+    embedder = BatchEmbedder(model, device, batch_size)
+    embedder.embed(crops)  # warm-up
+
+    start = time.perf_counter()
+    for _ in range(repeats):
+        embedder.embed(crops)
+    return batch_size * repeats / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export models for the TorchScript / ONNX Runtime backends")
+    parser.add_argument("--model-dir", default="models", help="Directory with osnet_ibn_x1_0.pth and yolov8n.pt")
+    parser.add_argument("--backend", choices=("torchscript", "onnx"), required=True)
+    parser.add_argument("--quantize", action="store_true", help="Also write a static int8 OSNet (onnx only)")
+    parser.add_argument("--calibration-dir", help="Person crop images for int8 calibration (default: synthetic)")
+    parser.add_argument("--yolo", action="store_true", help="Export YOLOv8 as well")
+    parser.add_argument("--threads", type=int, default=0, help="Intra-op threads for the benchmark (0 = default)")
+    args = parser.parse_args()
+
+    if args.quantize and args.backend != "onnx":
+        parser.error("--quantize requires --backend onnx")
+
+    configure_threads(args.threads)
+    device = torch.device("cpu")
+
+    print(f"📦 Exporting OSNet-IBN ({args.backend})...")
+    paths = [export_osnet(args.model_dir, args.backend)]
+    if args.quantize:
+        crops = None
+        if args.calibration_dir:
+            files = sorted(glob.glob(os.path.join(args.calibration_dir, "*")))[:256]
+            crops = [np.asarray(Image.open(path).convert("RGB")) for path in files]
+            print(f"   Calibrating on {len(crops)} crops from {args.calibration_dir}")
+        paths.append(export_osnet(args.model_dir, args.backend, quantize=True, calibration_crops=crops))
+
+    eager = build_eager_osnet(args.model_dir, device)
+    eager_speed = time_embedder(eager, device)
+    print(f"   eager: {eager_speed:.1f} crops/s")
+
+    for path, quantize in zip(paths, (False, True)):
+        runtime = {"osnet_backend": args.backend, "quantize": quantize, "num_threads": args.threads}
+        model = load_osnet(args.model_dir, device, runtime)
+        distance = check_parity(eager, model, device)
+        speed = time_embedder(model, device)
+        print(f"   {path}: {speed:.1f} crops/s ({speed / eager_speed:.2f}x), max cosine distance {distance:.2e}")
+
+    if args.yolo:
+        print(f"\n📦 Exporting YOLOv8 ({args.backend})...")
+        print(f"   {export_yolo(args.model_dir, args.backend)}")
+
+    print("\n✅ Done. Set the \"runtime\" section of models/config.json to use the exported files.")
+
+
+if __name__ == "__main__":
+    main()
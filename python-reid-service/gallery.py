@@ -0,0 +1,250 @@
+"""
+Persistent Gallery Index
+Stores per-video person detections (frame number, bbox, OSNet feature) on disk,
+keyed by video content hash, so repeat searches skip decode/YOLO/OSNet entirely
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+from datetime import datetime
+from typing import Dict, Optional
+
+import numpy as np
+
+from scoring import ReferenceSet, normalize_rows
+
+
+FEATURE_DIM = 512
+FEATURE_DTYPE = np.float16
+
+FEATURES_FILE = "features.f16"
+META_FILE = "meta.npz"
+INFO_FILE = "info.json"
+# Names the entry's current version directory; replaced atomically on commit
+CURRENT_FILE = "CURRENT"
+# A superseded version is deleted this long after it was replaced, so readers
+# that resolved CURRENT just before can still open it
+STALE_VERSION_SECONDS = 300
+
+
+def file_hash(path: str, chunk_size: int = 8 * 1024 * 1024) -> str:
+    """SHA-256 of a file's content (streamed, constant memory)"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def sampling_key(
+    frame_interval: int = 30,
+    samples_per_second: Optional[float] = None,
+    motion_threshold: Optional[float] = None,
+    detector: str = ""
+) -> str:
+    """Directory name for one sampling configuration of a video (detector: DetectorSettings.key())"""
+    key = f"sps{samples_per_second:g}" if samples_per_second else f"every{frame_interval}"
+    if motion_threshold:
+        # Motion-gated runs hold only the frames that passed the gate
+        key += f"-motion{motion_threshold:g}"
+    if detector:
+        # Other classes, input sizes or ROIs find other detections
+        key += f"-{detector}"
+    return key
+
+
+class GalleryEntry:
+    """
+    Indexed detections for one video
+
+    features is a read-only memory map of L2-normalized float16 rows, so a
+    query is a single matrix-vector product over the whole video.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+        with open(os.path.join(path, INFO_FILE)) as f:
+            self.info = json.load(f)
+
+        count = self.info["detections"]
+        if count > 0:
+            self.features = np.memmap(
+                os.path.join(path, FEATURES_FILE), dtype=FEATURE_DTYPE, mode="r",
+                shape=(count, FEATURE_DIM)
+            )
+        else:
+            self.features = np.empty((0, FEATURE_DIM), dtype=FEATURE_DTYPE)
+
+        meta = np.load(os.path.join(path, META_FILE))
+        self.frame_nums = meta["frame_nums"]
+        self.bboxes = meta["bboxes"]
+
+    def __len__(self) -> int:
+        return len(self.frame_nums)
+
+    def similarities(self, references: ReferenceSet) -> np.ndarray:
+        """
+        Cosine similarity of every indexed detection to every reference identity
+
+        Args:
+            references: ReferenceSet (use as_reference_set for a single feature)
+        Returns:
+            sims: float32 array (N, G)
+        """
+        if len(self) == 0:
+            return np.empty((0, len(references)), dtype=np.float32)
+        return references.score(np.asarray(self.features, dtype=np.float32))
+
+
+class GalleryWriter:
+    """
+    Incrementally records detections while an analysis runs
+
+    Rows are written to a new version directory of the entry, which only
+    becomes visible on commit(), when the entry's CURRENT file is atomically
+    replaced to name it. Cancelled or failed runs leave nothing behind, and
+    concurrent writers of the same entry never touch each other's files:
+    the last commit wins, and earlier versions are pruned once stale.
+    """
+
+    def __init__(self, entry_path: str):
+        self.entry_path = entry_path
+        self.version = f"v-{uuid.uuid4().hex}"
+        self.path = os.path.join(entry_path, self.version)
+        os.makedirs(self.path)
+
+        self._features = open(os.path.join(self.path, FEATURES_FILE), "wb")
+        self._frame_nums = []
+        self._bboxes = []
+
+    def add(self, frame_data: Dict):
+        """Record every scored person of one frame (needs person['feature'])"""
+        persons = frame_data['persons']
+        if not persons:
+            return
+
+        features = normalize_rows(np.stack([person['feature'] for person in persons]))
+        self._features.write(features.astype(FEATURE_DTYPE).tobytes())
+        self._frame_nums.extend([frame_data['frame_num']] * len(persons))
+        self._bboxes.extend(person['bbox'] for person in persons)
+
+    def commit(self, info: Dict) -> GalleryEntry:
+        """Write metadata and publish the entry"""
+        self._features.close()
+
+        np.savez(
+            os.path.join(self.path, META_FILE),
+            frame_nums=np.asarray(self._frame_nums, dtype=np.int64),
+            bboxes=np.asarray(self._bboxes, dtype=np.int32).reshape(-1, 4)
+        )
+
+        info = dict(info)
+        info["detections"] = len(self._frame_nums)
+        info["created_at"] = datetime.now().isoformat()
+        with open(os.path.join(self.path, INFO_FILE), "w") as f:
+            json.dump(info, f, indent=2)
+
+        pointer = os.path.join(self.entry_path, CURRENT_FILE)
+        previous = current_version(self.entry_path)
+        with open(f"{pointer}.{self.version}.tmp", "w") as f:
+            f.write(self.version)
+        os.replace(f"{pointer}.{self.version}.tmp", pointer)
+        if previous is not None:
+            # Superseded now: starts its STALE_VERSION_SECONDS grace period
+            stale = [previous] if previous != self.entry_path else [
+                os.path.join(previous, name) for name in (FEATURES_FILE, META_FILE, INFO_FILE)
+            ]
+            for path in stale:
+                try:
+                    os.utime(path)
+                except OSError:
+                    pass
+        self._prune()
+
+        return GalleryEntry(self.path)
+
+    def _prune(self):
+        """Delete everything in the entry but CURRENT and its version once stale (old versions, aborted writes)"""
+        cutoff = time.time() - STALE_VERSION_SECONDS
+        current = current_version(self.entry_path)
+        for name in os.listdir(self.entry_path):
+            path = os.path.join(self.entry_path, name)
+            if name == CURRENT_FILE or path == current:
+                continue
+            try:
+                if os.path.getmtime(path) >= cutoff:
+                    continue
+                if os.path.isdir(path):
+                    shutil.rmtree(path, ignore_errors=True)
+                else:
+                    # Files of an entry from before versions, or a stray pointer
+                    os.remove(path)
+            except OSError:
+                pass
+
+    def abort(self):
+        """Discard the partial entry"""
+        if not self._features.closed:
+            self._features.close()
+        shutil.rmtree(self.path, ignore_errors=True)
+
+
+def current_version(entry_path: str) -> Optional[str]:
+    """
+    Directory holding an entry's current files, or None if it has none
+
+    Entries written before versioning keep their files in the entry directory.
+    """
+    try:
+        with open(os.path.join(entry_path, CURRENT_FILE)) as f:
+            return os.path.join(entry_path, f.read().strip())
+    except FileNotFoundError:
+        return entry_path if os.path.exists(os.path.join(entry_path, INFO_FILE)) else None
+
+
+class GalleryIndex:
+    """
+    On-disk store of GalleryEntry objects
+
+    Layout: <root>/<video sha256>/<sampling key>/<version>/{features.f16, meta.npz, info.json},
+    plus <root>/<video sha256>/<sampling key>/CURRENT naming the live version
+    """
+
+    def __init__(self, root: str = "gallery", model_tag: str = ""):
+        """
+        Args:
+            root: Directory holding the index
+            model_tag: Identifies the embedding model; entries built with a
+                different model are ignored
+        """
+        self.root = root
+        self.model_tag = model_tag
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, video_hash: str, key: str) -> str:
+        return os.path.join(self.root, video_hash, key)
+
+    def get(self, video_hash: str, key: str) -> Optional[GalleryEntry]:
+        """Load an entry, or None if this video/sampling has not been indexed"""
+        path = current_version(self._path(video_hash, key))
+        if path is None or not os.path.exists(os.path.join(path, INFO_FILE)):
+            return None
+
+        try:
+            entry = GalleryEntry(path)
+        except Exception as e:
+            print(f"⚠️  Ignoring unreadable gallery entry {path}: {e}")
+            return None
+
+        if entry.info.get("model_tag") != self.model_tag:
+            return None
+        return entry
+
+    def writer(self, video_hash: str, key: str) -> GalleryWriter:
+        """Start recording a new entry (an existing one, e.g. of another model, is replaced on commit)"""
+        return GalleryWriter(self._path(video_hash, key))
@@ -0,0 +1,207 @@
+"""
+Upload Ingestion
+Unique upload names, server-local media references, and streaming multipart
+uploads written straight to their final path (no spool-and-copy)
+"""
+
+import asyncio
+import os
+import uuid
+from typing import Dict, List, Optional
+from urllib.parse import unquote, urlparse
+
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ImportError:  # python-multipart < 0.0.13
+    from multipart.multipart import MultipartParser, parse_options_header
+
+
+def unique_upload_path(directory: str, prefix: str, filename: Optional[str] = None, default_ext: str = "") -> str:
+    """Collision-free path for a new upload, keeping the client's file extension"""
+    ext = os.path.splitext(filename or "")[1].lower() or default_ext
+    return os.path.join(directory, f"{prefix}_{uuid.uuid4().hex}{ext}")
+
+
+def media_roots() -> List[str]:
+    """Directories clients may reference by path (LOCAL_MEDIA_ROOTS, os.pathsep-separated)"""
+    roots = os.getenv("LOCAL_MEDIA_ROOTS", "")
+    return [os.path.realpath(root) for root in roots.split(os.pathsep) if root.strip()]
+
+
+def resolve_local_media(reference: str) -> str:
+    """
+    Resolve a server-local path or file:// URI to a readable file
+
+    Only files inside LOCAL_MEDIA_ROOTS are accepted, so clients cannot read
+    arbitrary files from the server.
+
+    Raises:
+        ValueError: Path references disabled, outside the roots, or not a file
+    """
+    roots = media_roots()
+    if not roots:
+        raise ValueError("Path references are disabled (set LOCAL_MEDIA_ROOTS)")
+
+    if reference.startswith("file://"):
+        reference = unquote(urlparse(reference).path)
+    elif "://" in reference:
+        raise ValueError("Only server-local paths and file:// URIs are supported")
+
+    path = os.path.realpath(reference)
+    if not any(os.path.commonpath([path, root]) == root for root in roots):
+        raise ValueError("Path is outside LOCAL_MEDIA_ROOTS")
+    if not os.path.isfile(path):
+        raise ValueError(f"File not found: {reference}")
+    return path
+
+
+class StreamedFile:
+    """One file part of a streamed multipart body, already on disk"""
+
+    def __init__(self, field: str, filename: str, content_type: str, path: str):
+        self.field = field
+        self.filename = filename
+        self.content_type = content_type
+        self.path = path
+        self.size = 0
+
+
+class StreamedForm:
+    """
+    Incremental multipart/form-data parser that writes file parts to disk as they arrive
+
+    Text fields are kept in memory; file parts go straight to a unique path
+    in the directory registered for their field name, so the body is written
+    once instead of being spooled to a temp file and copied.
+    """
+
+    def __init__(self, content_type: str, directories: Dict[str, str], max_field_size: int = 64 * 1024):
+        """
+        Args:
+            content_type: Request Content-Type header (carries the boundary)
+            directories: Upload directory per file field name
+            max_field_size: Largest text field accepted
+        """
+        kind, options = parse_options_header(content_type)
+        if kind != b"multipart/form-data" or b"boundary" not in options:
+            raise ValueError("Expected a multipart/form-data body")
+
+        self.directories = directories
+        self.max_field_size = max_field_size
+        self.fields: Dict[str, List[str]] = {}
+        self.files: Dict[str, List[StreamedFile]] = {}
+
+        self._headers: Dict[bytes, bytes] = {}
+        self._header_field = b""
+        self._header_value = b""
+        self._name = None
+        self._value = None
+        self._file = None
+        self._handle = None
+
+        self._parser = MultipartParser(options[b"boundary"], {
+            "on_part_begin": self._on_part_begin,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+        })
+
+    def _on_part_begin(self):
+        self._headers = {}
+
+    def _on_header_field(self, data: bytes, start: int, end: int):
+        self._header_field += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+
+    def _on_header_end(self):
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field = b""
+        self._header_value = b""
+
+    def _on_headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        self._name = options.get(b"name", b"").decode("utf-8", "replace")
+        filename = options.get(b"filename")
+
+        if filename is None:
+            self._value = bytearray()
+            return
+
+        if self._name not in self.directories:
+            raise ValueError(f"Unexpected file field '{self._name}'")
+        filename = os.path.basename(filename.decode("utf-8", "replace"))
+        content_type = self._headers.get(b"content-type", b"application/octet-stream").decode("latin-1")
+        path = unique_upload_path(self.directories[self._name], self._name, filename)
+
+        self._file = StreamedFile(self._name, filename, content_type, path)
+        self._handle = open(path, "wb")
+        self.files.setdefault(self._name, []).append(self._file)
+
+    def _on_part_data(self, data: bytes, start: int, end: int):
+        if self._handle is not None:
+            self._handle.write(data[start:end])
+            self._file.size += end - start
+        else:
+            self._value += data[start:end]
+            if len(self._value) > self.max_field_size:
+                raise ValueError(f"Field '{self._name}' is too large")
+
+    def _on_part_end(self):
+        if self._handle is not None:
+            self._handle.close()
+            self._handle = self._file = None
+        else:
+            self.fields.setdefault(self._name, []).append(self._value.decode("utf-8", "replace"))
+            self._value = None
+
+    def write(self, chunk: bytes):
+        """Feed the next chunk of the request body"""
+        self._parser.write(chunk)
+
+    def finish(self):
+        self._parser.finalize()
+
+    def paths(self) -> List[str]:
+        """Every file written so far (for cleanup)"""
+        return [streamed.path for files in self.files.values() for streamed in files]
+
+    def close(self):
+        """Close a file left open by an interrupted body"""
+        if self._handle is not None:
+            self._handle.close()
+            self._handle = None
+
+    def field(self, name: str) -> Optional[str]:
+        """First value of a text field, None if missing or empty"""
+        values = self.fields.get(name)
+        return values[0] if values and values[0] != "" else None
+
+
+async def receive_form(request, directories: Dict[str, str]) -> StreamedForm:
+    """
+    Stream a multipart request body to disk
+
+    Chunks are parsed (and file parts written) off the event loop as they
+    arrive. Files already written are removed if the body is malformed or the
+    client disconnects.
+    """
+    form = StreamedForm(request.headers.get("content-type", ""), directories)
+    try:
+        async for chunk in request.stream():
+            if chunk:
+                await asyncio.to_thread(form.write, chunk)
+        form.finish()
+    except BaseException:
+        form.close()
+        for path in form.paths():
+            if os.path.exists(path):
+                os.remove(path)
+        raise
+    finally:
+        form.close()
+    return form
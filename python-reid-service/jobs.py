@@ -0,0 +1,261 @@
+"""
+Background Analysis Jobs
+Runs PersonReIDService.analyze in a bounded worker pool with progress and cancellation
+"""
+
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Sequence, Set
+
+from pipeline import AnalysisCancelled
+from admission import AdmissionController, JobCost, JOB_BASE_MB
+
+
+# Job states
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+FINISHED_STATES = (COMPLETED, FAILED, CANCELLED)
+
+
+class Job:
+    """One submitted analysis"""
+
+    def __init__(self, params: Dict):
+        self.id = uuid.uuid4().hex
+        self.params = params
+        self.status = QUEUED
+        self.progress = {"frames_decoded": 0, "frames_detected": 0, "crops_embedded": 0}
+        self.result: Optional[Dict] = None
+        self.error: Optional[str] = None
+        self.created_at = datetime.now()
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self.cancel_event = threading.Event()
+        self.future: Optional[Future] = None
+        self.cleanup: Optional[Callable[[], None]] = None
+        # Files the job reads, kept from /cleanup until it has finished
+        self.files: List[str] = []
+        # Provisional matches etc., in order, for streaming clients (GET /jobs/{id}/events)
+        self.events: List[Dict] = []
+
+    def publish(self, event: str, data: Dict):
+        """Record an event for streaming clients (list append is atomic, no lock needed)"""
+        self.events.append({"event": event, "data": data})
+
+    def to_dict(self, include_result: bool = True) -> Dict:
+        data = {
+            "job_id": self.id,
+            "status": self.status,
+            "progress": dict(self.progress),
+            "created_at": self.created_at.isoformat(),
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+        }
+        if "priority" in self.params:
+            # Set by the admission controller: class, estimated cost, wait and run time
+            data["admission"] = {key: self.params[key] for key in ("priority", "cost", "estimate") if key in self.params}
+        if self.error is not None:
+            data["error"] = self.error
+        if include_result and self.result is not None:
+            data["result"] = self.result
+        return data
+
+
+class JobManager:
+    """
+    Bounded pool of analysis workers
+
+    Jobs beyond max_workers wait in the executor queue. With an admission
+    controller they wait in its priority queue instead, and are handed to
+    the executor only once the memory budget allows. Finished jobs are kept
+    for result_ttl seconds so clients can poll the result, then dropped.
+    """
+
+    def __init__(
+        self,
+        max_workers: int = 2,
+        result_ttl: float = 3600,
+        admission: Optional[AdmissionController] = None,
+        name: str = "analyze"
+    ):
+        """
+        Args:
+            max_workers: Analyses allowed to run at the same time
+            result_ttl: Seconds a finished job stays available for polling
+            admission: Shared budget and priority queue (None: plain FIFO)
+            name: Pool name in the admission controller
+        """
+        self.max_workers = max_workers
+        self.result_ttl = result_ttl
+        self.admission = admission
+        self.name = name
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="reid-job")
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+        if admission is not None:
+            admission.register_pool(name, max_workers)
+
+    def submit(
+        self,
+        run: Callable[[Job], Dict],
+        params: Optional[Dict] = None,
+        cleanup: Optional[Callable[[], None]] = None,
+        cost: Optional[JobCost] = None,
+        priority: str = "normal",
+        files: Sequence[str] = ()
+    ) -> Job:
+        """
+        Queue a job
+
+        Args:
+            run: Does the work; receives the Job (for progress/cancel_event), returns the result
+            params: Request parameters, echoed back for reference
+            cleanup: Called once the job is finished, whatever the outcome (e.g. delete uploads)
+            cost: Estimated resources, for the admission controller
+            priority: Admission priority class
+            files: Uploads the job reads (see files_in_use)
+        Returns:
+            job: The queued job
+        Raises:
+            AdmissionRejected: The admission controller turned the job away
+                (cleanup is not called)
+        """
+        self._prune()
+        job = Job(params or {})
+        job.cleanup = cleanup
+        job.files = [os.path.abspath(path) for path in files]
+
+        if self.admission is None:
+            with self._lock:
+                self._jobs[job.id] = job
+            job.future = self._executor.submit(self._execute, job, run)
+            return job
+
+        cost = cost or JobCost(JOB_BASE_MB, 0)
+        job.params.update(priority=priority, cost=cost.to_dict())
+        job.future = Future()
+        with self._lock:
+            self._jobs[job.id] = job
+        try:
+            job.params["estimate"] = self.admission.submit(
+                job.id, cost, priority, self.name, lambda: self._dispatch(job, run)
+            )
+        except Exception:
+            with self._lock:
+                del self._jobs[job.id]
+            raise
+        return job
+
+    def _dispatch(self, job: Job, run: Callable[[Job], Dict]) -> bool:
+        """Admitted: run the job on the executor (False if it was cancelled while queued)"""
+        if not job.future.set_running_or_notify_cancel():
+            return False
+        self._executor.submit(self._execute_admitted, job, run)
+        return True
+
+    def _execute_admitted(self, job: Job, run: Callable[[Job], Dict]):
+        start = time.perf_counter()
+        measured = None
+        try:
+            result = self._execute(job, run)
+            # Gallery hits decode nothing and would skew the work rate
+            if job.status == COMPLETED and not result.get("index", {}).get("cached"):
+                measured = time.perf_counter() - start
+            job.future.set_result(result)
+        except BaseException as e:
+            job.future.set_exception(e)
+        finally:
+            self.admission.release(job.id, measured)
+
+    def _execute(self, job: Job, run: Callable[[Job], Dict]) -> Optional[Dict]:
+        try:
+            if job.cancel_event.is_set():
+                job.status = CANCELLED
+                return None
+
+            job.status = RUNNING
+            job.started_at = datetime.now()
+            job.result = run(job)
+
+            if job.result.get("status") == "error":
+                job.status = FAILED
+                job.error = job.result.get("message")
+            else:
+                job.status = COMPLETED
+            return job.result
+        except AnalysisCancelled:
+            job.status = CANCELLED
+            return None
+        except Exception as e:
+            job.status = FAILED
+            job.error = str(e)
+            raise
+        finally:
+            self._finish(job)
+
+    def _finish(self, job: Job):
+        job.finished_at = datetime.now()
+        if job.cleanup is not None:
+            job.cleanup()
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self) -> List[Job]:
+        with self._lock:
+            return list(self._jobs.values())
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        """
+        Request cancellation; queued jobs never start, running jobs stop at the next frame
+        """
+        job = self.get(job_id)
+        if job is None:
+            return None
+
+        job.cancel_event.set()
+        if job.future is not None and job.future.cancel():
+            # Never started, so _execute will not clean up after it
+            job.status = CANCELLED
+            self._finish(job)
+            if self.admission is not None:
+                self.admission.remove(job.id)
+        return job
+
+    def files_in_use(self) -> Set[str]:
+        """Absolute paths of the files of every queued or running job"""
+        return {path for job in self.list() if job.status not in FINISHED_STATES for path in job.files}
+
+    def stats(self) -> Dict:
+        jobs = self.list()
+        return {
+            "max_workers": self.max_workers,
+            "queued": sum(job.status == QUEUED for job in jobs),
+            "running": sum(job.status == RUNNING for job in jobs),
+        }
+
+    def _prune(self):
+        """Forget finished jobs older than result_ttl"""
+        cutoff = time.time() - self.result_ttl
+        with self._lock:
+            expired = [
+                job_id for job_id, job in self._jobs.items()
+                if job.status in FINISHED_STATES and job.finished_at and job.finished_at.timestamp() < cutoff
+            ]
+            for job_id in expired:
+                del self._jobs[job_id]
+
+    def shutdown(self):
+        for job in self.list():
+            # Also resolves jobs still waiting for admission
+            self.cancel(job.id)
+        self._executor.shutdown(wait=True, cancel_futures=True)
@@ -3,16 +3,27 @@ FastAPI Server for Person Re-Identification
 Wraps the model service with HTTP endpoints
 """
 
-from fastapi import FastAPI, File, UploadFile, Form, HTTPException
+from fastapi import FastAPI, File, UploadFile, Form, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, StreamingResponse
+import asyncio
+import json
 import os
 import shutil
-from typing import Optional
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
 import uvicorn
 from datetime import datetime
 
-from model_service import get_service
+# model_service (torch, torchreid, ultralytics) is imported by the background
+# loader, so the server starts answering /live immediately
+from jobs import JobManager, Job, FINISHED_STATES
+from admission import AdmissionController, AdmissionRejected, JobCost, PRIORITIES, default_memory_budget, estimate_cost
+from ingest import unique_upload_path, resolve_local_media, receive_form
+from profiling import REGISTRY, Gauge, Histogram, PROFILE_MODES
+from workers import WorkerPool
+from adaptive import SEARCH_MODES
 
 # Initialize FastAPI app
 app = FastAPI(
@@ -39,24 +50,109 @@ UPLOAD_DIR = "uploads"
 os.makedirs(f"{UPLOAD_DIR}/images", exist_ok=True)
 os.makedirs(f"{UPLOAD_DIR}/videos", exist_ok=True)
 
-# Global service instance
+# Analyses allowed to run at the same time; the rest wait in the job queue
+MAX_CONCURRENT_JOBS = int(os.getenv("MAX_CONCURRENT_JOBS", "2"))
+
+# Videos of one /analyze-batch request analysed in parallel (default: one per core)
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", str(os.cpu_count() or 1)))
+
+# Match thumbnails stored for images=ref (bounding box "WIDTHxHEIGHT", JPEG quality)
+THUMBNAIL_SIZE = tuple(int(x) for x in os.getenv("THUMBNAIL_SIZE", "128x256").lower().split("x"))
+THUMBNAIL_QUALITY = int(os.getenv("THUMBNAIL_QUALITY", "80"))
+
+# How match images are returned: inline base64, artifact reference or none
+IMAGE_MODES = ("inline", "ref", "none")
+
+# Allow per-request profiler dumps (profile=cprofile|torch), written to profiles/
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() in ("1", "true", "yes")
+
+# Inference worker processes forked after model load (0 = analyses run in this process)
+WORKER_PROCESSES = int(os.getenv("WORKER_PROCESSES", "0"))
+WORKER_THREADS = int(os.getenv("WORKER_THREADS", "0"))  # per worker, 0 = its share of the CPUs
+WORKER_PIN_CPUS = os.getenv("WORKER_PIN_CPUS", "true").lower() in ("1", "true", "yes")
+
+# Admission control: estimated memory all running analyses may use together
+# (default: 60% of RAM), longest estimated queue wait a new job is accepted
+# with (longer: 429 + Retry-After), and jobs allowed to wait at once
+ADMISSION_MEMORY_MB = float(os.getenv("ADMISSION_MEMORY_MB", "0")) or default_memory_budget()
+ADMISSION_MAX_WAIT = float(os.getenv("ADMISSION_MAX_WAIT", "300"))
+ADMISSION_MAX_QUEUED = int(os.getenv("ADMISSION_MAX_QUEUED", "64"))
+
+# Job queue gauges, set on every /metrics scrape
+JOBS_GAUGE = REGISTRY.register(Gauge("reid_jobs", "Analysis jobs by pool and state", ("pool", "state")))
+WORKERS_GAUGE = REGISTRY.register(Gauge("reid_workers", "Inference worker processes by state", ("state",)))
+ARCHIVE_SEARCH_SECONDS = REGISTRY.register(Histogram(
+    "reid_archive_search_seconds", "Footage archive search latency by mode",
+    (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10), ("mode",)
+))
+
+# Global service instance (set once models are loaded and warmed up)
 service = None
+pool: Optional[WorkerPool] = None
+admission: Optional[AdmissionController] = None
+jobs: Optional[JobManager] = None
+batch_jobs: Optional[JobManager] = None
+
+# Background model loading: error message if it failed, and how long it took
+startup_error: Optional[str] = None
+startup_timings = {}
+
+
+def load_service():
+    """
+    Import the model code, load both models and warm them up (background thread)
+    
+    With WORKER_PROCESSES > 0 the worker processes are forked from the loaded
+    service and warm up on their own CPU slices.
+    """
+    global service, pool, startup_error
+    try:
+        start = time.perf_counter()
+        from model_service import get_service
+        startup_timings["import_seconds"] = round(time.perf_counter() - start, 2)
+        
+        loaded = get_service(
+            model_dir="models", thumbnail_size=THUMBNAIL_SIZE, thumbnail_quality=THUMBNAIL_QUALITY
+        )
+        startup_timings["load_seconds"] = round(time.perf_counter() - start, 2)
+        
+        startup_timings["warmup_seconds"] = round(loaded.warm_up(), 2)
+        
+        if WORKER_PROCESSES > 0:
+            workers = WorkerPool(loaded, WORKER_PROCESSES, WORKER_THREADS, WORKER_PIN_CPUS)
+            startup_timings["workers_seconds"] = round(workers.start(), 2)
+            pool = workers
+        service = loaded
+        print(f"✅ Service ready in {time.perf_counter() - start:.1f}s\n")
+    except Exception as e:
+        startup_error = str(e)
+        print(f"❌ Failed to initialize service: {e}\n")
 
 
 @app.on_event("startup")
 async def startup_event():
-    """Load models on startup"""
-    global service
+    """Start the worker pools and load models in the background"""
+    global jobs, batch_jobs, admission
     print("\n" + "="*80)
     print("🚀 STARTING PERSON RE-ID SERVICE")
     print("="*80 + "\n")
     
-    try:
-        service = get_service(model_dir="models")
-        print("✅ Service initialized successfully!\n")
-    except Exception as e:
-        print(f"❌ Failed to initialize service: {e}\n")
-        raise
+    # One memory budget for both pools; /analyze-batch videos queue behind interactive work
+    admission = AdmissionController(ADMISSION_MEMORY_MB, ADMISSION_MAX_WAIT, ADMISSION_MAX_QUEUED)
+    # Enough job threads to keep every worker process busy
+    jobs = JobManager(max_workers=max(MAX_CONCURRENT_JOBS, WORKER_PROCESSES), admission=admission, name="analyze")
+    batch_jobs = JobManager(max_workers=BATCH_WORKERS, admission=admission, name="batch")
+    threading.Thread(target=load_service, name="reid-model-load", daemon=True).start()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Cancel running analyses and stop the worker pools and processes"""
+    for manager in (jobs, batch_jobs):
+        if manager is not None:
+            manager.shutdown()
+    if pool is not None:
+        pool.shutdown()
 
 
 @app.get("/")
@@ -68,11 +164,41 @@ async def root():
         "status": "running",
         "endpoints": {
             "analyze": "POST /analyze",
-            "health": "GET /health"
+            "analyze_multi": "POST /analyze-multi",
+            "submit_job": "POST /jobs",
+            "submit_job_streamed": "POST /jobs/stream",
+            "job_status": "GET /jobs/{job_id}",
+            "job_events": "GET /jobs/{job_id}/events",
+            "search": "POST /search",
+            "artifact": "GET /artifacts/{artifact_id}.jpg",
+            "cancel_job": "DELETE /jobs/{job_id}",
+            "health": "GET /health",
+            "metrics": "GET /metrics",
+            "live": "GET /live",
+            "ready": "GET /ready"
         }
     }
 
 
+@app.get("/live")
+async def liveness():
+    """Liveness probe: the process is up (models may still be loading)"""
+    return {"status": "alive"}
+
+
+@app.get("/ready")
+async def readiness():
+    """Readiness probe: 200 only once models are loaded and warmed up"""
+    if service is not None:
+        return {"status": "ready", "device": str(service.device), "startup": startup_timings}
+    
+    status = "failed" if startup_error is not None else "loading"
+    content = {"status": status, "startup": startup_timings}
+    if startup_error is not None:
+        content["error"] = startup_error
+    return JSONResponse(status_code=503, content=content)
+
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
@@ -83,38 +209,63 @@ async def health_check():
         "status": "healthy",
         "models_loaded": True,
         "device": str(service.device),
+        "jobs": jobs.stats() if jobs is not None else None,
+        "admission": admission.stats() if admission is not None else None,
+        "workers": pool.stats() if pool is not None else None,
+        "archive": service.archive.stats() if service.archive is not None else None,
         "timestamp": datetime.now().isoformat()
     }
 
 
-@app.post("/analyze")
-async def analyze_video(
-    reference_image: UploadFile = File(..., description="Reference person image"),
-    video: UploadFile = File(..., description="CCTV video footage"),
-    threshold: Optional[float] = Form(0.70, description="Similarity threshold (0.0-1.0)"),
-    top_n: Optional[int] = Form(3, description="Number of top matches to return")
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus metrics: per-stage time, throughput, batch sizes, crowd density, job queue"""
+    for name, manager in (("analyze", jobs), ("batch", batch_jobs)):
+        if manager is not None:
+            stats = manager.stats()
+            JOBS_GAUGE.set(stats["queued"], pool=name, state="queued")
+            JOBS_GAUGE.set(stats["running"], pool=name, state="running")
+    if pool is not None:
+        stats = pool.stats()
+        WORKERS_GAUGE.set(stats["busy"], state="busy")
+        WORKERS_GAUGE.set(stats["workers"] - stats["busy"], state="idle")
+    
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+
+def validate_analysis_request(
+    reference_image: Optional[UploadFile],
+    video: Optional[UploadFile],
+    threshold: float,
+    top_n: int,
+    samples_per_second: Optional[float],
+    motion_threshold: Optional[float] = None,
+    images: str = "inline",
+    profile: Optional[str] = None,
+    camera: Optional[str] = None,
+    roi: Optional[str] = None,
+    search: str = "fixed",
+    interest_threshold: Optional[float] = None,
+    track: bool = False,
+    segments: int = 0,
+    recorded_at: Optional[str] = None,
+    priority: str = "normal",
+    job_pool: str = "analyze"
 ):
     """
-    Analyze video for person re-identification
-    
-    Args:
-        reference_image: Image of person to find
-        video: CCTV footage to search
-        threshold: Minimum similarity score (default: 0.70)
-        top_n: Number of top matches to return (default: 3)
+    Shared validation for /analyze and /jobs (files may be None when given by path)
     
-    Returns:
-        JSON with matches, confidence scores, and images
+    Ends with the admission check, so a saturated server answers 429 before
+    the job's cost is estimated.
     """
-    
-    if service is None:
-        raise HTTPException(status_code=503, detail="Service not initialized")
+    if service is None or jobs is None:
+        raise HTTPException(status_code=503, detail="Service not ready (models loading)")
     
     # Validate files
-    if not reference_image.content_type.startswith("image/"):
+    if reference_image is not None and not (reference_image.content_type or "").startswith("image/"):
         raise HTTPException(status_code=400, detail="Reference must be an image file")
     
-    if not video.content_type.startswith("video/"):
+    if video is not None and not (video.content_type or "").startswith("video/"):
         raise HTTPException(status_code=400, detail="Video file required")
     
     # Validate parameters
@@ -124,108 +275,849 @@ async def analyze_video(
     if top_n < 1 or top_n > 10:
         raise HTTPException(status_code=400, detail="top_n must be between 1 and 10")
     
-    # Save uploaded files temporarily
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    if samples_per_second is not None and not 0.0 < samples_per_second <= 60.0:
+        raise HTTPException(status_code=400, detail="samples_per_second must be between 0 and 60")
+    
+    if motion_threshold is not None and not 0.0 < motion_threshold < 1.0:
+        raise HTTPException(status_code=400, detail="motion_threshold must be between 0 and 1")
+    
+    if images not in IMAGE_MODES:
+        raise HTTPException(status_code=400, detail=f"images must be one of {', '.join(IMAGE_MODES)}")
+    
+    if profile is not None:
+        if not PROFILING_ENABLED:
+            raise HTTPException(status_code=403, detail="Profiling is disabled (set PROFILING_ENABLED=true)")
+        if profile not in PROFILE_MODES:
+            raise HTTPException(status_code=400, detail=f"profile must be one of {', '.join(PROFILE_MODES)}")
+    
+    if camera is not None or roi is not None:
+        try:
+            service.detector_settings(camera, roi)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    
+    if search not in SEARCH_MODES:
+        raise HTTPException(status_code=400, detail=f"search must be one of {', '.join(SEARCH_MODES)}")
+    
+    if search == "adaptive" and track:
+        raise HTTPException(status_code=400, detail="search=adaptive cannot be combined with track")
+    
+    if interest_threshold is not None and not 0.0 <= interest_threshold <= 1.0:
+        raise HTTPException(status_code=400, detail="interest_threshold must be between 0.0 and 1.0")
+    
+    if segments < 0 or segments > 256:
+        raise HTTPException(status_code=400, detail="segments must be between 0 and 256")
+    
+    if segments > 1:
+        if pool is None:
+            raise HTTPException(status_code=400, detail="segments needs worker processes (set WORKER_PROCESSES)")
+        if track or search != "fixed":
+            raise HTTPException(status_code=400, detail="segments cannot be combined with track or search=adaptive")
+    
+    if recorded_at is not None:
+        parse_time(recorded_at, "recorded_at")
+    
+    if priority not in PRIORITIES:
+        raise HTTPException(status_code=400, detail=f"priority must be one of {', '.join(PRIORITIES)}")
     
     try:
-        # Save reference image
-        image_path = f"{UPLOAD_DIR}/images/ref_{timestamp}.jpg"
-        with open(image_path, "wb") as buffer:
-            shutil.copyfileobj(reference_image.file, buffer)
-        
-        # Save video
-        video_ext = os.path.splitext(video.filename)[1]
-        video_path = f"{UPLOAD_DIR}/videos/video_{timestamp}{video_ext}"
-        with open(video_path, "wb") as buffer:
-            shutil.copyfileobj(video.file, buffer)
-        
-        print(f"\n📁 Files saved:")
+        admission.check(job_pool, priority)
+    except AdmissionRejected as e:
+        raise busy(e)
+
+
+def busy(e: AdmissionRejected) -> HTTPException:
+    """429 telling the client when to try again"""
+    return HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+
+def job_cost(
+    video_path: str,
+    samples_per_second: Optional[float],
+    search: str = "fixed",
+    segments: int = 0,
+    temp_files: List[str] = ()
+) -> JobCost:
+    """Estimated cost of analyzing a staged video, from its container metadata (no decoding)"""
+    try:
+        video_info = service.get_video_info(video_path)
+    except ValueError as e:
+        remove_files(*temp_files)
+        raise HTTPException(status_code=400, detail=f"Cannot read video: {str(e)}")
+    buffered = service.frame_queue_size + service.detection_queue_size + service.detect_batch_size
+    return estimate_cost(
+        video_info, os.path.getsize(video_path), buffered,
+        samples_per_second=samples_per_second, search=search, segments=segments
+    )
+
+
+def parse_time(value: str, field: str) -> datetime:
+    """ISO 8601 form field as a naive local time (the archive's clock)"""
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"{field} must be an ISO 8601 time, e.g. 2024-05-01T13:45:00")
+    return parsed.astimezone().replace(tzinfo=None) if parsed.tzinfo is not None else parsed
+
+
+def save_upload(upload: UploadFile, path: str) -> str:
+    """Copy one uploaded file to disk"""
+    with open(path, "wb") as buffer:
+        shutil.copyfileobj(upload.file, buffer)
+    return path
+
+
+def save_uploads(reference_images: List[UploadFile], videos: List[UploadFile]) -> Tuple[List[str], List[str]]:
+    """Save uploaded files temporarily under unique names, returns (image_paths, video_paths)"""
+    image_paths = [
+        save_upload(reference_image, unique_upload_path(f"{UPLOAD_DIR}/images", "ref", reference_image.filename, ".jpg"))
+        for reference_image in reference_images
+    ]
+    video_paths = [
+        save_upload(video, unique_upload_path(f"{UPLOAD_DIR}/videos", "video", video.filename))
+        for video in videos
+    ]
+    
+    print(f"\n📁 Files saved:")
+    for image_path in image_paths:
         print(f"   Image: {image_path}")
+    for video_path in video_paths:
         print(f"   Video: {video_path}")
+    
+    return image_paths, video_paths
+
+
+def remove_files(*paths: str):
+    """Delete temporary files, ignoring ones already gone"""
+    for path in paths:
+        try:
+            if os.path.exists(path):
+                os.remove(path)
+        except OSError:
+            pass
+
+
+def stage_inputs(
+    reference_images: List[UploadFile],
+    video: Optional[UploadFile],
+    reference_image_path: Optional[str] = None,
+    video_path: Optional[str] = None
+) -> Tuple[List[str], str, str, List[str]]:
+    """
+    Put the analysis inputs on local disk
+    
+    Uploads are saved under unique names; server-local path references
+    (LOCAL_MEDIA_ROOTS) are used in place, without any copy.
+    
+    Returns:
+        image_paths, video_path, video_name, temp_files (saved uploads to delete afterwards)
+    """
+    if not reference_images and not reference_image_path:
+        raise HTTPException(status_code=400, detail="reference_image or reference_image_path required")
+    if video is None and not video_path:
+        raise HTTPException(status_code=400, detail="video or video_path required")
+    
+    try:
+        image_paths = [] if reference_images else [resolve_local_media(reference_image_path)]
+        local_video = None if video is not None else resolve_local_media(video_path)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    saved_images, saved_videos = save_uploads(reference_images, [video] if video is not None else [])
+    image_paths = saved_images or image_paths
+    video_name = video.filename if video is not None else os.path.basename(local_video)
+    return image_paths, local_video or saved_videos[0], video_name, saved_images + saved_videos
+
+
+def run_analysis(job: Job, on_match: Optional[Callable[[Dict], None]] = None, **kwargs) -> Dict:
+    """service.analyze for a job, in a worker process when WORKER_PROCESSES > 0"""
+    def on_progress(progress):
+        job.progress = progress
+    
+    if pool is not None and kwargs.get("segments", 0) > 1:
+        # Runs here and hands the video's segments to the workers
+        return service.analyze(progress=on_progress, on_match=on_match, cancel_event=job.cancel_event, segment_pool=pool, **kwargs)
+    analyze = pool.analyze if pool is not None else service.analyze
+    return analyze(progress=on_progress, on_match=on_match, cancel_event=job.cancel_event, **kwargs)
+
+
+def submit_analysis(
+    image_paths: List[str],
+    video_path: str,
+    video_name: str,
+    threshold: float,
+    top_n: int,
+    samples_per_second: Optional[float],
+    identities: Optional[List[str]] = None,
+    fusion: str = "max",
+    track: bool = False,
+    motion_threshold: Optional[float] = None,
+    temp_files: List[str] = (),
+    images: str = "inline",
+    profile: Optional[str] = None,
+    camera: Optional[str] = None,
+    roi: Optional[str] = None,
+    search: str = "fixed",
+    interest_threshold: Optional[float] = None,
+    segments: int = 0,
+    recorded_at: Optional[str] = None,
+    cost: Optional[JobCost] = None,
+    priority: str = "normal"
+) -> Job:
+    """
+    Queue the analysis in the worker pool; temp_files are deleted once it finishes
+    
+    Raises:
+        HTTPException: 429 if admission control turns the job away
+    """
+    
+    def run(job: Job):
+        def on_match(match):
+            job.publish("match", match)
         
-        # Run analysis
-        print(f"\n🔍 Starting analysis (threshold={threshold}, top_n={top_n})...")
-        results = service.analyze(
-            reference_image_path=image_path,
+        print(f"\n🔍 Starting analysis {job.id} (threshold={threshold}, top_n={top_n})...")
+        return run_analysis(
+            job,
+            reference_image_path=image_paths[0] if len(image_paths) == 1 else image_paths,
             video_path=video_path,
             threshold=threshold,
-            top_n=top_n
+            top_n=top_n,
+            samples_per_second=samples_per_second,
+            identities=identities,
+            fusion=fusion,
+            track=track,
+            motion_threshold=motion_threshold,
+            images=images,
+            on_match=on_match,
+            profile=profile,
+            camera=camera,
+            roi=roi,
+            search=search,
+            interest_threshold=interest_threshold,
+            segments=segments,
+            recorded_at=parse_time(recorded_at, "recorded_at").isoformat() if recorded_at else None
         )
-        
-        # Clean up files (optional - comment out for debugging)
-        try:
-            os.remove(image_path)
-            os.remove(video_path)
-            print("🗑️  Temporary files cleaned up")
-        except:
-            pass
-        
+    
+    def cleanup():
+        # Clean up uploads (optional - comment out for debugging); path references are left alone
+        remove_files(*temp_files)
+        print("🗑️  Temporary files cleaned up")
+    
+    params = {
+        "video_name": video_name,
+        "threshold": threshold,
+        "top_n": top_n,
+        "samples_per_second": samples_per_second,
+        "references": len(image_paths),
+        "track": track,
+        "motion_threshold": motion_threshold,
+        "images": images,
+        "profile": profile,
+        "camera": camera,
+        "roi": roi,
+        "search": search,
+        "interest_threshold": interest_threshold,
+        "segments": segments,
+        "recorded_at": recorded_at
+    }
+    
+    try:
+        return jobs.submit(run, params=params, cleanup=cleanup, cost=cost, priority=priority, files=temp_files)
+    except AdmissionRejected as e:
+        cleanup()
+        raise busy(e)
+    except Exception:
+        cleanup()
+        raise
+
+
+@app.post("/analyze")
+async def analyze_video(
+    reference_image: Optional[UploadFile] = File(None, description="Reference person image"),
+    video: Optional[UploadFile] = File(None, description="CCTV video footage"),
+    reference_image_path: Optional[str] = Form(None, description="Server-local path or file:// URI instead of uploading (under LOCAL_MEDIA_ROOTS)"),
+    video_path: Optional[str] = Form(None, description="Server-local path or file:// URI instead of uploading (under LOCAL_MEDIA_ROOTS)"),
+    threshold: Optional[float] = Form(0.70, description="Similarity threshold (0.0-1.0)"),
+    top_n: Optional[int] = Form(3, description="Number of top matches to return"),
+    samples_per_second: Optional[float] = Form(None, description="Frames to sample per second of video (default: every 30th frame)"),
+    track: Optional[bool] = Form(False, description="Group detections into tracklets and return one match per appearance"),
+    motion_threshold: Optional[float] = Form(None, description="Skip frames where less than this fraction of the image changed (e.g. 0.002)"),
+    images: Optional[str] = Form("inline", description="Match images: 'inline' base64, 'ref' (stored thumbnail, GET /artifacts/...) or 'none'"),
+    profile: Optional[str] = Form(None, description="Dump a 'cprofile' or 'torch' profile of this analysis (needs PROFILING_ENABLED)"),
+    camera: Optional[str] = Form(None, description="Camera name from the detector config (ROI, YOLO input size)"),
+    roi: Optional[str] = Form(None, description="Region to search in fractions of the frame: 'x1,y1,x2,y2' or polygon 'x,y;x,y;x,y'"),
+    search: Optional[str] = Form("fixed", description="'fixed' sampling, or 'adaptive': sample sparsely, then densely around promising detections"),
+    interest_threshold: Optional[float] = Form(None, description="Similarity that triggers denser sampling in adaptive search (default: threshold - 0.10)"),
+    segments: Optional[int] = Form(0, description="Split a long video into this many time segments analyzed in parallel (needs WORKER_PROCESSES)"),
+    recorded_at: Optional[str] = Form(None, description="ISO time of the first frame, for the footage archive (default: file time minus duration)")
+):
+    """
+    Analyze video for person re-identification
+    
+    Runs in the job worker pool and waits for the result, so the server stays
+    responsive while the analysis is running. Use POST /jobs to get a job id
+    back immediately instead.
+    
+    Args:
+        reference_image: Image of person to find (or reference_image_path)
+        video: CCTV footage to search (or video_path, read in place without upload)
+        threshold: Minimum similarity score (default: 0.70)
+        top_n: Number of top matches to return (default: 3)
+        samples_per_second: Sampling rate in frames per second of video (optional)
+        track: Match tracklets instead of single frames (optional)
+        motion_threshold: Skip static frames before detection (optional)
+        images: "inline" (default), "ref" or "none" (optional)
+        profile: "cprofile" or "torch" profiler dump (optional, PROFILING_ENABLED)
+        camera: Camera name from the detector config (optional)
+        roi: Region of the frame to search, overrides the camera's (optional)
+        search: "fixed" (default) or "adaptive" coarse-to-fine sampling (optional)
+        interest_threshold: Refinement trigger for adaptive search (optional)
+        segments: Time segments analyzed in parallel worker processes (optional)
+        recorded_at: Recording start time for the footage archive (optional)
+    
+    Returns:
+        JSON with matches, confidence scores, and images
+    """
+    
+    validate_analysis_request(
+        reference_image, video, threshold, top_n, samples_per_second, motion_threshold, images, profile, camera, roi,
+        search, interest_threshold, track, segments, recorded_at, priority="interactive"
+    )
+    
+    try:
+        image_paths, local_video, video_name, temp_files = await asyncio.to_thread(
+            stage_inputs, [reference_image] if reference_image else [], video, reference_image_path, video_path
+        )
+        cost = await asyncio.to_thread(job_cost, local_video, samples_per_second, search, segments, temp_files)
+        job = submit_analysis(
+            image_paths, local_video, video_name, threshold, top_n, samples_per_second,
+            track=track, motion_threshold=motion_threshold, temp_files=temp_files,
+            images=images, profile=profile, camera=camera, roi=roi,
+            search=search, interest_threshold=interest_threshold, segments=segments,
+            recorded_at=recorded_at, cost=cost, priority="interactive"
+        )
+        results = await asyncio.wrap_future(job.future)
+        if results is None:
+            raise HTTPException(status_code=409, detail="Analysis cancelled")
         return JSONResponse(content=results)
         
+    except HTTPException:
+        raise
     except Exception as e:
-        # Clean up files on error
-        try:
-            if os.path.exists(image_path):
-                os.remove(image_path)
-            if os.path.exists(video_path):
-                os.remove(video_path)
-        except:
-            pass
+        print(f"\n❌ Error: {e}")
+        raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
+
+
+@app.post("/analyze-multi")
+async def analyze_multi(
+    reference_images: list[UploadFile] = File(..., description="Reference images (several photos and/or several people)"),
+    video: Optional[UploadFile] = File(None, description="CCTV video footage"),
+    video_path: Optional[str] = Form(None, description="Server-local path or file:// URI instead of uploading (under LOCAL_MEDIA_ROOTS)"),
+    identities: Optional[str] = Form(None, description="Comma-separated identity label per reference image (default: all the same person)"),
+    fusion: Optional[str] = Form("max", description="Combine photos of one identity by 'max' score or 'mean' feature"),
+    threshold: Optional[float] = Form(0.70, description="Similarity threshold (0.0-1.0)"),
+    top_n: Optional[int] = Form(3, description="Number of top matches to return per identity"),
+    samples_per_second: Optional[float] = Form(None, description="Frames to sample per second of video (default: every 30th frame)"),
+    track: Optional[bool] = Form(False, description="Group detections into tracklets and return one match per appearance"),
+    motion_threshold: Optional[float] = Form(None, description="Skip frames where less than this fraction of the image changed (e.g. 0.002)"),
+    images: Optional[str] = Form("inline", description="Match images: 'inline' base64, 'ref' (stored thumbnail, GET /artifacts/...) or 'none'"),
+    camera: Optional[str] = Form(None, description="Camera name from the detector config (ROI, YOLO input size)"),
+    roi: Optional[str] = Form(None, description="Region to search in fractions of the frame: 'x1,y1,x2,y2' or polygon 'x,y;x,y;x,y'")
+):
+    """
+    Search one video for several reference images in a single pass
+    
+    Every detected person is scored against all references at once, so K
+    references cost about the same as one. Photos sharing an identity label
+    are fused; the response has overall matches plus an "identities" section
+    with matches per identity.
+    """
+    
+    if not reference_images or len(reference_images) > 20:
+        raise HTTPException(status_code=400, detail="Between 1 and 20 reference images required")
+    
+    for reference_image in reference_images:
+        if not (reference_image.content_type or "").startswith("image/"):
+            raise HTTPException(status_code=400, detail="Reference must be an image file")
+    
+    labels = None
+    if identities:
+        labels = [label.strip() for label in identities.split(",")]
+        if len(labels) != len(reference_images) or not all(labels):
+            raise HTTPException(status_code=400, detail="identities must have one non-empty label per reference image")
+    
+    if fusion not in ("max", "mean"):
+        raise HTTPException(status_code=400, detail="fusion must be 'max' or 'mean'")
+    
+    # One request, one admission check, however many reference images
+    validate_analysis_request(
+        None, video, threshold, top_n, samples_per_second, motion_threshold, images,
+        camera=camera, roi=roi, priority="interactive"
+    )
+    
+    try:
+        image_paths, local_video, video_name, temp_files = await asyncio.to_thread(
+            stage_inputs, reference_images, video, None, video_path
+        )
+        cost = await asyncio.to_thread(job_cost, local_video, samples_per_second, temp_files=temp_files)
+        job = submit_analysis(
+            image_paths, local_video, video_name, threshold, top_n, samples_per_second, labels, fusion, track,
+            motion_threshold, temp_files, images, camera=camera, roi=roi, cost=cost, priority="interactive"
+        )
+        results = await asyncio.wrap_future(job.future)
+        if results is None:
+            raise HTTPException(status_code=409, detail="Analysis cancelled")
+        return JSONResponse(content=results)
         
+    except HTTPException:
+        raise
+    except Exception as e:
         print(f"\n❌ Error: {e}")
         raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
 
 
+@app.post("/jobs", status_code=202)
+async def create_job(
+    reference_image: Optional[UploadFile] = File(None, description="Reference person image"),
+    video: Optional[UploadFile] = File(None, description="CCTV video footage"),
+    reference_image_path: Optional[str] = Form(None, description="Server-local path or file:// URI instead of uploading (under LOCAL_MEDIA_ROOTS)"),
+    video_path: Optional[str] = Form(None, description="Server-local path or file:// URI instead of uploading (under LOCAL_MEDIA_ROOTS)"),
+    threshold: Optional[float] = Form(0.70, description="Similarity threshold (0.0-1.0)"),
+    top_n: Optional[int] = Form(3, description="Number of top matches to return"),
+    samples_per_second: Optional[float] = Form(None, description="Frames to sample per second of video (default: every 30th frame)"),
+    track: Optional[bool] = Form(False, description="Group detections into tracklets and return one match per appearance"),
+    motion_threshold: Optional[float] = Form(None, description="Skip frames where less than this fraction of the image changed (e.g. 0.002)"),
+    images: Optional[str] = Form("inline", description="Match images: 'inline' base64, 'ref' (stored thumbnail, GET /artifacts/...) or 'none'"),
+    profile: Optional[str] = Form(None, description="Dump a 'cprofile' or 'torch' profile of this analysis (needs PROFILING_ENABLED)"),
+    camera: Optional[str] = Form(None, description="Camera name from the detector config (ROI, YOLO input size)"),
+    roi: Optional[str] = Form(None, description="Region to search in fractions of the frame: 'x1,y1,x2,y2' or polygon 'x,y;x,y;x,y'"),
+    search: Optional[str] = Form("fixed", description="'fixed' sampling, or 'adaptive': sample sparsely, then densely around promising detections"),
+    interest_threshold: Optional[float] = Form(None, description="Similarity that triggers denser sampling in adaptive search (default: threshold - 0.10)"),
+    segments: Optional[int] = Form(0, description="Split a long video into this many time segments analyzed in parallel (needs WORKER_PROCESSES)"),
+    recorded_at: Optional[str] = Form(None, description="ISO time of the first frame, for the footage archive (default: file time minus duration)"),
+    priority: Optional[str] = Form("normal", description="Admission priority: 'interactive', 'normal' or 'batch'")
+):
+    """
+    Submit a video analysis job
+    
+    Returns immediately with a job id; poll GET /jobs/{job_id} for progress
+    and the final result. The job waits for admission (see ADMISSION_*)
+    before it starts; 429 with Retry-After when the server is saturated.
+    """
+    
+    validate_analysis_request(
+        reference_image, video, threshold, top_n, samples_per_second, motion_threshold, images, profile, camera, roi,
+        search, interest_threshold, track, segments, recorded_at, priority
+    )
+    
+    try:
+        image_paths, local_video, video_name, temp_files = await asyncio.to_thread(
+            stage_inputs, [reference_image] if reference_image else [], video, reference_image_path, video_path
+        )
+        cost = await asyncio.to_thread(job_cost, local_video, samples_per_second, search, segments, temp_files)
+        job = submit_analysis(
+            image_paths, local_video, video_name, threshold, top_n, samples_per_second,
+            track=track, motion_threshold=motion_threshold, temp_files=temp_files,
+            images=images, profile=profile, camera=camera, roi=roi,
+            search=search, interest_threshold=interest_threshold, segments=segments,
+            recorded_at=recorded_at, cost=cost, priority=priority
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"\n❌ Error: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to submit job: {str(e)}")
+    
+    return job.to_dict()
+
+
+@app.post("/jobs/stream", status_code=202)
+async def create_job_streamed(request: Request):
+    """
+    Submit a video analysis job, streaming the multipart body straight to disk
+    
+    Same form fields as POST /jobs, but the upload is parsed as it arrives and
+    each file is written once to its final path (no spooled temp file to
+    copy). Decoding starts once the body is complete: MP4 files often carry
+    their index at the end.
+    """
+    if service is None or jobs is None:
+        raise HTTPException(status_code=503, detail="Service not ready (models loading)")
+    
+    # The priority field is in the body: turn the upload away before reading it
+    # only if even an interactive job would be rejected
+    try:
+        admission.check("analyze", "interactive")
+    except AdmissionRejected as e:
+        raise busy(e)
+    
+    try:
+        form = await receive_form(request, {
+            "reference_image": f"{UPLOAD_DIR}/images",
+            "video": f"{UPLOAD_DIR}/videos"
+        })
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Malformed upload: {str(e)}")
+    
+    temp_files = form.paths()
+    try:
+        try:
+            threshold = float(form.field("threshold") or 0.70)
+            top_n = int(form.field("top_n") or 3)
+            samples_per_second = float(form.field("samples_per_second")) if form.field("samples_per_second") else None
+            motion_threshold = float(form.field("motion_threshold")) if form.field("motion_threshold") else None
+            interest_threshold = float(form.field("interest_threshold")) if form.field("interest_threshold") else None
+            segments = int(form.field("segments") or 0)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid numeric form field")
+        track = (form.field("track") or "false").lower() in ("1", "true", "yes", "on")
+        images = form.field("images") or "inline"
+        profile = form.field("profile")
+        camera = form.field("camera")
+        roi = form.field("roi")
+        search = form.field("search") or "fixed"
+        recorded_at = form.field("recorded_at")
+        priority = form.field("priority") or "normal"
+        
+        reference_image = (form.files.get("reference_image") or [None])[0]
+        video = (form.files.get("video") or [None])[0]
+        validate_analysis_request(
+            reference_image, video, threshold, top_n, samples_per_second, motion_threshold, images, profile, camera, roi,
+            search, interest_threshold, track, segments, recorded_at, priority
+        )
+        if reference_image is None and form.field("reference_image_path") is None:
+            raise HTTPException(status_code=400, detail="reference_image or reference_image_path required")
+        if video is None and form.field("video_path") is None:
+            raise HTTPException(status_code=400, detail="video or video_path required")
+        
+        try:
+            image_paths = [reference_image.path] if reference_image else [
+                resolve_local_media(form.field("reference_image_path"))
+            ]
+            video_path = video.path if video else resolve_local_media(form.field("video_path"))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        video_name = video.filename if video else os.path.basename(video_path)
+        cost = await asyncio.to_thread(job_cost, video_path, samples_per_second, search, segments)
+        
+        return submit_analysis(
+            image_paths, video_path, video_name, threshold, top_n, samples_per_second,
+            track=track, motion_threshold=motion_threshold, temp_files=temp_files,
+            images=images, profile=profile, camera=camera, roi=roi,
+            search=search, interest_threshold=interest_threshold, segments=segments,
+            recorded_at=recorded_at, cost=cost, priority=priority
+        ).to_dict()
+    except BaseException:
+        remove_files(*temp_files)
+        raise
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """
+    Job status, progress (frames decoded, frames detected, crops embedded)
+    and, once completed, the analysis result
+    """
+    if jobs is None:
+        raise HTTPException(status_code=503, detail="Service not initialized")
+    
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    return job.to_dict()
+
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str, format: str = "ndjson"):
+    """
+    Stream a job's events as they happen (format: "ndjson" or "sse")
+    
+    Events: "match" for each provisional match as it is found, "progress"
+    when the counters change, and a final "completed" (with the result),
+    "failed" or "cancelled". Earlier events are replayed first, so clients
+    can connect at any time.
+    """
+    if jobs is None:
+        raise HTTPException(status_code=503, detail="Service not initialized")
+    if format not in ("ndjson", "sse"):
+        raise HTTPException(status_code=400, detail="format must be 'ndjson' or 'sse'")
+    
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    def encode(event: str, data) -> str:
+        if format == "sse":
+            return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+        return json.dumps({"event": event, "data": data}) + "\n"
+    
+    async def stream():
+        sent, progress = 0, None
+        while True:
+            finished = job.status in FINISHED_STATES
+            while sent < len(job.events):
+                yield encode(job.events[sent]["event"], job.events[sent]["data"])
+                sent += 1
+            if job.progress != progress:
+                progress = dict(job.progress)
+                yield encode("progress", progress)
+            if finished:
+                break
+            await asyncio.sleep(0.25)
+        
+        final = job.to_dict()
+        yield encode(job.status, final.get("result") or final)
+    
+    media_type = "text/event-stream" if format == "sse" else "application/x-ndjson"
+    return StreamingResponse(stream(), media_type=media_type, headers={"Cache-Control": "no-cache"})
+
+
+@app.post("/search")
+async def search_archive(
+    reference_images: Optional[list[UploadFile]] = File(None, description="Photos of the person (any number)"),
+    reference_image_path: Optional[str] = Form(None, description="Server-local path or file:// URI instead of uploading (under LOCAL_MEDIA_ROOTS)"),
+    top_k: Optional[int] = Form(20, description="Number of detections to return"),
+    cameras: Optional[str] = Form(None, description="Comma-separated camera names (default: all)"),
+    since: Optional[str] = Form(None, description="Only footage recorded at or after this ISO time"),
+    until: Optional[str] = Form(None, description="Only footage recorded at or before this ISO time"),
+    nprobe: Optional[int] = Form(16, description="Index lists probed per reference photo: higher finds more, slower"),
+    rerank: Optional[int] = Form(200, description="Candidates re-scored with the full features (0: compressed scores only)"),
+    exact: Optional[bool] = Form(False, description="Score every stored detection (slow; ground truth)"),
+    min_similarity: Optional[float] = Form(None, description="Drop results below this similarity")
+):
+    """
+    Find a person across every video analyzed so far
+    
+    Searches the footage archive (detections of all indexed videos, sharded
+    by camera and day) instead of decoding any video. Each result is one
+    detection with its camera, wall-clock time, video and frame.
+    
+    Returns:
+        JSON with results ordered by similarity, and search statistics
+    """
+    if service is None:
+        raise HTTPException(status_code=503, detail="Service not ready (models loading)")
+    if service.archive is None:
+        raise HTTPException(status_code=404, detail="Footage archive is disabled")
+    
+    if not reference_images and not reference_image_path:
+        raise HTTPException(status_code=400, detail="reference_images or reference_image_path required")
+    for reference_image in reference_images or []:
+        if not (reference_image.content_type or "").startswith("image/"):
+            raise HTTPException(status_code=400, detail="Reference must be an image file")
+    if top_k < 1 or top_k > 1000:
+        raise HTTPException(status_code=400, detail="top_k must be between 1 and 1000")
+    if nprobe < 1:
+        raise HTTPException(status_code=400, detail="nprobe must be at least 1")
+    if rerank < 0 or rerank > 100000:
+        raise HTTPException(status_code=400, detail="rerank must be between 0 and 100000")
+    if min_similarity is not None and not -1.0 <= min_similarity <= 1.0:
+        raise HTTPException(status_code=400, detail="min_similarity must be between -1.0 and 1.0")
+    since_time = parse_time(since, "since") if since else None
+    until_time = parse_time(until, "until") if until else None
+    camera_names = [name.strip() for name in cameras.split(",") if name.strip()] if cameras else None
+    
+    try:
+        image_paths = [] if reference_images else [resolve_local_media(reference_image_path)]
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    saved_images, _ = await asyncio.to_thread(save_uploads, reference_images or [], [])
+    
+    try:
+        references = await asyncio.to_thread(service.build_references, saved_images or image_paths)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Cannot read reference image: {str(e)}")
+    finally:
+        remove_files(*saved_images)
+    
+    results = await asyncio.to_thread(
+        service.archive.search, references.matrix, top_k, nprobe, rerank, exact,
+        camera_names, since_time, until_time, min_similarity
+    )
+    ARCHIVE_SEARCH_SECONDS.observe(results["search"]["seconds"], mode=results["search"]["mode"])
+    return JSONResponse(content=results)
+
+
+@app.get("/artifacts/{artifact_id}.jpg")
+async def get_artifact(artifact_id: str):
+    """Match thumbnail stored by an images=ref analysis (content-addressed, never changes)"""
+    path = service.artifacts.path(artifact_id) if service is not None and service.artifacts else None
+    if path is None:
+        raise HTTPException(status_code=404, detail="Artifact not found")
+    
+    # Still in use: restarts its retention period for /cleanup?artifact_max_age_days
+    service.artifacts.touch(path)
+    
+    return FileResponse(path, media_type="image/jpeg", headers={"Cache-Control": "public, max-age=31536000, immutable"})
+
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    """Cancel a queued or running job"""
+    if jobs is None:
+        raise HTTPException(status_code=503, detail="Service not initialized")
+    
+    job = jobs.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    return job.to_dict(include_result=False)
+
+
 @app.post("/analyze-batch")
 async def analyze_batch(
     reference_image: UploadFile = File(...),
     videos: list[UploadFile] = File(...),
     threshold: Optional[float] = Form(0.70),
-    top_n: Optional[int] = Form(3)
+    top_n: Optional[int] = Form(3),
+    samples_per_second: Optional[float] = Form(None),
+    track: Optional[bool] = Form(False),
+    motion_threshold: Optional[float] = Form(None),
+    images: Optional[str] = Form("inline"),
+    camera: Optional[str] = Form(None),
+    roi: Optional[str] = Form(None),
+    stream: Optional[bool] = Form(False, description="Stream one NDJSON line per video as it finishes")
 ):
     """
     Analyze multiple videos with same reference image
-    (Optional endpoint for batch processing)
+    
+    The reference is embedded once and the videos are analysed in parallel
+    (up to BATCH_WORKERS at a time), so a batch takes about as long as its
+    slowest video. With stream=true the response is NDJSON, one line per
+    video in completion order; otherwise all results are returned together.
+    The videos queue at batch priority, behind /analyze and /jobs, and the
+    whole batch is turned away (429) if any of them would be.
     """
     
-    if service is None:
-        raise HTTPException(status_code=503, detail="Service not initialized")
+    for video in videos:
+        validate_analysis_request(
+            reference_image, video, threshold, top_n, samples_per_second, motion_threshold, images,
+            camera=camera, roi=roi, priority="batch", job_pool="batch"
+        )
     
-    results = []
+    image_paths, video_paths = await asyncio.to_thread(save_uploads, [reference_image], videos)
+    costs = [
+        await asyncio.to_thread(job_cost, path, samples_per_second, temp_files=image_paths + video_paths)
+        for path in video_paths
+    ]
     
-    for video in videos:
+    try:
+        # Embed the reference once for the whole batch
+        references = await asyncio.to_thread(service.build_references, image_paths[0])
+    except Exception as e:
+        remove_files(*image_paths, *video_paths)
+        raise HTTPException(status_code=400, detail=f"Cannot read reference image: {str(e)}")
+    
+    def submit(video_name: str, video_path: str, cost: JobCost) -> Job:
+        def run(job: Job):
+            print(f"\n🔍 Starting batch analysis of {video_name} ({job.id})...")
+            return run_analysis(
+                job,
+                reference_image_path=image_paths[0],
+                video_path=video_path,
+                threshold=threshold,
+                top_n=top_n,
+                samples_per_second=samples_per_second,
+                references=references,
+                track=track,
+                motion_threshold=motion_threshold,
+                images=images,
+                camera=camera,
+                roi=roi
+            )
+        
+        return batch_jobs.submit(
+            run,
+            params={"video_name": video_name},
+            cleanup=lambda: remove_files(video_path),
+            cost=cost,
+            priority="batch",
+            files=[image_paths[0], video_path]
+        )
+    
+    batch = []
+    try:
+        for video, path, cost in zip(videos, video_paths, costs):
+            batch.append(submit(video.filename, path, cost))
+    except AdmissionRejected as e:
+        for job in batch:
+            batch_jobs.cancel(job.id)
+        remove_files(*image_paths, *video_paths)
+        raise busy(e)
+    
+    async def results_as_completed():
+        pending = {asyncio.wrap_future(job.future): job for job in batch}
         try:
-            # Process each video
-            result = await analyze_video(reference_image, video, threshold, top_n)
-            results.append({
-                "video_name": video.filename,
-                "result": result
-            })
-        except Exception as e:
-            results.append({
-                "video_name": video.filename,
-                "error": str(e)
-            })
+            while pending:
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for future in done:
+                    job = pending.pop(future)
+                    item = {"video_name": job.params["video_name"], "job_id": job.id}
+                    if future.exception() is not None:
+                        item["error"] = str(future.exception())
+                    elif future.result() is None:
+                        item["error"] = "Analysis cancelled"
+                    else:
+                        item["result"] = future.result()
+                    yield item
+        finally:
+            # Client went away or the batch finished: stop leftovers, drop the reference
+            for job in pending.values():
+                batch_jobs.cancel(job.id)
+            remove_files(*image_paths)
+    
+    if stream:
+        async def ndjson():
+            async for item in results_as_completed():
+                yield json.dumps(item) + "\n"
+        
+        return StreamingResponse(ndjson(), media_type="application/x-ndjson")
     
-    return JSONResponse(content={"batch_results": results})
+    results = {}
+    async for item in results_as_completed():
+        results[item["job_id"]] = item
+    
+    # Keep the upload order in the combined response
+    return JSONResponse(content={"batch_results": [results[job.id] for job in batch]})
 
 
 @app.delete("/cleanup")
-async def cleanup_uploads():
+async def cleanup_uploads(artifact_max_age_days: Optional[float] = None):
     """
-    Clean up all uploaded files
+    Clean up uploaded files (except those of queued or running jobs), and
+    only if artifact_max_age_days is given, match thumbnails no analysis or
+    download has used for that many days
     (Optional maintenance endpoint)
     """
+    if artifact_max_age_days is not None and artifact_max_age_days < 0:
+        raise HTTPException(status_code=400, detail="artifact_max_age_days must be >= 0")
+    
     try:
-        # Clean images
-        for file in os.listdir(f"{UPLOAD_DIR}/images"):
-            os.remove(f"{UPLOAD_DIR}/images/{file}")
+        # Inputs of pending jobs; their own cleanup deletes them once they finish
+        in_use = set()
+        for manager in (jobs, batch_jobs):
+            if manager is not None:
+                in_use |= manager.files_in_use()
+        
+        # Clean images and videos
+        skipped = 0
+        for directory in (f"{UPLOAD_DIR}/images", f"{UPLOAD_DIR}/videos"):
+            for file in os.listdir(directory):
+                path = os.path.join(directory, file)
+                if os.path.abspath(path) in in_use:
+                    skipped += 1
+                    continue
+                remove_files(path)
         
-        # Clean videos
-        for file in os.listdir(f"{UPLOAD_DIR}/videos"):
-            os.remove(f"{UPLOAD_DIR}/videos/{file}")
+        # Clean thumbnails (walks the whole store, off the event loop); opt-in,
+        # since stored results may still refer to them
+        artifacts = None
+        if artifact_max_age_days is not None and service is not None and service.artifacts is not None:
+            artifacts = await asyncio.to_thread(service.artifacts.purge, artifact_max_age_days * 86400)
         
-        return {"status": "success", "message": "All uploads cleaned"}
+        message = f"Uploads cleaned ({skipped} files of pending jobs kept)" if skipped else "All uploads cleaned"
+        return {"status": "success", "message": message, "skipped": skipped, "artifacts": artifacts}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Cleanup failed: {str(e)}")
 
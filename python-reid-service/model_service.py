@@ -4,18 +4,55 @@ Contains all model logic from your working Colab pipeline
 """
 
 import torch
-import torchvision
-import torchreid
 import numpy as np
 import cv2
 from PIL import Image
-from ultralytics import YOLO
-from sklearn.metrics.pairwise import cosine_similarity
 import os
-from typing import List, Dict, Tuple
+from typing import List, Dict, Tuple, Iterable, Iterator, Optional, Callable, Union
+from collections import deque
+import heapq
+import threading
+import time
 import base64
+import itertools
+from datetime import datetime
+from concurrent.futures import TimeoutError as FutureTimeout
 from io import BytesIO
 
+from embedding import BatchEmbedder
+from backends import (
+    load_runtime_config, configure_threads, load_osnet, load_yolo, build_eager_osnet,
+    check_parity, osnet_filename, yolo_filename, runtime_tag
+)
+from pipeline import AnalysisPipeline, AnalysisCancelled, StageStats
+from profiling import RequestProfiler, record_analysis
+from gallery import GalleryIndex, GalleryEntry, GalleryWriter, FEATURE_DTYPE, file_hash, sampling_key
+from scoring import ScoreTable, ReferenceSet, as_reference_set, normalize_rows, top_k_per_identity
+from tracking import IoUTracker
+from motion import MotionGate
+from artifacts import ArtifactStore
+from detector import DetectorPlan, DetectorSettings, load_detector_config, parse_roi
+from adaptive import AdaptiveSampler, SEARCH_MODES, INTEREST_MARGIN
+from archive import FootageArchive
+
+
+# Frame sampling modes for extract_video_frames
+SAMPLING_MODES = ("auto", "read", "grab", "seek")
+
+# Codecs where every frame is a keyframe, so seeking never decodes extra frames
+INTRA_ONLY_CODECS = {"MJPG", "MJPA", "JPEG", "AVRN", "PNG ", "MPNG", "RAW ", "I420", "YUY2"}
+
+# Gaps (in frames) of inter-coded streams at or above this are seeked over instead
+# of grabbed (intra-only streams seek over any gap); roughly two GOPs for typical
+# CCTV H.264/H.265 encodes, below that seeking costs more
+SEEK_MIN_GAP = 250
+
+# How analyze() returns match images: inline base64 JPEG, artifact store reference, or none
+IMAGE_MODES = ("inline", "ref", "none")
+
+# Segmented analysis never splits a video into segments shorter than this
+MIN_SEGMENT_SECONDS = 60.0
+
 
 class PersonReIDService:
     """
@@ -23,16 +60,53 @@ class PersonReIDService:
     Handles model loading and inference
     """
     
-    def __init__(self, model_dir: str = "models"):
+    def __init__(
+        self,
+        model_dir: str = "models",
+        embed_batch_size: int = 32,
+        detect_batch_size: int = 4,
+        frame_queue_size: int = 8,
+        detection_queue_size: int = 8,
+        gallery_dir: Optional[str] = "gallery",
+        archive_dir: Optional[str] = "archive",
+        artifact_dir: Optional[str] = "artifacts",
+        thumbnail_size: Tuple[int, int] = (128, 256),
+        thumbnail_quality: int = 80,
+        profile_dir: str = "profiles"
+    ):
         """
         Initialize the service and load models
         
         Args:
             model_dir: Directory containing model files
+            embed_batch_size: Maximum number of person crops per OSNet forward pass
+            detect_batch_size: Frames per batched YOLO call in the analysis pipeline
+            frame_queue_size: Decoded frames buffered ahead of detection
+            detection_queue_size: Detected frames buffered ahead of embedding
+            gallery_dir: Where per-video detections are indexed for repeat
+                searches (None disables the index)
+            archive_dir: Where indexed detections of every video are kept for
+                cross-video search (None disables the archive)
+            artifact_dir: Where match thumbnails are stored for images="ref"
+                (None disables that mode)
+            thumbnail_size: (width, height) bounding box of stored thumbnails
+            thumbnail_quality: JPEG quality of stored thumbnails
+            profile_dir: Where analyze(profile=...) writes its profiler dumps
         """
         self.model_dir = model_dir
+        self.embed_batch_size = embed_batch_size
+        self.detect_batch_size = detect_batch_size
+        self.frame_queue_size = frame_queue_size
+        self.detection_queue_size = detection_queue_size
+        self.profile_dir = profile_dir
         self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
         
+        # Inference backends, thread count and quantization (models/config.json "runtime")
+        self.runtime = load_runtime_config(model_dir)
+        
+        # YOLO classes, input size and per-camera ROIs (models/config.json "detector")
+        self.detector_config = load_detector_config(model_dir)
+        
         print(f"🖥️  Using device: {self.device}")
         if torch.cuda.is_available():
             print(f"✅ GPU: {torch.cuda.get_device_name(0)}")
@@ -40,39 +114,123 @@ class PersonReIDService:
         # Model placeholders
         self.osnet_model = None
         self.yolo_model = None
+        self.embedder = None
+        
+        # The YOLO predictor and the shared embedder are not thread-safe;
+        # concurrent analyses take turns on them (each analysis embeds crops
+        # with its own BatchEmbedder)
+        self._detect_lock = threading.Lock()
+        self._embed_lock = threading.Lock()
         
         # Load models
         self.load_models()
+        
+        # Indexed detections of already-analyzed videos
+        self.gallery = GalleryIndex(gallery_dir, self.model_tag()) if gallery_dir else None
+        
+        # Detections of all indexed videos, by camera and day (/search)
+        self.archive = FootageArchive(archive_dir, self.model_tag()) if archive_dir else None
+        
+        # Content-addressed match thumbnails
+        self.artifacts = ArtifactStore(artifact_dir, thumbnail_size, thumbnail_quality) if artifact_dir else None
+    
+    def model_tag(self) -> str:
+        """Identifies the loaded weights, so indexed features from other weights are not reused"""
+        parts = []
+        osnet_file = osnet_filename(self.runtime["osnet_backend"], self.runtime["quantize"])
+        for filename in (osnet_file, yolo_filename(self.runtime["yolo_backend"])):
+            path = os.path.join(self.model_dir, filename)
+            if os.path.exists(path):
+                stat = os.stat(path)
+                parts.append(f"{filename}:{stat.st_size}:{int(stat.st_mtime)}")
+            else:
+                parts.append(f"{filename}:missing")
+        # Backends agree only within the parity tolerance, so they get separate entries
+        parts.append(runtime_tag(self.runtime))
+        return "|".join(parts)
     
     def load_models(self):
-        """Load OSNet-IBN and YOLOv8 models"""
+        """Load OSNet-IBN and YOLOv8 models with the configured backends"""
         print("📥 Loading models...")
+        runtime = self.runtime
+        configure_threads(runtime["num_threads"])
         
         # Load OSNet-IBN (Person Re-ID)
-        print("  Loading OSNet-IBN...")
-        self.osnet_model = torchreid.models.build_model(
-            name='osnet_ibn_x1_0',
-            num_classes=751,
-            loss='softmax',
-            pretrained=False  # We'll load our weights
-        )
+        print(f"  Loading OSNet-IBN ({runtime_tag(runtime)})...")
+        self.osnet_model = load_osnet(self.model_dir, self.device, runtime)
+        self.embedder = BatchEmbedder(self.osnet_model, self.device, self.embed_batch_size)
         
-        # Load saved weights
-        osnet_path = os.path.join(self.model_dir, "osnet_ibn_x1_0.pth")
-        state_dict = torch.load(osnet_path, map_location=self.device)
-        self.osnet_model.load_state_dict(state_dict)
-        self.osnet_model = self.osnet_model.to(self.device)
-        self.osnet_model.eval()
+        if runtime["osnet_backend"] != "eager" and runtime["check_parity"]:
+            # Exported graphs must reproduce the eager features within tolerance
+            distance = check_parity(build_eager_osnet(self.model_dir, self.device), self.osnet_model, self.device)
+            print(f"  Parity vs eager: max cosine distance {distance:.2e}")
+            if distance > runtime["parity_tolerance"]:
+                raise RuntimeError(
+                    f"OSNet {runtime_tag(runtime)} features differ from eager by {distance:.2e} "
+                    f"(tolerance {runtime['parity_tolerance']}); re-export the model"
+                )
         print("  ✅ OSNet-IBN loaded!")
         
         # Load YOLOv8 (Person Detection)
-        print("  Loading YOLOv8...")
-        yolo_path = os.path.join(self.model_dir, "yolov8n.pt")
-        self.yolo_model = YOLO(yolo_path)
+        print(f"  Loading YOLOv8 ({runtime['yolo_backend']})...")
+        self.yolo_model = load_yolo(self.model_dir, runtime)
+        if runtime["yolo_backend"] == "torchscript":
+            # Traced for single frames
+            self.detect_batch_size = 1
         print("  ✅ YOLOv8 loaded!")
         
         print("✅ All models loaded successfully!\n")
     
+    def warm_up(self, frame_size: Tuple[int, int] = (1280, 720)) -> float:
+        """
+        Run both models once on dummy inputs
+        
+        The first inference pays for lazy allocation, predictor setup and
+        kernel selection; doing it at boot keeps that off the first request.
+        Uses the same batch shapes as a real analysis.
+        
+        Args:
+            frame_size: (width, height) of the dummy frames
+        Returns:
+            seconds: Time taken
+        """
+        print("🔥 Warming up models...")
+        start = time.perf_counter()
+        
+        width, height = frame_size
+        frames = [np.zeros((height, width, 3), dtype=np.uint8)] * self.detect_batch_size
+        self.detect_persons(frames)
+        
+        crops = [np.zeros((256, 128, 3), dtype=np.uint8)] * self.embed_batch_size
+        with self._embed_lock:
+            self.embedder.embed(crops)
+        
+        seconds = time.perf_counter() - start
+        print(f"✅ Warm-up done in {seconds:.2f}s\n")
+        return seconds
+    
+    def prepare_worker(self, num_threads: int):
+        """
+        Adapt a forked copy of the service to its worker process
+        
+        Eager and TorchScript weights stay shared with the parent
+        (copy-on-write pages that are never written). ONNX Runtime sessions
+        keep their thread pools in the parent, so they are rebuilt here with
+        the worker's thread count.
+        
+        Args:
+            num_threads: Intra-op threads for this worker
+        """
+        self.runtime = dict(self.runtime, num_threads=num_threads)
+        configure_threads(num_threads)
+        cv2.setNumThreads(num_threads)
+        
+        if self.runtime["osnet_backend"] == "onnx":
+            self.osnet_model = load_osnet(self.model_dir, self.device, self.runtime)
+            self.embedder = BatchEmbedder(self.osnet_model, self.device, self.embed_batch_size)
+        if self.runtime["yolo_backend"] == "onnx":
+            self.yolo_model = load_yolo(self.model_dir, self.runtime)
+    
     def extract_features(self, img: Image.Image) -> np.ndarray:
         """
         Extract 512-dim feature vector from person image
@@ -82,38 +240,139 @@ class PersonReIDService:
         Returns:
             feature: numpy array (1, 512)
         """
-        # Resize and normalize (exact same as your pipeline)
-        img_resized = img.resize((128, 256))
-        img_tensor = torchvision.transforms.ToTensor()(img_resized)
-        normalize = torchvision.transforms.Normalize(
-            mean=[0.485, 0.456, 0.406],
-            std=[0.229, 0.224, 0.225]
-        )
-        img_tensor = normalize(img_tensor).unsqueeze(0).to(self.device)
+        # Resize and normalize (exact same as your pipeline), batch of one
+        with self._embed_lock:
+            return self.embedder.embed([img])
+    
+    def get_video_info(self, video_path: str) -> Dict:
+        """
+        Read video metadata without decoding any frames
         
-        # Extract features
-        self.osnet_model.eval()
-        with torch.no_grad():
-            feature = self.osnet_model(img_tensor)
+        Args:
+            video_path: Path to video file
+        Returns:
+            info: fps, total_frames, duration_seconds, width and height
+        """
+        cap = cv2.VideoCapture(video_path)
+        
+        if not cap.isOpened():
+            raise ValueError("Cannot open video file")
+        
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        cap.release()
+        
+        if fps <= 0:
+            raise ValueError("Cannot read video FPS")
         
-        return feature.cpu().numpy()
+        return {
+            "fps": float(fps),
+            "total_frames": total_frames,
+            "duration_seconds": total_frames / fps,
+            "width": width,
+            "height": height
+        }
+    
+    def sample_frame_numbers(
+        self,
+        fps: float,
+        total_frames: int,
+        frame_interval: int = 30,
+        samples_per_second: Optional[float] = None
+    ) -> Iterator[int]:
+        """
+        Frame numbers to sample, in increasing order
+        
+        Args:
+            fps: Video FPS
+            total_frames: Frame count from the container (<= 0 if unknown)
+            frame_interval: Sample every Nth frame
+            samples_per_second: Sample N frames per second of video instead of
+                every Nth frame (independent of the camera frame rate)
+        Yields:
+            frame_number: Next frame index to decode
+        """
+        if samples_per_second is not None:
+            if samples_per_second <= 0:
+                raise ValueError("samples_per_second must be > 0")
+            step = fps / samples_per_second
+        else:
+            if frame_interval < 1:
+                raise ValueError("frame_interval must be >= 1")
+            step = frame_interval
+        
+        k = 0
+        last = -1
+        while True:
+            frame_num = int(round(k * step))
+            k += 1
+            # Sampling faster than the frame rate would repeat frames
+            if frame_num <= last:
+                continue
+            if total_frames > 0 and frame_num >= total_frames:
+                return
+            last = frame_num
+            yield frame_num
+    
+    def choose_sampling_mode(self, cap: cv2.VideoCapture, step: float, total_frames: int) -> str:
+        """
+        Pick how to skip over frames that are not sampled
+        
+        - "seek": jump with CAP_PROP_POS_FRAMES (intra-only codecs, or gaps
+          longer than a couple of GOPs)
+        - "grab": grab() skipped frames without retrieve(), no colour conversion
+        - "read": full decode of every frame (only for step 1)
+        """
+        if step <= 1:
+            return "read"
+        if total_frames <= 0:
+            # Live streams / broken headers: seeking is unreliable
+            return "grab"
+        
+        if self.is_intra_only(cap) or step >= SEEK_MIN_GAP:
+            return "seek"
+        return "grab"
+    
+    def is_intra_only(self, cap: cv2.VideoCapture) -> bool:
+        """Whether every frame of the stream decodes on its own (a seek never decodes from a keyframe)"""
+        fourcc = int(cap.get(cv2.CAP_PROP_FOURCC))
+        codec = "".join(chr((fourcc >> (8 * i)) & 0xFF) for i in range(4)).upper()
+        return codec in INTRA_ONLY_CODECS
     
     def extract_video_frames(
         self, 
         video_path: str, 
-        frame_interval: int = 30
-    ) -> Tuple[List[np.ndarray], List[int], float]:
+        frame_interval: int = 30,
+        samples_per_second: Optional[float] = None,
+        sampling_mode: str = "auto",
+        detector: Optional[DetectorPlan] = None,
+        frame_numbers: Optional[Iterable[int]] = None
+    ) -> Iterator[Tuple[int, np.ndarray]]:
         """
-        Extract frames from video
+        Lazily extract frames from video
+        
+        Frames are decoded on demand, so only the frame currently being
+        processed is held in memory regardless of video length. Frames that
+        are not sampled are skipped with grab() (no retrieve/convert) or by
+        seeking, so they are never fully decoded and converted.
         
         Args:
             video_path: Path to video file
             frame_interval: Extract every Nth frame (30 = 1fps for 30fps video)
-        Returns:
-            frames: List of RGB frames
-            frame_numbers: Frame indices
-            fps: Video FPS
+            samples_per_second: Extract N frames per second of video instead
+                (overrides frame_interval, works for any camera FPS)
+            sampling_mode: "auto", "read", "grab" or "seek"
+            detector: Crop every frame to this plan's ROI before color conversion
+            frame_numbers: Extract exactly these frames (increasing order) instead
+                of sampling at a fixed rate, e.g. the windows of an adaptive search
+        Yields:
+            (frame_number, frame): Frame index in the video and RGB frame (ROI only with a detector ROI)
         """
+        if sampling_mode not in SAMPLING_MODES:
+            raise ValueError(f"sampling_mode must be one of {SAMPLING_MODES}")
+        
         cap = cv2.VideoCapture(video_path)
         
         if not cap.isOpened():
@@ -121,133 +380,1046 @@ class PersonReIDService:
         
         fps = cap.get(cv2.CAP_PROP_FPS)
         total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        step = fps / samples_per_second if samples_per_second else frame_interval
+        
+        if frame_numbers is not None:
+            frame_numbers = list(frame_numbers)
+            if sampling_mode == "auto":
+                # Scattered windows: long gaps between them are seeked over, frames inside grabbed
+                sampling_mode = "seek" if total_frames > 0 else "grab"
+        elif sampling_mode == "auto":
+            sampling_mode = self.choose_sampling_mode(cap, step, total_frames)
         
         print(f"📊 Video: {fps:.1f} FPS, {total_frames} frames, {total_frames/fps:.1f}s")
-        print(f"   Extracting every {frame_interval} frames...")
+        if frame_numbers is not None:
+            print(f"   Extracting {len(frame_numbers)} selected frames ({sampling_mode} mode)...")
+        elif samples_per_second:
+            print(f"   Extracting {samples_per_second:g} frames/s (every {step:.1f} frames, {sampling_mode} mode)...")
+        else:
+            print(f"   Extracting every {frame_interval} frames ({sampling_mode} mode)...")
         
-        frames, frame_numbers = [], []
-        frame_count = 0
+        if frame_numbers is None:
+            frame_numbers = self.sample_frame_numbers(fps, total_frames, frame_interval, samples_per_second)
         
-        while True:
-            ret, frame = cap.read()
-            if not ret:
-                break
-            
-            if frame_count % frame_interval == 0:
-                frames.append(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
-                frame_numbers.append(frame_count)
-            
-            frame_count += 1
+        # Inter-coded streams seek to a keyframe and decode forward from it, so
+        # only long gaps are worth a seek; intra-only frames are seeked to directly
+        min_seek_gap = 1 if sampling_mode == "seek" and self.is_intra_only(cap) else SEEK_MIN_GAP // 2
         
-        cap.release()
-        print(f"✅ Extracted {len(frames)} frames\n")
+        extracted = 0
+        position = 0  # Index of the next frame the capture will return
         
-        return frames, frame_numbers, fps
+        try:
+            for frame_num in frame_numbers:
+                gap = frame_num - position
+                
+                if sampling_mode == "read":
+                    # Decode everything, including frames we drop
+                    ok = True
+                    for _ in range(gap):
+                        ok, _ = cap.read()
+                        if not ok:
+                            break
+                    if not ok:
+                        break
+                elif sampling_mode == "seek" and gap >= min_seek_gap:
+                    cap.set(cv2.CAP_PROP_POS_FRAMES, frame_num)
+                else:
+                    # Short gaps: advancing the demuxer/decoder is cheaper than a seek
+                    ok = True
+                    for _ in range(gap):
+                        if not cap.grab():
+                            ok = False
+                            break
+                    if not ok:
+                        break
+                
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                position = frame_num + 1
+                
+                if detector is not None:
+                    frame = detector.crop(frame)
+                
+                extracted += 1
+                yield frame_num, cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        finally:
+            cap.release()
+        
+        print(f"✅ Extracted {extracted} frames\n")
     
-    def detect_and_match(
-        self, 
-        frames: List[np.ndarray], 
-        ref_feature: np.ndarray
-    ) -> List[Dict]:
+    def detector_settings(self, camera: Optional[str] = None, roi: Optional[Union[str, List]] = None) -> DetectorSettings:
         """
-        Detect all persons in frames and match with reference
+        Detector settings for a camera
         
         Args:
-            frames: List of video frames
-            ref_feature: Reference person feature vector
+            camera: Name in the config's detector.cameras (default settings if None)
+            roi: Per-request ROI ("x1,y1,x2,y2", "x,y;x,y;x,y" or a list), replaces the camera's
         Returns:
-            all_detections: List of detections per frame
+            settings: Resolve with the video's frame size before detecting
+        """
+        if isinstance(roi, str):
+            roi = parse_roi(roi)
+        settings = DetectorSettings.from_config(self.detector_config, camera, roi)
+        if self.runtime["yolo_backend"] == "torchscript":
+            # Traced at a fixed input size
+            settings.imgsz = 640
+        return settings
+    
+    def detect_persons(
+        self,
+        frames: List[np.ndarray],
+        detector: Optional[DetectorPlan] = None
+    ) -> List[List[Tuple[List[int], np.ndarray]]]:
+        """
+        Run YOLO on a group of frames (one batched call) and cut out person crops
+        
+        YOLO itself keeps only the configured classes above the confidence
+        threshold, and runs at the plan's input size.
+        
+        Args:
+            frames: RGB frames, cropped to the detector's ROI (see extract_video_frames)
+            detector: Settings resolved for the video (default: defaults for this frame size)
+        Returns:
+            persons: Per frame, list of (bbox, crop) for each detected person;
+                bboxes are in full-frame pixels
+        """
+        if not frames:
+            return []
+        if detector is None:
+            height, width = frames[0].shape[:2]
+            detector = self.detector_settings().resolve(width, height)
+        settings = detector.settings
+        
+        with self._detect_lock:
+            results = self.yolo_model(
+                [detector.masked(frame) for frame in frames],
+                verbose=False,
+                classes=settings.classes,
+                conf=settings.conf,
+                imgsz=detector.imgsz
+            )
+        detections = []
+        
+        for frame, result in zip(frames, results):
+            persons = []
+            for box in result.boxes:
+                cls = int(box.cls[0])
+                conf = float(box.conf[0])
+                
+                # Backends that ignore classes/conf are filtered here
+                if (settings.classes is None or cls in settings.classes) and conf >= settings.conf:
+                    x1, y1, x2, y2 = map(int, box.xyxy[0].cpu().numpy())
+                    
+                    # Crop person
+                    person_crop = frame[y1:y2, x1:x2]
+                    
+                    # Skip if too small
+                    if person_crop.shape[0] < settings.min_size or person_crop.shape[1] < settings.min_size:
+                        continue
+                    
+                    persons.append((detector.to_frame([x1, y1, x2, y2]), person_crop))
+            detections.append(persons)
+        
+        return detections
+    
+    def embed_and_match(
+        self,
+        detected: Iterable[Tuple[Dict, List[Tuple[List[int], np.ndarray]]]],
+        ref_feature: Union[np.ndarray, ReferenceSet],
+        tracker: Optional[IoUTracker] = None,
+        on_batch: Optional[Callable[[int, float], None]] = None
+    ) -> Iterator[Dict]:
+        """
+        Embed detected persons in OSNet batches and score them against the reference
+        
+        With a tracker, detections are linked into tracklets first and only
+        the crops it selects are embedded (their features go to the tracklet);
+        the other persons are passed through with a track_id but no scores.
+        
+        Args:
+            detected: Iterable of (frame_data, [(bbox, crop), ...]) in frame order
+            ref_feature: Reference feature vector, or a ReferenceSet of K references
+            tracker: Optional IoUTracker for track-level matching
+            on_batch: Called with (crops, seconds) after every OSNet forward pass
+        Yields:
+            frame_data: Detections for one frame, once all its crops are scored
         """
-        all_detections = []
+        # Per-call embedder so concurrent analyses don't share pending crops
+        embedder = BatchEmbedder(self.osnet_model, self.device, self.embed_batch_size, on_batch)
+        
+        # Frames whose crops are still waiting in the embedder, in frame order
+        waiting = deque()
+        total = 0
+        
+        references = as_reference_set(ref_feature)
         
-        print(f"🔍 Processing {len(frames)} frames...")
+        def score(flushed):
+            # One (n x 512)·(512 x K) matmul per OSNet batch, results go back to their frames
+            if not flushed:
+                return
+            features = normalize_rows(np.stack([feature for _, feature in flushed]))
+            similarities = references.score(features)
+            for ((frame_data, person), _), feature, similarity in zip(flushed, features, similarities):
+                person['feature'] = feature
+                person['similarities'] = similarity
+                person['similarity'] = float(similarity.max())
+                if tracker is not None:
+                    track = tracker.add_feature(
+                        tracker.tracks[person['track_id']], feature, frame_data['frame_num'], person['bbox'], person['quality']
+                    )
+                    person['track_id'] = track.id
+                frame_data['persons'].append(person)
         
-        for frame_idx, frame in enumerate(frames):
-            # Detect persons with YOLO
-            results = self.yolo_model(frame, verbose=False)
+        def safe_score(flush):
+            try:
+                score(flush())
+            except Exception as e:
+                print(f"⚠️  Error processing person batch: {e}")
+        
+        for frame_data, persons in detected:
+            waiting.append(frame_data)
             
-            frame_data = {'frame_idx': frame_idx, 'persons': []}
+            if tracker is not None:
+                assignments = tracker.update(frame_data['frame_num'], [bbox for bbox, _ in persons])
+            else:
+                assignments = [(None, None)] * len(persons)
             
-            for result in results:
-                for box in result.boxes:
-                    cls = int(box.cls[0])
-                    conf = float(box.conf[0])
-                    
-                    # Only process person class (0) with confidence > 0.3
-                    if cls == 0 and conf >= 0.3:
-                        x1, y1, x2, y2 = map(int, box.xyxy[0].cpu().numpy())
-                        
-                        # Crop person
-                        person_crop = frame[y1:y2, x1:x2]
-                        
-                        # Skip if too small
-                        if person_crop.shape[0] < 20 or person_crop.shape[1] < 20:
-                            continue
-                        
-                        try:
-                            # Extract features
-                            person_pil = Image.fromarray(person_crop)
-                            person_feature = self.extract_features(person_pil)
-                            
-                            # Calculate similarity
-                            similarity = cosine_similarity(ref_feature, person_feature)[0][0]
-                            
-                            frame_data['persons'].append({
-                                'bbox': [x1, y1, x2, y2],
-                                'similarity': float(similarity),
-                                'image': person_pil
-                            })
-                        except Exception as e:
-                            print(f"⚠️  Error processing person: {e}")
-                            continue
+            for (bbox, person_crop), (track, quality) in zip(persons, assignments):
+                # Resized straight from the frame into the embedder's batch (runs once full);
+                # only the bbox is kept, the crop is re-cut later if it makes the top_n
+                person = {'bbox': bbox}
+                if track is not None:
+                    person['track_id'] = track.id
+                    if quality is None:
+                        # Tracklet already has good enough crops
+                        frame_data['persons'].append(person)
+                        continue
+                    person['quality'] = quality
+                safe_score(lambda: embedder.add(person_crop, (frame_data, person)))
             
-            all_detections.append(frame_data)
+            # Everything queued before this point is scored once the embedder is empty
+            if not embedder.pending:
+                while waiting:
+                    done = waiting.popleft()
+                    total += len(done['persons'])
+                    yield done
+        
+        # Embed whatever is left in the last partial batch
+        safe_score(embedder.flush)
+        while waiting:
+            done = waiting.popleft()
+            total += len(done['persons'])
+            yield done
         
-        total = sum(len(d['persons']) for d in all_detections)
         print(f"✅ Detected {total} persons\n")
+    
+    def detect_and_match(
+        self, 
+        frames: Iterable[Tuple[int, np.ndarray]], 
+        ref_feature: Union[np.ndarray, ReferenceSet],
+        detector: Optional[DetectorPlan] = None
+    ) -> Iterator[Dict]:
+        """
+        Detect all persons in frames and match with reference
+        
+        Frames are consumed one at a time in the calling thread; each frame's
+        detections are yielded as soon as all of its crops have gone through
+        an OSNet batch. See AnalysisPipeline for the multi-threaded version.
+        
+        Args:
+            frames: Iterable of (frame_number, frame) pairs
+            ref_feature: Reference feature vector, or a ReferenceSet of K references
+            detector: Detector settings for the video (see detect_persons)
+        Yields:
+            frame_data: Detections for one frame (frame_idx, frame_num, persons)
+        """
+        print("🔍 Processing frames as they are decoded...")
+        
+        def detected():
+            for frame_idx, (frame_num, frame) in enumerate(frames):
+                # Detect persons with YOLO
+                persons = self.detect_persons([frame], detector)[0]
+                yield {'frame_idx': frame_idx, 'frame_num': frame_num, 'persons': []}, persons
         
-        return all_detections
+        return self.embed_and_match(detected(), ref_feature)
     
     def find_matches(
         self, 
-        all_detections: List[Dict], 
-        frame_numbers: List[int], 
+        all_detections: Iterable[Dict], 
         fps: float, 
         threshold: float = 0.70, 
+        top_n: int = 3,
+        identities: int = 1
+    ) -> Tuple[List[Dict], np.ndarray, int]:
+        """
+        Find best matching persons above threshold
+        
+        Detections are consumed incrementally and their scores go into one
+        contiguous array. No crops are held; use attach_crops() to re-cut
+        the images of the final matches.
+        
+        Args:
+            identities: Number of reference identities (columns of all_sims
+                when nothing was detected)
+        
+        Returns:
+            matches: Top matches of every identity (each tagged with its
+                identity index), highest similarity first
+            all_sims: All similarity scores, (detections, identities)
+            frames_processed: Number of sampled frames consumed
+        """
+        # Similarities, frame numbers and bboxes of every detection, in contiguous arrays
+        table = None
+        frames_processed = 0
+        
+        for detection in all_detections:
+            frames_processed += 1
+            persons = detection['persons']
+            if not persons:
+                continue
+            
+            sims = np.stack([person['similarities'] for person in persons])
+            if table is None:
+                table = ScoreTable(columns=sims.shape[1])
+            table.append(sims, detection['frame_num'], [person['bbox'] for person in persons])
+        
+        if table is None:
+            return [], np.empty((0, identities), dtype=np.float32), frames_processed
+        
+        # Top-k per identity by argpartition over the whole similarity matrix
+        matches = []
+        for i, identity in top_k_per_identity(table.sims, top_n, threshold):
+            frame_num = int(table.frame_nums[i])
+            matches.append({
+                'identity': identity,
+                'frame_num': frame_num,
+                'time': frame_num / fps,
+                'similarity': float(table.sims[i, identity]),
+                'bbox': table.bboxes[i].tolist()
+            })
+        
+        return matches, table.sims, frames_processed
+    
+    def find_track_matches(
+        self,
+        tracker: IoUTracker,
+        ref_feature: Union[np.ndarray, ReferenceSet],
+        fps: float,
+        threshold: float = 0.70,
         top_n: int = 3
     ) -> Tuple[List[Dict], np.ndarray]:
         """
-        Find best matching persons above threshold
+        Best matching tracklets above threshold
+        
+        A tracklet scores as its best-matching crop (per identity), so one
+        person standing in view yields one match spanning their appearance.
+        
+        Returns:
+            matches: Top tracklets of every identity, highest similarity first;
+                frame_num/bbox point at the tracklet's best-matching crop
+            all_sims: Similarity of every tracklet, (tracklets, identities)
+        """
+        references = as_reference_set(ref_feature)
+        tracklets = tracker.tracklets()
+        if not tracklets:
+            return [], np.empty((0, len(references)), dtype=np.float32)
+        
+        # One matmul over every embedded crop, then the max of each tracklet's run of rows
+        crop_sims = references.score(np.concatenate([track.features() for track in tracklets]))
+        starts = np.cumsum([0] + [len(track.crops) for track in tracklets[:-1]])
+        all_sims = np.maximum.reduceat(crop_sims, starts, axis=0)
+        
+        matches = []
+        for i, identity in top_k_per_identity(all_sims, top_n, threshold):
+            track = tracklets[i]
+            best = int(np.argmax(crop_sims[starts[i]:starts[i] + len(track.crops), identity]))
+            _, frame_num, bbox, _ = track.crops[best]
+            matches.append({
+                'identity': identity,
+                'frame_num': frame_num,
+                'time': frame_num / fps,
+                'similarity': float(all_sims[i, identity]),
+                'bbox': bbox,
+                'track': {
+                    'track_id': track.id,
+                    'start_frame': track.start_frame,
+                    'end_frame': track.end_frame,
+                    'start_seconds': track.start_frame / fps,
+                    'end_seconds': track.end_frame / fps,
+                    'detections': track.detections,
+                    'crops_embedded': len(track.crops)
+                }
+            })
+        
+        return matches, all_sims
+    
+    def crop_detections(self, video_path: str, detections: List[Tuple[int, List[int]]]) -> List[Image.Image]:
+        """
+        Re-cut person crops from the video for a few detections
+        
+        Args:
+            video_path: Path to video file
+            detections: (frame_number, bbox) pairs
+        Returns:
+            crops: PIL Images, in the same order as detections
+        """
+        if not detections:
+            return []
+        
+        cap = cv2.VideoCapture(video_path)
+        if not cap.isOpened():
+            raise ValueError("Cannot open video file")
+        
+        crops = [None] * len(detections)
+        try:
+            # Visit frames in order so the decoder only ever seeks forward
+            for i in sorted(range(len(detections)), key=lambda i: detections[i][0]):
+                frame_num, (x1, y1, x2, y2) = detections[i]
+                cap.set(cv2.CAP_PROP_POS_FRAMES, frame_num)
+                ret, frame = cap.read()
+                if not ret:
+                    raise ValueError(f"Cannot read frame {frame_num}")
+                crops[i] = Image.fromarray(cv2.cvtColor(frame[y1:y2, x1:x2], cv2.COLOR_BGR2RGB))
+        finally:
+            cap.release()
+        
+        return crops
+    
+    def attach_crops(self, video_path: str, matches: List[Dict]) -> List[Dict]:
+        """Re-cut the crop of every match from the video (sets match['image'])"""
+        crops = self.crop_detections(video_path, [(match['frame_num'], match['bbox']) for match in matches])
+        for match, crop in zip(matches, crops):
+            match['image'] = crop
+        return matches
+    
+    def find_indexed_matches(
+        self,
+        entry: GalleryEntry,
+        ref_feature: Union[np.ndarray, ReferenceSet],
+        fps: float,
+        threshold: float = 0.70,
+        top_n: int = 3,
+        tracker: Optional[IoUTracker] = None
+    ) -> Tuple[List[Dict], np.ndarray, int]:
+        """
+        find_matches against an already-indexed video
+        
+        One matrix-vector product scores every stored detection. With a
+        tracker, the stored boxes are linked into tracklets and matched as in
+        find_track_matches, using the stored features of the selected crops.
         
         Returns:
             matches: List of top matches
             all_sims: All similarity scores (for analysis)
+            frames_processed: Sampled frames when the video was indexed
         """
-        matches, all_sims = [], []
+        if tracker is not None:
+            # Rows are stored in frame order, one run of rows per frame
+            starts = np.flatnonzero(np.diff(entry.frame_nums, prepend=-1))
+            for start, end in zip(starts, list(starts[1:]) + [len(entry)]):
+                frame_num = int(entry.frame_nums[start])
+                assignments = tracker.update(frame_num, entry.bboxes[start:end].tolist())
+                for row, (track, quality) in zip(range(start, end), assignments):
+                    if quality is not None:
+                        tracker.add_feature(
+                            track, np.asarray(entry.features[row], dtype=np.float32), frame_num,
+                            entry.bboxes[row].tolist(), quality
+                        )
+            matches, all_sims = self.find_track_matches(tracker, ref_feature, fps, threshold, top_n)
+            return matches, all_sims, entry.info["frames_processed"]
         
-        for detection in all_detections:
-            frame_idx = detection['frame_idx']
-            frame_num = frame_numbers[frame_idx]
-            timestamp = frame_num / fps
-            
-            for person in detection['persons']:
-                sim = person['similarity']
-                all_sims.append(sim)
+        all_sims = entry.similarities(as_reference_set(ref_feature))
+        top = top_k_per_identity(all_sims, top_n, threshold)
+        
+        matches = []
+        for i, identity in top:
+            frame_num = int(entry.frame_nums[i])
+            matches.append({
+                'identity': identity,
+                'frame_num': frame_num,
+                'time': frame_num / fps,
+                'similarity': float(all_sims[i, identity]),
+                'bbox': [int(x) for x in entry.bboxes[i]]
+            })
+        
+        return matches, all_sims, entry.info["frames_processed"]
+    
+    def record_detections(self, all_detections: Iterable[Dict], writer: GalleryWriter) -> Iterator[Dict]:
+        """Pass detections through while writing them to the gallery index"""
+        for frame_data in all_detections:
+            writer.add(frame_data)
+            yield frame_data
+    
+    def report_matches(
+        self,
+        all_detections: Iterable[Dict],
+        references: ReferenceSet,
+        fps: float,
+        threshold: float,
+        top_n: int,
+        on_match: Callable[[Dict], None]
+    ) -> Iterator[Dict]:
+        """
+        Pass detections through, reporting provisional matches as they are found
+        
+        A detection is reported when it scores above threshold and enters the
+        running top_n of its identity, so clients can show candidates before
+        the analysis ends. The final ranking (and images) come with the result.
+        """
+        multi = len(references) > 1
+        best = [[] for _ in range(len(references))]  # min-heap of top_n similarities per identity
+        
+        for frame_data in all_detections:
+            for person in frame_data['persons']:
+                if 'similarities' not in person:
+                    continue
+                identity = int(np.argmax(person['similarities']))
+                similarity = person['similarity']
+                heap = best[identity]
+                if similarity < threshold or (len(heap) >= top_n and similarity <= heap[0]):
+                    continue
+                if len(heap) >= top_n:
+                    heapq.heapreplace(heap, similarity)
+                else:
+                    heapq.heappush(heap, similarity)
                 
-                if sim >= threshold:
-                    matches.append({
-                        'frame_idx': frame_idx,
-                        'frame_num': frame_num,
-                        'time': timestamp,
-                        'similarity': sim,
-                        'bbox': person['bbox'],
-                        'image': person['image']
-                    })
+                match = {
+                    "confidence": similarity,
+                    "frame_number": int(frame_data['frame_num']),
+                    "timestamp_seconds": frame_data['frame_num'] / fps,
+                    "bbox": [int(x) for x in person['bbox']]
+                }
+                if multi:
+                    match["identity"] = references.names[identity]
+                if 'track_id' in person:
+                    match["track_id"] = person['track_id']
+                on_match(match)
+            yield frame_data
+    
+    def analysis_pipeline(
+        self,
+        progress: Optional[Callable[[Dict], None]] = None,
+        cancel_event: Optional[threading.Event] = None,
+        profiler: Optional[RequestProfiler] = None,
+        detector: Optional[DetectorPlan] = None
+    ) -> AnalysisPipeline:
+        """A staged pipeline with this service's batch and queue sizes"""
+        return AnalysisPipeline(
+            self,
+            detect_batch_size=self.detect_batch_size,
+            frame_queue_size=self.frame_queue_size,
+            detection_queue_size=self.detection_queue_size,
+            progress=progress,
+            cancel_event=cancel_event,
+            profiler=profiler,
+            detector=detector
+        )
+    
+    def search_video(
+        self,
+        video_path: str,
+        ref_feature: Union[np.ndarray, ReferenceSet],
+        fps: float,
+        threshold: float = 0.70,
+        top_n: int = 3,
+        frame_interval: int = 30,
+        samples_per_second: Optional[float] = None,
+        progress: Optional[Callable[[Dict], None]] = None,
+        cancel_event: Optional[threading.Event] = None,
+        writer: Optional[GalleryWriter] = None,
+        tracker: Optional[IoUTracker] = None,
+        motion_gate: Optional[MotionGate] = None,
+        on_match: Optional[Callable[[Dict], None]] = None,
+        profiler: Optional[RequestProfiler] = None,
+        detector: Optional[DetectorPlan] = None
+    ) -> Tuple[List[Dict], np.ndarray, int, AnalysisPipeline]:
+        """
+        Decode, detect, embed and rank one video through the staged pipeline
         
-        # Sort by similarity (highest first)
-        matches.sort(key=lambda x: x['similarity'], reverse=True)
+        Args:
+            writer: Records every detection into the gallery index when given
+                (not with a tracker, which leaves most detections unembedded)
+            tracker: Match tracklets instead of single detections
+            motion_gate: Drops static frames before detection; frames_processed
+                still counts every sampled frame
+            on_match: Called with each provisional match (see report_matches)
+            profiler: Request profiler, also attached to the pipeline threads
+            detector: Detector settings resolved for the video; with an ROI
+                the frames are cropped as they are decoded
+        Returns:
+            matches, all_sims, frames_processed: As returned by find_matches
+            pipeline: The finished pipeline (report(), batch sizes, crowd density)
+        """
+        # 1. Stream video frames (decoded lazily as detection consumes them)
+        print("\n🎬 Streaming video frames...")
+        frames = self.extract_video_frames(
+            video_path,
+            frame_interval=frame_interval,
+            samples_per_second=samples_per_second,
+            detector=detector
+        )
+        if motion_gate is not None:
+            # Runs in the decoder thread, ahead of the YOLO queue (on the ROI only)
+            frames = motion_gate.filter(frames)
+        
+        # 2. Detect and match (decode, YOLO and OSNet run concurrently)
+        print("\n🔎 Detecting persons and matching...")
+        pipeline = self.analysis_pipeline(progress, cancel_event, profiler, detector)
+        all_detections = pipeline.run(frames, ref_feature, tracker)
+        if writer is not None:
+            all_detections = self.record_detections(all_detections, writer)
+        if on_match is not None:
+            all_detections = self.report_matches(
+                all_detections, as_reference_set(ref_feature), fps, threshold, top_n, on_match
+            )
+        
+        # 3. Find best matches (drives the whole streaming pipeline)
+        print("\n✅ Finding best matches...")
+        if tracker is None:
+            matches, all_sims, frames_processed = self.find_matches(
+                all_detections, fps, threshold, top_n, len(as_reference_set(ref_feature))
+            )
+        else:
+            frames_processed = sum(1 for _ in all_detections)
+            with pipeline.stats["match"].measure():
+                matches, all_sims = self.find_track_matches(tracker, ref_feature, fps, threshold, top_n)
+        if motion_gate is not None:
+            frames_processed = motion_gate.frames_checked
+        
+        print("\n⏱️  Pipeline throughput:")
+        for stage, stats in pipeline.report().items():
+            print(f"   {stage:<7} {stats['items']:>6} {stats['unit']:<6} {stats['items_per_second']:>8.1f}/s busy, {stats['cpu_seconds']:.1f}s cpu, {stats['wall_seconds']:.1f}s wall")
+        
+        return matches, all_sims, frames_processed, pipeline
+    
+    def stored_detections(
+        self,
+        frame_nums: np.ndarray,
+        bboxes: np.ndarray,
+        all_sims: np.ndarray,
+        features: Optional[np.ndarray] = None
+    ) -> Iterator[Dict]:
+        """
+        Per-detection arrays (rows in frame order) back as scored pipeline output
         
-        return matches[:top_n], np.array(all_sims)
+        Args:
+            frame_nums, bboxes, all_sims: One row per detection
+            features: Row features, added as person['feature'] (for the gallery writer)
+        Yields:
+            frame_data: One per frame with detections, in frame order
+        """
+        best = all_sims.max(axis=1) if len(all_sims) else all_sims
+        # One run of rows per frame
+        starts = np.flatnonzero(np.diff(frame_nums, prepend=-1))
+        for frame_idx, (start, end) in enumerate(zip(starts, list(starts[1:]) + [len(frame_nums)])):
+            persons = []
+            for row in range(start, end):
+                person = {
+                    'bbox': [int(x) for x in bboxes[row]],
+                    'similarities': all_sims[row],
+                    'similarity': float(best[row])
+                }
+                if features is not None:
+                    person['feature'] = features[row]
+                persons.append(person)
+            yield {'frame_idx': frame_idx, 'frame_num': int(frame_nums[start]), 'persons': persons}
+    
+    def indexed_detections(self, entry: GalleryEntry, ref_feature: Union[np.ndarray, ReferenceSet]) -> Iterator[Dict]:
+        """Stored detections of an indexed video, scored like pipeline output"""
+        all_sims = entry.similarities(as_reference_set(ref_feature))
+        return self.stored_detections(entry.frame_nums, entry.bboxes, all_sims)
+    
+    def adaptive_search(
+        self,
+        video_path: str,
+        ref_feature: Union[np.ndarray, ReferenceSet],
+        fps: float,
+        sampler: AdaptiveSampler,
+        threshold: float = 0.70,
+        top_n: int = 3,
+        frame_interval: int = 30,
+        samples_per_second: Optional[float] = None,
+        progress: Optional[Callable[[Dict], None]] = None,
+        cancel_event: Optional[threading.Event] = None,
+        writer: Optional[GalleryWriter] = None,
+        motion_gate: Optional[MotionGate] = None,
+        on_match: Optional[Callable[[Dict], None]] = None,
+        profiler: Optional[RequestProfiler] = None,
+        detector: Optional[DetectorPlan] = None,
+        entry: Optional[GalleryEntry] = None
+    ) -> Tuple[List[Dict], np.ndarray, int, Optional[AnalysisPipeline]]:
+        """
+        Coarse-to-fine search_video: refine around promising detections
+        
+        The coarse pass samples the whole video at the regular rate, or is read
+        from the gallery index when the video is already indexed at that rate.
+        Each refinement pass decodes only the frames the sampler selects around
+        the previous pass's interesting detections, through a fresh pipeline.
+        Detections of every pass are ranked together by one find_matches.
+        
+        Args:
+            sampler: Plans the refinement passes and records per-pass counts
+            writer: Records the coarse pass into the gallery index (refined
+                frames are specific to this reference, so they are not indexed)
+            motion_gate: Applied to the coarse pass only; refinement windows
+                are around detected people, which are rarely static
+            entry: Gallery entry holding the coarse pass, if indexed
+        Returns:
+            matches, all_sims: As returned by find_matches
+            frames_processed: Frames sampled over all passes
+            pipeline: Counters of all decoding passes merged (None if nothing was decoded)
+        """
+        references = as_reference_set(ref_feature)
+        pipelines: List[AnalysisPipeline] = []
+        # Counters of finished passes, so progress keeps increasing across passes
+        done = {"frames_decoded": 0, "frames_detected": 0, "crops_embedded": 0}
+        
+        def on_progress(counters: Dict):
+            counters = {name: done[name] + value for name, value in counters.items()}
+            counters["pass"] = len(sampler.passes) + 1
+            progress(counters)
+        
+        def run_pass(frames: Iterable[Tuple[int, np.ndarray]]) -> Iterator[Dict]:
+            pipeline = self.analysis_pipeline(on_progress if progress else None, cancel_event, profiler, detector)
+            pipelines.append(pipeline)
+            try:
+                yield from pipeline.run(frames, references)
+            finally:
+                for name, value in pipeline.progress().items():
+                    done[name] += value
+        
+        def passes() -> Iterator[Dict]:
+            # Pass 1: regular sampling over the whole video
+            if entry is not None:
+                print(f"⚡ Coarse pass from the gallery index ({len(entry)} detections)")
+                coarse = self.indexed_detections(entry, references)
+            else:
+                print(f"\n🎬 Coarse pass (every {sampler.step:.1f} frames)...")
+                frames = self.extract_video_frames(
+                    video_path,
+                    frame_interval=frame_interval,
+                    samples_per_second=samples_per_second,
+                    detector=detector
+                )
+                if motion_gate is not None:
+                    frames = motion_gate.filter(frames)
+                coarse = run_pass(frames)
+                if writer is not None:
+                    coarse = self.record_detections(coarse, writer)
+            
+            frames_processed = 0
+            for frame_data in coarse:
+                sampler.observe(frame_data)
+                frames_processed += 1
+                yield frame_data
+            if entry is not None:
+                frames_processed = entry.info["frames_processed"]
+            elif motion_gate is not None:
+                frames_processed = motion_gate.frames_checked
+            sampler.finish_pass(frames_processed)
+            
+            # Passes 2+: denser sampling, only around interesting detections
+            frame_numbers = sampler.next_pass()
+            while frame_numbers is not None:
+                print(f"\n🔬 Refinement pass {len(sampler.passes) + 1}: {len(frame_numbers)} frames in {len(sampler.windows)} windows (every {sampler.step:.1f} frames)")
+                frames_processed = 0
+                frames = self.extract_video_frames(video_path, detector=detector, frame_numbers=frame_numbers)
+                for frame_data in run_pass(frames):
+                    sampler.observe(frame_data)
+                    frames_processed += 1
+                    yield frame_data
+                sampler.finish_pass(frames_processed)
+                frame_numbers = sampler.next_pass()
+        
+        all_detections = passes()
+        if on_match is not None:
+            all_detections = self.report_matches(all_detections, references, fps, threshold, top_n, on_match)
+        
+        print("\n✅ Finding best matches...")
+        matches, all_sims, _ = self.find_matches(all_detections, fps, threshold, top_n, len(references))
+        
+        print("\n🔬 Adaptive search passes:")
+        for search_pass in sampler.passes:
+            print(f"   pass {search_pass['pass']}: every {search_pass['step']:g} frames, {search_pass['frames']} frames, {search_pass['interesting_frames']} interesting")
+        
+        pipeline = pipelines[0] if pipelines else None
+        for later in pipelines[1:]:
+            pipeline.merge(later.stats, later.persons_per_frame)
+        if pipeline is not None:
+            print("\n⏱️  Pipeline throughput (all passes):")
+            for stage, stats in pipeline.report().items():
+                print(f"   {stage:<7} {stats['items']:>6} {stats['unit']:<6} {stats['items_per_second']:>8.1f}/s busy, {stats['cpu_seconds']:.1f}s cpu, {stats['wall_seconds']:.1f}s wall")
+        
+        return matches, all_sims, sampler.frames_processed, pipeline
+    
+    def segment_ranges(self, total_frames: int, segments: int, min_frames: float = 1) -> List[Tuple[int, int]]:
+        """
+        Split a video into contiguous [start, end) frame ranges of near-equal length
+        
+        Args:
+            total_frames: Frame count from the container
+            segments: Number of segments wanted
+            min_frames: Shortest segment allowed (fewer segments for short videos)
+        """
+        if total_frames <= 0:
+            raise ValueError("Segmented analysis needs the video's frame count")
+        segments = max(1, min(segments, int(total_frames // max(min_frames, 1))))
+        bounds = [int(round(i * total_frames / segments)) for i in range(segments + 1)]
+        return list(zip(bounds[:-1], bounds[1:]))
+    
+    def search_segment(
+        self,
+        video_path: str,
+        ref_feature: Union[np.ndarray, ReferenceSet],
+        start_frame: int,
+        end_frame: int,
+        frame_interval: int = 30,
+        samples_per_second: Optional[float] = None,
+        motion_threshold: Optional[float] = None,
+        detector: Optional[DetectorPlan] = None,
+        with_features: bool = False,
+        progress: Optional[Callable[[Dict], None]] = None,
+        on_match: Optional[Callable[[Dict], None]] = None,
+        cancel_event: Optional[threading.Event] = None
+    ) -> Dict:
+        """
+        Decode, detect and embed one time segment of a video (runs in a worker)
+        
+        The segment gets its own capture, which seeks to the segment's first
+        sampled frame. The sampled frames are exactly the ones a single pass
+        over the whole video takes, with their global frame numbers. Matches
+        are ranked by the caller once every segment is back, so on_match is
+        not called.
+        
+        Args:
+            start_frame, end_frame: Frame range [start, end) of the segment
+            with_features: Also return the features for the gallery index
+        Returns:
+            segment: Per-detection arrays ("frame_nums", "bboxes", "sims",
+                "features"), "frames_processed", stage "stats",
+                "persons_per_frame" and the "motion" gate summary
+        """
+        video_info = self.get_video_info(video_path)
+        sampled = self.sample_frame_numbers(video_info["fps"], video_info["total_frames"], frame_interval, samples_per_second)
+        frame_numbers = itertools.takewhile(lambda n: n < end_frame, (n for n in sampled if n >= start_frame))
+        
+        print(f"\n🧩 Segment frames {start_frame}-{end_frame}")
+        frames = self.extract_video_frames(video_path, detector=detector, frame_numbers=frame_numbers)
+        motion_gate = MotionGate(motion_threshold) if motion_threshold else None
+        if motion_gate is not None:
+            frames = motion_gate.filter(frames)
+        
+        references = as_reference_set(ref_feature)
+        pipeline = self.analysis_pipeline(progress, cancel_event, None, detector)
+        table = ScoreTable(columns=len(references))
+        features = []
+        frames_processed = 0
+        for frame_data in pipeline.run(frames, references):
+            frames_processed += 1
+            persons = frame_data['persons']
+            if not persons:
+                continue
+            table.append(np.stack([person['similarities'] for person in persons]), frame_data['frame_num'], [person['bbox'] for person in persons])
+            if with_features:
+                features.append(normalize_rows(np.stack([person['feature'] for person in persons])).astype(FEATURE_DTYPE))
+        
+        return {
+            "start_frame": start_frame,
+            "end_frame": end_frame,
+            "frames_processed": motion_gate.frames_checked if motion_gate is not None else frames_processed,
+            "frame_nums": table.frame_nums.copy(),
+            "bboxes": table.bboxes.copy(),
+            "sims": table.sims.copy(),
+            "features": (np.concatenate(features) if features else None) if with_features else None,
+            "stats": pipeline.stats,
+            "persons_per_frame": pipeline.persons_per_frame,
+            "motion": motion_gate.summary() if motion_gate is not None else None
+        }
+    
+    def search_segments(
+        self,
+        video_path: str,
+        ref_feature: Union[np.ndarray, ReferenceSet],
+        fps: float,
+        total_frames: int,
+        segments: int,
+        pool,
+        threshold: float = 0.70,
+        top_n: int = 3,
+        frame_interval: int = 30,
+        samples_per_second: Optional[float] = None,
+        progress: Optional[Callable[[Dict], None]] = None,
+        cancel_event: Optional[threading.Event] = None,
+        writer: Optional[GalleryWriter] = None,
+        motion_threshold: Optional[float] = None,
+        on_match: Optional[Callable[[Dict], None]] = None,
+        detector: Optional[DetectorPlan] = None,
+        min_segment_seconds: float = MIN_SEGMENT_SECONDS
+    ) -> Tuple[List[Dict], np.ndarray, int, AnalysisPipeline, Dict]:
+        """
+        search_video split into time segments that worker processes analyze in parallel
+        
+        One capture decodes on one thread, so a long video on its own keeps a
+        single worker busy. Here every segment is a separate search_segment
+        task in the worker pool, each with its own capture and pipeline. The
+        segments are merged in frame order into one find_matches (and the
+        gallery writer), so ranking and the index are the same as for one pass.
+        
+        Args:
+            total_frames: Frame count from the container (segments are cut from it)
+            segments: Number of segments (fewer if they would be shorter than
+                min_segment_seconds)
+            pool: WorkerPool whose workers run the segments
+            motion_threshold: Motion gate per segment (each segment's first
+                sampled frame always passes)
+        Returns:
+            matches, all_sims, frames_processed: As returned by search_video
+            pipeline: Stage counters of all segments merged
+            report: {"segments": per-segment frame ranges and counts, "motion": merged gate summary}
+        """
+        references = as_reference_set(ref_feature)
+        step = fps / samples_per_second if samples_per_second else frame_interval
+        ranges = self.segment_ranges(total_frames, segments, max(step, min_segment_seconds * fps))
+        print(f"\n🧩 Splitting the video into {len(ranges)} segments of ~{(ranges[0][1] - ranges[0][0]) / fps:.0f}s...")
+        
+        # Live counters of every segment, summed for the progress callback
+        lock = threading.Lock()
+        counters = [{} for _ in ranges]
+        
+        def segment_progress(i: int) -> Callable[[Dict], None]:
+            def report(update: Dict):
+                with lock:
+                    counters[i] = update
+                    total = {name: sum(c.get(name, 0) for c in counters) for name in update}
+                total["segments"] = len(ranges)
+                progress(total)
+            return report
+        
+        # Stops every segment when the analysis is cancelled or fails
+        stop = threading.Event()
+        futures = [
+            pool.submit(
+                "search_segment",
+                {
+                    "video_path": video_path,
+                    "ref_feature": references,
+                    "start_frame": start,
+                    "end_frame": end,
+                    "frame_interval": frame_interval,
+                    "samples_per_second": samples_per_second,
+                    "motion_threshold": motion_threshold,
+                    "detector": detector,
+                    "with_features": writer is not None
+                },
+                segment_progress(i) if progress is not None else None,
+                None,
+                stop
+            )
+            for i, (start, end) in enumerate(ranges)
+        ]
+        
+        def wait(future):
+            while True:
+                if cancel_event is not None and cancel_event.is_set():
+                    raise AnalysisCancelled("Analysis cancelled")
+                try:
+                    return future.result(timeout=0.1)
+                except FutureTimeout:
+                    continue
+        
+        results = []
+        
+        def detections() -> Iterator[Dict]:
+            # Segment order keeps frame numbers increasing (gallery rows are in frame order)
+            for future in futures:
+                segment = wait(future)
+                results.append(segment)
+                yield from self.stored_detections(segment["frame_nums"], segment["bboxes"], segment["sims"], segment["features"])
+        
+        try:
+            all_detections = detections()
+            if writer is not None:
+                all_detections = self.record_detections(all_detections, writer)
+            if on_match is not None:
+                all_detections = self.report_matches(all_detections, references, fps, threshold, top_n, on_match)
+            
+            print("\n✅ Finding best matches...")
+            matches, all_sims, _ = self.find_matches(all_detections, fps, threshold, top_n, len(references))
+        finally:
+            stop.set()
+            for future in futures:
+                future.cancel()
+        
+        pipeline = self.analysis_pipeline(detector=detector)
+        for segment in results:
+            pipeline.merge(segment["stats"], segment["persons_per_frame"])
+        frames_processed = sum(segment["frames_processed"] for segment in results)
+        
+        report = {
+            "segments": [
+                {
+                    "start_frame": segment["start_frame"],
+                    "end_frame": segment["end_frame"],
+                    "start_seconds": round(segment["start_frame"] / fps, 3),
+                    "end_seconds": round(segment["end_frame"] / fps, 3),
+                    "frames": segment["frames_processed"],
+                    "detections": len(segment["frame_nums"])
+                }
+                for segment in results
+            ],
+            "motion": None
+        }
+        if motion_threshold:
+            report["motion"] = {
+                "frames_checked": sum(segment["motion"]["frames_checked"] for segment in results),
+                "frames_skipped": sum(segment["motion"]["frames_skipped"] for segment in results),
+                "min_changed_fraction": motion_threshold
+            }
+        
+        print("\n⏱️  Pipeline throughput (all segments):")
+        for stage, stats in pipeline.report().items():
+            print(f"   {stage:<7} {stats['items']:>6} {stats['unit']:<6} {stats['items_per_second']:>8.1f}/s busy, {stats['cpu_seconds']:.1f}s cpu, {stats['wall_seconds']:.1f}s wall")
+        
+        return matches, all_sims, frames_processed, pipeline, report
+    
+    def build_references(
+        self,
+        reference_image_path: Union[str, List[str]],
+        identities: Optional[List[str]] = None,
+        fusion: str = "max"
+    ) -> ReferenceSet:
+        """
+        Load reference image(s) and embed them in one OSNet batch
+        
+        Args:
+            reference_image_path: Path to reference person image, or a list of paths
+            identities: Identity label per reference image (default: all the same person)
+            fusion: How photos of one identity are combined, "max" or "mean"
+        Returns:
+            references: ReferenceSet used to score crops
+        """
+        reference_paths = [reference_image_path] if isinstance(reference_image_path, str) else list(reference_image_path)
+        print(f"\n📸 Loading {len(reference_paths)} reference image(s)...")
+        ref_imgs = [Image.open(path).convert('RGB') for path in reference_paths]
+        print("✅ Reference image loaded")
+        
+        print("\n🔍 Extracting reference features...")
+        with self._embed_lock:
+            ref_features = self.embedder.embed(ref_imgs)
+        references = ReferenceSet(ref_features, identities, fusion)
+        print(f"✅ Feature shape: {ref_features.shape}, {len(references)} identit{'ies' if len(references) > 1 else 'y'}")
+        
+        return references
+    
+    def similarity_statistics(self, sims: np.ndarray, matches: List[Dict]) -> Dict:
+        """Response statistics block for one similarity column"""
+        return {
+            "total_detections": len(sims),
+            "mean_similarity": float(sims.mean()) if len(sims) > 0 else 0,
+            "max_similarity": float(sims.max()) if len(sims) > 0 else 0,
+            "matches_found": len(matches)
+        }
     
     def image_to_base64(self, img: Image.Image) -> str:
         """Convert PIL Image to base64 string"""
@@ -256,21 +1428,117 @@ class PersonReIDService:
         img_str = base64.b64encode(buffered.getvalue()).decode()
         return f"data:image/jpeg;base64,{img_str}"
     
+    def archive_video(
+        self,
+        entry: GalleryEntry,
+        video_hash: str,
+        video_path: str,
+        video_info: Dict,
+        camera: Optional[str] = None,
+        recorded_at: Optional[str] = None
+    ) -> int:
+        """
+        Add a video's indexed detections to the footage archive
+        
+        Args:
+            entry: Gallery entry of the video
+            camera: Archive shard (the detector config camera name), "unknown" if None
+            recorded_at: ISO time of the first frame (default: file modification
+                time minus the duration, i.e. the file was written as recording ended)
+        Returns:
+            rows: Detections added (0 if the video was already archived)
+        """
+        if recorded_at is not None:
+            start = datetime.fromisoformat(recorded_at)
+        else:
+            start = datetime.fromtimestamp(os.path.getmtime(video_path) - video_info["duration_seconds"])
+        try:
+            rows = self.archive.add(
+                entry.features, entry.frame_nums, entry.bboxes, video_hash, camera or "unknown",
+                start, entry.info["fps"], os.path.basename(video_path)
+            )
+        except OSError as e:
+            # The analysis result does not depend on the archive
+            print(f"⚠️  Could not archive {video_path}: {e}")
+            return 0
+        if rows:
+            print(f"🗄️  Archived {rows} detections ({camera or 'unknown'}, {start.isoformat()})")
+        return rows
+    
     def analyze(
         self, 
-        reference_image_path: str, 
+        reference_image_path: Union[str, List[str]], 
         video_path: str, 
         threshold: float = 0.70,
-        top_n: int = 3
+        top_n: int = 3,
+        frame_interval: int = 30,
+        samples_per_second: Optional[float] = None,
+        progress: Optional[Callable[[Dict], None]] = None,
+        cancel_event: Optional[threading.Event] = None,
+        use_gallery: bool = True,
+        identities: Optional[List[str]] = None,
+        fusion: str = "max",
+        references: Optional[ReferenceSet] = None,
+        track: bool = False,
+        motion_threshold: Optional[float] = None,
+        images: str = "inline",
+        on_match: Optional[Callable[[Dict], None]] = None,
+        profile: Optional[str] = None,
+        camera: Optional[str] = None,
+        roi: Optional[Union[str, List]] = None,
+        search: str = "fixed",
+        interest_threshold: Optional[float] = None,
+        refine_factor: float = 4.0,
+        segments: int = 0,
+        segment_pool=None,
+        recorded_at: Optional[str] = None
     ) -> Dict:
         """
         Main analysis pipeline
         
+        Several reference images can be searched for in one pass: every crop
+        is scored against all of them with a single matrix product.
+        
         Args:
-            reference_image_path: Path to reference person image
+            reference_image_path: Path to reference person image, or a list of paths
             video_path: Path to CCTV video
             threshold: Similarity threshold (0.65-0.80 recommended)
             top_n: Number of top matches to return
+            frame_interval: Sample every Nth frame
+            samples_per_second: Sample N frames per second instead of every Nth frame
+            progress: Called with live counters (frames decoded/detected, crops embedded)
+            cancel_event: Set to stop the analysis; raises AnalysisCancelled
+            use_gallery: Reuse / build the persistent detection index for this video
+            identities: Identity label per reference image (default: all the same person)
+            fusion: How photos of one identity are combined, "max" or "mean"
+            references: Precomputed build_references() result; reference_image_path,
+                identities and fusion are ignored when given (batch analysis)
+            track: Link detections into tracklets, embed a few crops per tracklet
+                and return one match per tracklet with its appearance interval
+            motion_threshold: Skip sampled frames where less than this fraction
+                of the (downscaled) image changed, before running YOLO
+            images: Match images as "inline" base64 JPEGs (full crop), "ref"
+                (downscaled thumbnail in the artifact store, returned as a
+                reference) or "none"
+            on_match: Called with each provisional match while the video is
+                searched (not for videos already in the gallery index)
+            profile: "cprofile" or "torch" to dump a profile of this analysis
+                into profile_dir (path returned under "profile")
+            camera: Camera name in the detector config (its ROI, input size etc.)
+            roi: Region to search, in fractions of the frame ("x1,y1,x2,y2" or
+                "x,y;x,y;x,y"); replaces the camera's ROI
+            search: "fixed" samples the whole video at one rate; "adaptive"
+                samples at that rate first, then re-samples more densely (down
+                to every frame) around detections scoring interest_threshold
+            interest_threshold: Similarity that triggers refinement in adaptive
+                mode (default: threshold - 0.10)
+            refine_factor: Sampling step divisor per adaptive refinement pass
+            segments: Split the video into this many time segments, analyzed in
+                parallel by segment_pool's worker processes (0 or 1: one pass)
+            segment_pool: WorkerPool for segments (call analyze in the parent,
+                not in a worker, when it is given)
+            recorded_at: ISO wall-clock time of the first frame, for the footage
+                archive (default: file modification time minus the duration)
         
         Returns:
             results: Dictionary with matches and metadata
@@ -279,60 +1547,236 @@ class PersonReIDService:
         print("🚀 STARTING PERSON RE-IDENTIFICATION")
         print("="*80)
         
+        if images not in IMAGE_MODES:
+            raise ValueError(f"images must be one of {IMAGE_MODES}")
+        if images == "ref" and self.artifacts is None:
+            raise ValueError("images='ref' needs an artifact store (artifact_dir)")
+        if search not in SEARCH_MODES:
+            raise ValueError(f"search must be one of {SEARCH_MODES}")
+        if search == "adaptive" and track:
+            raise ValueError("search='adaptive' cannot be combined with track")
+        if segments > 1:
+            if segment_pool is None:
+                raise ValueError("segments needs a worker pool (segment_pool)")
+            if track or search != "fixed":
+                raise ValueError("segments cannot be combined with track or adaptive search")
+        if interest_threshold is None:
+            interest_threshold = threshold - INTEREST_MARGIN
+        detector_settings = self.detector_settings(camera, roi)
+        
+        # Stage timings go into the response and the /metrics histograms
+        started = time.perf_counter()
+        profiler = RequestProfiler(profile, self.profile_dir) if profile else None
+        pipeline, stages, entry, status = None, {}, None, "error"
+        
         try:
-            # 1. Load reference image
-            print("\n📸 Loading reference image...")
-            ref_img = Image.open(reference_image_path).convert('RGB')
-            print("✅ Reference image loaded")
+            if profiler is not None:
+                profiler.start()
             
-            # 2. Extract reference features
-            print("\n🔍 Extracting reference features...")
-            ref_feature = self.extract_features(ref_img)
-            print(f"✅ Feature shape: {ref_feature.shape}")
+            # 1-2. Load reference image(s) and extract their features
+            if references is None:
+                references = self.build_references(reference_image_path, identities, fusion)
+            multi = len(references) > 1
             
-            # 3. Extract video frames
-            print("\n🎬 Extracting video frames...")
-            frames, frame_nums, fps = self.extract_video_frames(video_path, frame_interval=30)
+            # 3. Look the video up in the gallery index
+            video_info = self.get_video_info(video_path)
+            fps = video_info["fps"]
+            if video_info["width"] > 0 and video_info["height"] > 0:
+                detector = detector_settings.resolve(video_info["width"], video_info["height"])
+            elif detector_settings.roi is None:
+                # Unknown frame size: resolved per frame in detect_persons
+                detector = None
+            else:
+                raise ValueError("Cannot read the video frame size needed for the ROI")
+            step = fps / samples_per_second if samples_per_second else frame_interval
+            tracker = IoUTracker(fps, sample_step=step) if track else None
+            segmented = None
+            sampler = None
+            if search == "adaptive":
+                sampler = AdaptiveSampler(step, interest_threshold, video_info["total_frames"], refine_factor)
+            motion_gate = MotionGate(motion_threshold) if motion_threshold else None
+            entry, video_hash, key = None, None, None
+            if use_gallery and self.gallery is not None:
+                print("\n🗂️  Checking gallery index...")
+                video_hash = file_hash(video_path)
+                key = sampling_key(frame_interval, samples_per_second, motion_threshold, detector_settings.key())
+                entry = self.gallery.get(video_hash, key)
             
-            # 4. Detect and match
-            print("\n🔎 Detecting persons and matching...")
-            all_detections = self.detect_and_match(frames, ref_feature)
+            writer = None
+            if sampler is not None:
+                # 4-5. Coarse-to-fine: the coarse pass comes from the index when it has one
+                writer = self.gallery.writer(video_hash, key) if video_hash and entry is None else None
+                try:
+                    matches, all_sims, frames_processed, pipeline = self.adaptive_search(
+                        video_path, references, fps, sampler, threshold, top_n,
+                        frame_interval, samples_per_second, progress, cancel_event, writer,
+                        motion_gate, on_match, profiler, detector, entry
+                    )
+                except BaseException:
+                    if writer is not None:
+                        writer.abort()
+                    raise
+                stages = dict(pipeline.stats) if pipeline is not None else {}
+                if entry is not None:
+                    motion = entry.info.get("motion")
+                else:
+                    motion = motion_gate.summary() if motion_gate is not None else None
+                indexed_frames = sampler.passes[0]["frames"]
+            elif entry is None and segments > 1:
+                # 4-5. Long video: time segments in parallel worker processes
+                writer = self.gallery.writer(video_hash, key) if video_hash else None
+                try:
+                    matches, all_sims, frames_processed, pipeline, segmented = self.search_segments(
+                        video_path, references, fps, video_info["total_frames"], segments, segment_pool,
+                        threshold, top_n, frame_interval, samples_per_second, progress, cancel_event, writer,
+                        motion_threshold, on_match, detector
+                    )
+                except BaseException:
+                    if writer is not None:
+                        writer.abort()
+                    raise
+                stages = dict(pipeline.stats)
+                motion = segmented["motion"]
+                indexed_frames = frames_processed
+            elif entry is not None:
+                # 4-5. Already indexed: score stored features, no decoding or inference
+                print(f"⚡ Video already indexed ({len(entry)} detections), skipping decode")
+                match_stats = StageStats("match", "detections")
+                with match_stats.measure(len(entry)):
+                    matches, all_sims, frames_processed = self.find_indexed_matches(
+                        entry, references, fps, threshold, top_n, tracker
+                    )
+                stages = {"match": match_stats}
+                motion = entry.info.get("motion")
+            else:
+                # Tracked runs embed only some detections, so they are not indexed
+                writer = self.gallery.writer(video_hash, key) if video_hash and tracker is None else None
+                try:
+                    matches, all_sims, frames_processed, pipeline = self.search_video(
+                        video_path, references, fps, threshold, top_n,
+                        frame_interval, samples_per_second, progress, cancel_event, writer, tracker,
+                        motion_gate, on_match, profiler, detector
+                    )
+                except BaseException:
+                    if writer is not None:
+                        writer.abort()
+                    raise
+                stages = dict(pipeline.stats)
+                motion = motion_gate.summary() if motion_gate is not None else None
+                indexed_frames = frames_processed
             
-            # 5. Find best matches
-            print("\n✅ Finding best matches...")
-            matches, all_sims = self.find_matches(
-                all_detections, frame_nums, fps, threshold, top_n
-            )
+            if writer is not None:
+                indexed = writer.commit({
+                    "video_hash": video_hash,
+                    "sampling": key,
+                    "model_tag": self.gallery.model_tag,
+                    "fps": float(fps),
+                    "frames_processed": indexed_frames,
+                    "motion": motion,
+                    "video_info": video_info
+                })
+                print(f"🗂️  Indexed {len(indexed)} detections for repeat searches")
+            
+            # Every indexed video goes into the footage archive once (cached
+            # entries too, so galleries from before the archive are added)
+            archived = 0
+            stored = indexed if writer is not None else entry
+            if self.archive is not None and stored is not None and len(stored):
+                archived = self.archive_video(stored, video_hash, video_path, video_info, camera, recorded_at)
             
             # 6. Format results
             print("\n📊 Formatting results...")
             
+            # Each detection (or tracklet) counts with its best-matching identity
+            best_sims = all_sims.max(axis=1)
+            top_matches = matches[:top_n]
+            
+            # Only the reported matches get an image, re-cut from the video
+            if images != "none":
+                stages["crop"] = StageStats("crop", "crops")
+                stages["encode"] = StageStats("encode", "images")
+                imaged = matches if multi else top_matches
+                with stages["crop"].measure(len(imaged)):
+                    self.attach_crops(video_path, imaged)
+            
             results = {
                 "status": "success",
                 "video_info": {
                     "fps": float(fps),
-                    "total_frames": len(frames),
-                    "duration_seconds": float(len(frames) * 30 / fps)
+                    "total_frames": frames_processed,
+                    "duration_seconds": float(video_info["duration_seconds"])
                 },
-                "statistics": {
-                    "total_detections": len(all_sims),
-                    "mean_similarity": float(all_sims.mean()) if len(all_sims) > 0 else 0,
-                    "max_similarity": float(all_sims.max()) if len(all_sims) > 0 else 0,
-                    "matches_found": len(matches)
+                "statistics": self.similarity_statistics(best_sims, top_matches),
+                "pipeline": {},
+                "index": {
+                    "video_hash": video_hash,
+                    "cached": entry is not None,
+                    "archived": archived
                 },
                 "matches": []
             }
+            if tracker is not None:
+                # Statistics above are per tracklet
+                results["tracking"] = tracker.summary()
+            if motion is not None:
+                results["motion"] = motion
+            if detector is not None:
+                results["detector"] = detector.to_dict()
+            if sampler is not None:
+                results["search"] = sampler.summary()
+            if segmented is not None:
+                results["segments"] = segmented["segments"]
             
-            # Convert matches to JSON-serializable format
-            for i, match in enumerate(matches):
-                results["matches"].append({
-                    "rank": i + 1,
-                    "confidence": float(match['similarity']),
-                    "frame_number": int(match['frame_num']),
-                    "timestamp_seconds": float(match['time']),
-                    "bbox": [int(x) for x in match['bbox']],
-                    "image_base64": self.image_to_base64(match['image'])
-                })
+            # Convert matches to JSON-serializable format (each crop encoded once)
+            encoded = {}
+            def format_matches(selected):
+                formatted = []
+                for i, match in enumerate(selected):
+                    item = {
+                        "rank": i + 1,
+                        "confidence": float(match['similarity']),
+                        "frame_number": int(match['frame_num']),
+                        "timestamp_seconds": float(match['time']),
+                        "bbox": [int(x) for x in match['bbox']]
+                    }
+                    if images != "none" and id(match) not in encoded:
+                        with stages["encode"].measure(1):
+                            if images == "ref":
+                                encoded[id(match)] = self.artifacts.put(match['image'])
+                            else:
+                                encoded[id(match)] = self.image_to_base64(match['image'])
+                    if images == "ref":
+                        item["image"] = encoded[id(match)]
+                    elif images == "inline":
+                        item["image_base64"] = encoded[id(match)]
+                    if multi:
+                        item["identity"] = references.names[match['identity']]
+                    if 'track' in match:
+                        item["track"] = match['track']
+                    formatted.append(item)
+                return formatted
+            
+            results["matches"] = format_matches(top_matches)
+            
+            if multi:
+                results["identities"] = []
+                for g, name in enumerate(references.names):
+                    selected = [match for match in matches if match['identity'] == g]
+                    results["identities"].append({
+                        "identity": name,
+                        "references": references.reference_counts[g],
+                        "fusion": references.fusion,
+                        "statistics": self.similarity_statistics(all_sims[:, g], selected),
+                        "matches": format_matches(selected)
+                    })
+            
+            results["pipeline"] = {name: stats.to_dict() for name, stats in stages.items()}
+            results["timing"] = {"total_seconds": round(time.perf_counter() - started, 3)}
+            status = "success"
+            if profiler is not None:
+                profiler.stop()
+                results["profile"] = {"mode": profile, "path": profiler.dump()}
+                print(f"🔬 Profile written to {results['profile']['path']}")
             
             print("\n" + "="*80)
             print("✅ ANALYSIS COMPLETE")
@@ -343,6 +1787,10 @@ class PersonReIDService:
             
             return results
             
+        except AnalysisCancelled:
+            print("\n🛑 Analysis cancelled")
+            status = "cancelled"
+            raise
         except Exception as e:
             print(f"\n❌ Error during analysis: {e}")
             return {
@@ -350,14 +1798,25 @@ class PersonReIDService:
                 "message": str(e),
                 "matches": []
             }
+        finally:
+            if profiler is not None:
+                profiler.stop()
+            record_analysis(
+                {name: stats.to_dict() for name, stats in stages.items()},
+                time.perf_counter() - started,
+                status,
+                cached=entry is not None,
+                batch_sizes={name: stats.batch_sizes for name, stats in stages.items() if stats.batch_sizes},
+                persons_per_frame=pipeline.persons_per_frame if pipeline is not None else None
+            )
 
 
 # Singleton instance (loaded once)
 _service_instance = None
 
-def get_service(model_dir: str = "models") -> PersonReIDService:
-    """Get or create service instance"""
+def get_service(model_dir: str = "models", embed_batch_size: int = 32, **options) -> PersonReIDService:
+    """Get or create service instance (options go to PersonReIDService)"""
     global _service_instance
     if _service_instance is None:
-        _service_instance = PersonReIDService(model_dir)
+        _service_instance = PersonReIDService(model_dir, embed_batch_size, **options)
     return _service_instance
\ No newline at end of file
@@ -0,0 +1,344 @@
+"""
+Staged Analysis Pipeline
+Overlaps video decode, YOLO detection and OSNet embedding using bounded queues
+"""
+
+import queue
+import threading
+import time
+from collections import Counter as Tally
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from detector import DetectorPlan
+from profiling import RequestProfiler, thread_profile
+
+
+# Marks the end of a stage's output
+_DONE = object()
+
+
+class AnalysisCancelled(Exception):
+    """Raised when an analysis is stopped through its cancel event"""
+
+
+class StageStats:
+    """Throughput counters for one pipeline stage"""
+
+    def __init__(self, name: str, unit: str):
+        self.name = name
+        self.unit = unit
+        self.items = 0
+        self.busy_seconds = 0.0
+        # CPU time of the stage's own thread while busy (time.thread_time)
+        self.cpu_seconds = 0.0
+        # Time inside model calls (YOLO / OSNet) and inputs per call
+        self.model_seconds = 0.0
+        self.batch_sizes = Tally()
+        self.started = None
+        self.finished = None
+
+    @contextmanager
+    def measure(self, items: int = 0):
+        """Count the enclosed work as busy time (for stages outside the pipeline threads)"""
+        if self.started is None:
+            self.started = time.perf_counter()
+        t0, cpu0 = time.perf_counter(), time.thread_time()
+        try:
+            yield
+        finally:
+            self.busy_seconds += time.perf_counter() - t0
+            self.cpu_seconds += time.thread_time() - cpu0
+            self.items += items
+            self.finished = time.perf_counter()
+
+    def add_batch(self, size: int, seconds: float):
+        """Record one model call"""
+        self.batch_sizes[size] += 1
+        self.model_seconds += seconds
+
+    def merge(self, other: "StageStats"):
+        """Add another run of the same stage (e.g. a later pass over the same video)"""
+        self.items += other.items
+        self.busy_seconds += other.busy_seconds
+        self.cpu_seconds += other.cpu_seconds
+        self.model_seconds += other.model_seconds
+        self.batch_sizes.update(other.batch_sizes)
+        if other.started is not None:
+            self.started = other.started if self.started is None else min(self.started, other.started)
+        if other.finished is not None:
+            self.finished = other.finished if self.finished is None else max(self.finished, other.finished)
+
+    def to_dict(self) -> Dict:
+        wall = (self.finished or time.perf_counter()) - self.started if self.started else 0.0
+        data = {
+            "items": self.items,
+            "unit": self.unit,
+            "busy_seconds": round(self.busy_seconds, 3),
+            "cpu_seconds": round(self.cpu_seconds, 3),
+            "wall_seconds": round(wall, 3),
+            "items_per_second": round(self.items / self.busy_seconds, 2) if self.busy_seconds > 0 else 0.0
+        }
+        if self.batch_sizes:
+            batches = sum(self.batch_sizes.values())
+            data["model_seconds"] = round(self.model_seconds, 3)
+            data["batches"] = batches
+            data["mean_batch_size"] = round(sum(size * n for size, n in self.batch_sizes.items()) / batches, 2)
+            data["max_batch_size"] = max(self.batch_sizes)
+        return data
+
+
+class AnalysisPipeline:
+    """
+    Producer/consumer pipeline for one analysis
+
+    decoder thread  -> frame queue     -> detector thread (batched YOLO)
+                    -> detection queue -> embedder stage (batched OSNet, caller's thread)
+                    -> match stage (the caller's consumer, e.g. find_matches)
+
+    Queues are bounded, so a fast stage blocks instead of buffering the
+    whole video, and all three stages run at the same time.
+    """
+
+    def __init__(
+        self,
+        service,
+        detect_batch_size: int = 4,
+        frame_queue_size: int = 8,
+        detection_queue_size: int = 8,
+        progress: Optional[Callable[[Dict], None]] = None,
+        cancel_event: Optional[threading.Event] = None,
+        profiler: Optional[RequestProfiler] = None,
+        detector: Optional[DetectorPlan] = None
+    ):
+        """
+        Args:
+            service: Loaded PersonReIDService
+            detect_batch_size: Frames per YOLO call
+            frame_queue_size: Max decoded frames waiting for detection
+            detection_queue_size: Max detected frames waiting for embedding
+            progress: Called with progress() after every scored frame
+            cancel_event: Stops all stages (run raises AnalysisCancelled) once set
+            profiler: Request profiler; the decode and detect threads are profiled too
+            detector: DetectorPlan for the video (service default if None)
+        """
+        if detect_batch_size < 1:
+            raise ValueError("detect_batch_size must be >= 1")
+
+        self.service = service
+        self.detect_batch_size = detect_batch_size
+        self.frame_queue = queue.Queue(maxsize=frame_queue_size)
+        self.detection_queue = queue.Queue(maxsize=detection_queue_size)
+        self.progress_callback = progress
+        self.cancel_event = cancel_event
+        self.profiler = profiler
+        self.detector = detector
+        self.stats = {
+            "decode": StageStats("decode", "frames"),
+            "detect": StageStats("detect", "frames"),
+            "embed": StageStats("embed", "crops"),
+            "match": StageStats("match", "frames")
+        }
+        # Crowd density: number of frames with each person count
+        self.persons_per_frame = Tally()
+
+        self._stop = threading.Event()
+        self._error = None
+        self._embed_idle = 0.0
+        self._embed_idle_cpu = 0.0
+        self._threads: List[threading.Thread] = []
+
+    def _put(self, q: queue.Queue, item) -> bool:
+        """Blocking put that gives up once the pipeline is stopped"""
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q: queue.Queue):
+        """Blocking get that gives up once the pipeline is stopped"""
+        while not self._stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def _fail(self, e: Exception):
+        if self._error is None:
+            self._error = e
+        self._stop.set()
+
+    def _decode(self, frames: Iterable[Tuple[int, np.ndarray]]):
+        with thread_profile(self.profiler):
+            self._decode_frames(frames)
+
+    def _decode_frames(self, frames: Iterable[Tuple[int, np.ndarray]]):
+        stats = self.stats["decode"]
+        stats.started = time.perf_counter()
+        iterator = iter(frames)
+        try:
+            while not self._stop.is_set():
+                t0, cpu0 = time.perf_counter(), time.thread_time()
+                item = next(iterator, _DONE)
+                stats.busy_seconds += time.perf_counter() - t0
+                stats.cpu_seconds += time.thread_time() - cpu0
+                if item is _DONE:
+                    break
+                stats.items += 1
+                if not self._put(self.frame_queue, item):
+                    break
+        except Exception as e:
+            self._fail(e)
+        finally:
+            # Releases the video capture even when stopped early
+            if hasattr(iterator, "close"):
+                iterator.close()
+            stats.finished = time.perf_counter()
+            self._put(self.frame_queue, _DONE)
+
+    def _detect(self):
+        with thread_profile(self.profiler):
+            self._detect_frames()
+
+    def _detect_frames(self):
+        stats = self.stats["detect"]
+        stats.started = time.perf_counter()
+        frame_idx = 0
+        done = False
+        try:
+            while not done and not self._stop.is_set():
+                # Gather up to detect_batch_size frames for one YOLO call
+                group = []
+                while len(group) < self.detect_batch_size:
+                    item = self._get(self.frame_queue)
+                    if item is _DONE:
+                        done = True
+                        break
+                    group.append(item)
+                if not group:
+                    break
+
+                t0, cpu0 = time.perf_counter(), time.thread_time()
+                persons_per_frame = self.service.detect_persons([frame for _, frame in group], self.detector)
+                elapsed = time.perf_counter() - t0
+                stats.busy_seconds += elapsed
+                stats.cpu_seconds += time.thread_time() - cpu0
+                stats.add_batch(len(group), elapsed)
+                stats.items += len(group)
+
+                for (frame_num, _), persons in zip(group, persons_per_frame):
+                    self.persons_per_frame[len(persons)] += 1
+                    frame_data = {'frame_idx': frame_idx, 'frame_num': frame_num, 'persons': []}
+                    frame_idx += 1
+                    if not self._put(self.detection_queue, (frame_data, persons)):
+                        return
+        except Exception as e:
+            self._fail(e)
+        finally:
+            stats.finished = time.perf_counter()
+            self._put(self.detection_queue, _DONE)
+
+    def _detections(self) -> Iterator:
+        """Drain the detection queue (embedder stage input)"""
+        while True:
+            t0, cpu0 = time.perf_counter(), time.thread_time()
+            item = self._get(self.detection_queue)
+            self._embed_idle += time.perf_counter() - t0
+            self._embed_idle_cpu += time.thread_time() - cpu0
+            if item is _DONE:
+                return
+            yield item
+
+    def run(self, frames: Iterable[Tuple[int, np.ndarray]], ref_feature: np.ndarray, tracker=None) -> Iterator[Dict]:
+        """
+        Run all stages over a frame iterable
+
+        Args:
+            frames: Iterable of (frame_number, frame), e.g. extract_video_frames()
+            ref_feature: Reference person feature vector
+            tracker: Optional IoUTracker, see embed_and_match
+        Yields:
+            frame_data: Scored detections per frame, in frame order
+        """
+        self._threads = [
+            threading.Thread(target=self._decode, args=(frames,), name="reid-decode", daemon=True),
+            threading.Thread(target=self._detect, name="reid-detect", daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+
+        stats = self.stats["embed"]
+        match_stats = self.stats["match"]
+        stats.started = match_stats.started = time.perf_counter()
+        cpu_started = time.thread_time()
+        # Time the embedder stage spends waiting on its input or on our consumer
+        self._embed_idle = 0.0
+        self._embed_idle_cpu = 0.0
+
+        def embedded(crops: int, seconds: float):
+            # Counted per OSNet call: with a tracker most detections are never embedded
+            stats.add_batch(crops, seconds)
+            stats.items += crops
+
+        try:
+            for frame_data in self.service.embed_and_match(
+                self._detections(), ref_feature, tracker, on_batch=embedded
+            ):
+                t0, cpu0 = time.perf_counter(), time.thread_time()
+                if self.cancel_event is not None and self.cancel_event.is_set():
+                    raise AnalysisCancelled("Analysis cancelled")
+                if self.progress_callback is not None:
+                    self.progress_callback(self.progress())
+                yield frame_data
+                elapsed, cpu = time.perf_counter() - t0, time.thread_time() - cpu0
+                self._embed_idle += elapsed
+                self._embed_idle_cpu += cpu
+                match_stats.busy_seconds += elapsed
+                match_stats.cpu_seconds += cpu
+                match_stats.items += 1
+        finally:
+            stats.finished = match_stats.finished = time.perf_counter()
+            stats.busy_seconds = stats.finished - stats.started - self._embed_idle
+            stats.cpu_seconds = time.thread_time() - cpu_started - self._embed_idle_cpu
+            self.close()
+
+        if self._error is not None:
+            raise self._error
+
+    def close(self):
+        """Stop all stages and wait for the threads to exit"""
+        self._stop.set()
+        for thread in self._threads:
+            thread.join()
+
+    def progress(self) -> Dict:
+        """Live counters: frames decoded, frames detected, crops embedded"""
+        return {
+            "frames_decoded": self.stats["decode"].items,
+            "frames_detected": self.stats["detect"].items,
+            "crops_embedded": self.stats["embed"].items
+        }
+
+    def merge(self, stats: Dict[str, StageStats], persons_per_frame: Optional[Tally] = None):
+        """
+        Add the counters of another run over the same video
+
+        Args:
+            stats: Its per-stage stats (a later adaptive pass, or a video
+                segment analyzed in a worker process)
+            persons_per_frame: Its crowd density tally
+        """
+        for name, other in stats.items():
+            self.stats[name].merge(other)
+        if persons_per_frame is not None:
+            self.persons_per_frame.update(persons_per_frame)
+
+    def report(self) -> Dict:
+        """Per-stage item counts, busy/wall time and throughput"""
+        return {name: stats.to_dict() for name, stats in self.stats.items()}
@@ -0,0 +1,363 @@
+"""
+Profiling and Metrics
+Prometheus counters/histograms for the analysis stages (rendered in the text
+exposition format, no client library needed) and optional per-request
+cProfile / torch.profiler dumps
+"""
+
+import bisect
+import cProfile
+import os
+import pstats
+import threading
+import time
+import uuid
+from collections import Counter as Tally
+from contextlib import contextmanager, nullcontext
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Metric:
+    """Base for labelled metrics: one value (or bucket set) per label combination"""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labels):
+            raise ValueError(f"{self.name} takes labels {self.labels}")
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def drain(self) -> Dict:
+        """Take the values recorded so far and reset them (deltas for merge())"""
+        with self._lock:
+            values, self._values = self._values, {}
+        return values
+
+    def merge(self, values: Dict):
+        """Add values drained from the same metric in another process"""
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"] + self.samples()
+
+
+class Counter(Metric):
+    """Monotonic total"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def merge(self, values: Dict):
+        with self._lock:
+            for key, amount in values.items():
+                self._values[key] = self._values.get(key, 0.0) + amount
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}" for key, value in values]
+
+
+class Gauge(Counter):
+    """Value that goes up and down (set at scrape time)"""
+
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def merge(self, values: Dict):
+        with self._lock:
+            self._values.update(values)
+
+
+class Histogram(Metric):
+    """Cumulative bucket counts, sum and count of observations"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, buckets: Sequence[float], labels: Sequence[str] = ()):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> (per-bucket counts incl. +Inf, sum)
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], float]] = {}
+
+    def observe(self, value: float, count: int = 1, **labels):
+        """Record value, count times (for pre-aggregated tallies)"""
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[index] += count
+            self._values[key] = (counts, total + value * count)
+
+    def merge(self, values: Dict):
+        with self._lock:
+            for key, (counts, total) in values.items():
+                current, current_total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+                self._values[key] = ([a + b for a, b in zip(current, counts)], current_total + total)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+
+        lines = []
+        for key, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else _format_value(bound)
+                labels = _format_labels(self.labels, key, 'le="' + le + '"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """Named metrics, rendered together for GET /metrics"""
+
+    def __init__(self):
+        self._metrics: List[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def drain(self) -> Dict[str, Dict]:
+        """Values recorded since the last drain, by metric name (sent by worker processes)"""
+        drained = {}
+        for metric in self._metrics:
+            values = metric.drain()
+            if values:
+                drained[metric.name] = values
+        return drained
+
+    def merge(self, drained: Dict[str, Dict]):
+        """Fold a worker process's drain() into this registry"""
+        metrics = {metric.name: metric for metric in self._metrics}
+        for name, values in drained.items():
+            if name in metrics:
+                metrics[name].merge(values)
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)"""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+SECONDS_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+ANALYSES = REGISTRY.register(Counter(
+    "reid_analyses_total", "Finished analyses by outcome", ("status", "cached")
+))
+ANALYSIS_SECONDS = REGISTRY.register(Histogram(
+    "reid_analysis_seconds", "Wall time of one analysis", SECONDS_BUCKETS
+))
+STAGE_BUSY_SECONDS = REGISTRY.register(Histogram(
+    "reid_stage_busy_seconds", "Time one analysis spent working in a stage", SECONDS_BUCKETS, ("stage",)
+))
+STAGE_CPU_SECONDS = REGISTRY.register(Counter(
+    "reid_stage_cpu_seconds_total", "CPU time (stage thread) spent in a stage", ("stage",)
+))
+STAGE_MODEL_SECONDS = REGISTRY.register(Counter(
+    "reid_stage_model_seconds_total", "Time spent inside YOLO / OSNet calls", ("stage",)
+))
+STAGE_ITEMS = REGISTRY.register(Counter(
+    "reid_stage_items_total", "Items (frames, crops) processed by a stage", ("stage", "unit")
+))
+BATCH_SIZE = REGISTRY.register(Histogram(
+    "reid_batch_size", "Inputs per YOLO / OSNet call", (1, 2, 4, 8, 16, 32, 64, 128), ("stage",)
+))
+PERSONS_PER_FRAME = REGISTRY.register(Histogram(
+    "reid_persons_per_frame", "Persons detected per sampled frame (crowd density)", (0, 1, 2, 3, 5, 8, 13, 21, 34)
+))
+FRAME_LATENCY = REGISTRY.register(Histogram(
+    "reid_frame_latency_seconds", "Analysis wall time per sampled frame, by average crowd density",
+    (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5), ("crowd",)
+))
+
+
+def crowd_label(persons_per_frame: float) -> str:
+    """Coarse crowd density class of a video, by mean persons per sampled frame"""
+    if persons_per_frame < 1:
+        return "sparse"
+    if persons_per_frame < 5:
+        return "moderate"
+    return "dense"
+
+
+def record_analysis(
+    stages: Dict,
+    seconds: float,
+    status: str,
+    cached: bool = False,
+    batch_sizes: Optional[Dict[str, Tally]] = None,
+    persons_per_frame: Optional[Tally] = None
+):
+    """
+    Add one finished analysis to the metrics
+
+    Args:
+        stages: Stage report (stage -> StageStats.to_dict())
+        seconds: Wall time of the whole analysis
+        status: "success", "error" or "cancelled"
+        cached: Served from the gallery index
+        batch_sizes: Per stage, tally of inputs per model call
+        persons_per_frame: Tally of persons detected per sampled frame
+    """
+    ANALYSES.inc(status=status, cached=str(cached).lower())
+    ANALYSIS_SECONDS.observe(seconds)
+
+    for stage, stats in stages.items():
+        STAGE_BUSY_SECONDS.observe(stats["busy_seconds"], stage=stage)
+        STAGE_CPU_SECONDS.inc(stats.get("cpu_seconds", 0.0), stage=stage)
+        STAGE_ITEMS.inc(stats["items"], stage=stage, unit=stats["unit"])
+        if "model_seconds" in stats:
+            STAGE_MODEL_SECONDS.inc(stats["model_seconds"], stage=stage)
+
+    for stage, tally in (batch_sizes or {}).items():
+        for size, count in tally.items():
+            BATCH_SIZE.observe(size, count, stage=stage)
+
+    if persons_per_frame:
+        for persons, count in persons_per_frame.items():
+            PERSONS_PER_FRAME.observe(persons, count)
+        frames = sum(persons_per_frame.values())
+        mean = sum(persons * count for persons, count in persons_per_frame.items()) / frames
+        FRAME_LATENCY.observe(seconds / frames, crowd=crowd_label(mean))
+
+
+PROFILE_MODES = ("cprofile", "torch")
+
+
+class RequestProfiler:
+    """
+    cProfile or torch.profiler capture of one analysis, dumped to a file
+
+    cProfile hooks only the thread that enables it (before Python 3.12), so
+    the pipeline's decode and detect threads each run under thread() and all
+    the captures are merged into one .prof file (open with snakeviz or
+    pstats). torch mode records every thread where the installed PyTorch
+    supports it and writes a Chrome trace (chrome://tracing, Perfetto).
+    """
+
+    def __init__(self, mode: str, directory: str = "profiles", name: Optional[str] = None):
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"profile mode must be one of {PROFILE_MODES}")
+
+        self.mode = mode
+        self.directory = directory
+        self.name = name or f"{time.strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
+        self._profiles: List[cProfile.Profile] = []
+        self._torch = None
+        self._running = False
+
+    def start(self):
+        """Start capturing in the calling thread"""
+        if self.mode == "cprofile":
+            profile = cProfile.Profile()
+            profile.enable()
+            self._profiles.append(profile)
+        else:
+            self._torch = self._torch_profiler()
+            self._torch.__enter__()
+        self._running = True
+
+    def stop(self):
+        """Stop capturing (safe to call more than once)"""
+        if not self._running:
+            return
+        self._running = False
+        if self.mode == "cprofile":
+            self._profiles[0].disable()
+        else:
+            self._torch.__exit__(None, None, None)
+
+    @staticmethod
+    def _torch_profiler():
+        import torch
+        from torch.profiler import ProfilerActivity, profile
+
+        activities = [ProfilerActivity.CPU]
+        if torch.cuda.is_available():
+            activities.append(ProfilerActivity.CUDA)
+        try:
+            # Newer PyTorch can record the worker threads too
+            config = torch._C._profiler._ExperimentalConfig(profile_all_threads=True)
+            return profile(activities=activities, record_shapes=True, experimental_config=config)
+        except (AttributeError, TypeError):
+            return profile(activities=activities, record_shapes=True)
+
+    @contextmanager
+    def thread(self) -> Iterator[None]:
+        """Profile the current worker thread as well (cProfile mode)"""
+        if self.mode != "cprofile":
+            yield
+            return
+
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Python 3.12+: the request's profiler already covers every thread
+            yield
+            return
+        try:
+            yield
+        finally:
+            profile.disable()
+            self._profiles.append(profile)
+
+    def dump(self) -> str:
+        """Write the capture, returns its path"""
+        os.makedirs(self.directory, exist_ok=True)
+        if self.mode == "cprofile":
+            path = os.path.join(self.directory, f"{self.name}.prof")
+            stats = pstats.Stats(self._profiles[0])
+            for profile in self._profiles[1:]:
+                stats.add(profile)
+            stats.dump_stats(path)
+        else:
+            path = os.path.join(self.directory, f"{self.name}.trace.json")
+            self._torch.export_chrome_trace(path)
+        return path
+
+
+def thread_profile(profiler: Optional[RequestProfiler]):
+    """profiler.thread(), or a no-op without a profiler"""
+    return profiler.thread() if profiler is not None else nullcontext()
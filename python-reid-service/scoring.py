@@ -0,0 +1,195 @@
+"""
+Vectorised Similarity Scoring
+L2-normalised features, matmul scoring and argpartition top-k selection
+"""
+
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+def normalize_rows(features: np.ndarray) -> np.ndarray:
+    """L2-normalize feature rows (cosine similarity becomes a dot product)"""
+    features = np.asarray(features, dtype=np.float32)
+    norms = np.linalg.norm(features, axis=-1, keepdims=True)
+    return features / np.maximum(norms, 1e-12)
+
+
+def cosine_scores(features: np.ndarray, ref: np.ndarray) -> np.ndarray:
+    """
+    Cosine similarity of every feature row to one reference
+
+    Args:
+        features: (N, D) features, normalized or not
+        ref: (D,) or (1, D) reference feature, normalized or not
+    Returns:
+        sims: float32 array (N,)
+    """
+    ref = normalize_rows(np.reshape(ref, (-1,)))
+    return normalize_rows(features) @ ref
+
+
+FUSION_MODES = ("max", "mean")
+
+
+class ReferenceSet:
+    """
+    K reference features grouped into G identities
+
+    Crops are scored against every reference with one (N x D)·(D x K)
+    product. Several photos of the same identity are fused either by
+    averaging their normalized features ("mean", one column per identity)
+    or by taking the best per-photo score ("max").
+    """
+
+    def __init__(self, features: np.ndarray, identities: Optional[Sequence[str]] = None, fusion: str = "max"):
+        """
+        Args:
+            features: (K, D) reference features
+            identities: Identity label per reference (default: all the same person)
+            fusion: "max" or "mean"
+        """
+        if fusion not in FUSION_MODES:
+            raise ValueError(f"fusion must be one of {FUSION_MODES}")
+
+        features = normalize_rows(np.reshape(features, (len(features), -1)))
+        if identities is None:
+            identities = ["person"] * len(features)
+        if len(identities) != len(features):
+            raise ValueError("Need one identity label per reference image")
+
+        # Identity names in first-seen order, and the references of each
+        self.names = list(dict.fromkeys(identities))
+        groups = [[i for i, name in enumerate(identities) if name == identity] for identity in self.names]
+        self.reference_counts = [len(group) for group in groups]
+        self.fusion = fusion
+
+        if fusion == "mean":
+            self.matrix = normalize_rows(np.stack([features[group].mean(axis=0) for group in groups]))
+            self._starts = None
+        else:
+            # Columns grouped by identity so the max can be taken with reduceat
+            order = [i for group in groups for i in group]
+            self.matrix = features[order]
+            self._starts = np.cumsum([0] + self.reference_counts[:-1])
+
+    def __len__(self) -> int:
+        """Number of identities (G)"""
+        return len(self.names)
+
+    def score(self, features: np.ndarray) -> np.ndarray:
+        """
+        Fused cosine similarity of every crop to every identity
+
+        Args:
+            features: (N, D) crop features, normalized or not
+        Returns:
+            sims: float32 array (N, G)
+        """
+        sims = normalize_rows(features) @ self.matrix.T
+        if self._starts is not None:
+            if len(sims) == 0:
+                return np.empty((0, len(self)), dtype=np.float32)
+            sims = np.maximum.reduceat(sims, self._starts, axis=1)
+        return sims
+
+
+def as_reference_set(references) -> ReferenceSet:
+    """Wrap a single reference feature (1, D) / (D,) as a one-identity ReferenceSet"""
+    if isinstance(references, ReferenceSet):
+        return references
+    return ReferenceSet(np.reshape(references, (1, -1)))
+
+
+def top_k_indices(sims: np.ndarray, k: int, threshold: Optional[float] = None) -> np.ndarray:
+    """
+    Indices of the k highest scores (optionally only those >= threshold), best first
+
+    Uses argpartition, so cost is O(N + k log k) instead of a full sort.
+    """
+    sims = np.asarray(sims)
+    candidates = np.flatnonzero(sims >= threshold) if threshold is not None else np.arange(len(sims))
+
+    if k <= 0 or len(candidates) == 0:
+        return candidates[:0]
+
+    if len(candidates) > k:
+        candidates = candidates[np.argpartition(-sims[candidates], k - 1)[:k]]
+
+    return candidates[np.argsort(-sims[candidates], kind="stable")]
+
+
+def top_k_per_identity(sims: np.ndarray, k: int, threshold: Optional[float] = None) -> List[Tuple[int, int]]:
+    """
+    Best k rows for every identity column of an (N, G) similarity matrix
+
+    Returns:
+        (row, identity) pairs, highest similarity first
+    """
+    pairs = [
+        (int(row), identity)
+        for identity in range(sims.shape[1])
+        for row in top_k_indices(sims[:, identity], k, threshold)
+    ]
+    pairs.sort(key=lambda pair: -sims[pair])
+    return pairs
+
+
+class ScoreTable:
+    """
+    Growable contiguous arrays of per-detection scores and metadata
+
+    Rows are appended per frame; sims (N x G, one column per identity),
+    frame_nums and bboxes are views over the filled part of the buffers.
+    """
+
+    def __init__(self, columns: int = 1, capacity: int = 1024):
+        self.columns = columns
+        self._sims = np.empty((capacity, columns), dtype=np.float32)
+        self._frame_nums = np.empty(capacity, dtype=np.int64)
+        self._bboxes = np.empty((capacity, 4), dtype=np.int32)
+        self.size = 0
+
+    def __len__(self) -> int:
+        return self.size
+
+    def _reserve(self, extra: int):
+        capacity = len(self._sims)
+        if self.size + extra <= capacity:
+            return
+        capacity = max(capacity * 2, self.size + extra)
+        self._sims = np.resize(self._sims, (capacity, self.columns))
+        self._frame_nums = np.resize(self._frame_nums, capacity)
+        self._bboxes = np.resize(self._bboxes, (capacity, 4))
+
+    def append(self, sims: np.ndarray, frame_num: int, bboxes: List[List[int]]) -> int:
+        """
+        Add the detections of one frame
+
+        Args:
+            sims: (n, G) similarities of the frame's detections
+            frame_num: Frame number
+            bboxes: n bboxes
+        Returns:
+            start: Row index of the first added detection
+        """
+        count = len(sims)
+        self._reserve(count)
+        start = self.size
+        self._sims[start:start + count] = sims
+        self._frame_nums[start:start + count] = frame_num
+        self._bboxes[start:start + count] = bboxes
+        self.size += count
+        return start
+
+    @property
+    def sims(self) -> np.ndarray:
+        return self._sims[:self.size]
+
+    @property
+    def frame_nums(self) -> np.ndarray:
+        return self._frame_nums[:self.size]
+
+    @property
+    def bboxes(self) -> np.ndarray:
+        return self._bboxes[:self.size]
@@ -0,0 +1,39 @@
+"""
+Shared fixtures: the service modules on sys.path, synthetic videos and a
+service running the stub models of benchmarks/stubs.py
+"""
+
+import os
+import sys
+
+import pytest
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if SERVICE_DIR not in sys.path:
+    sys.path.insert(0, SERVICE_DIR)
+
+from benchmarks.fixtures import FixtureSpec, generate  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def videos(tmp_path_factory):
+    """A short clip with three walking figures (figure 0 is the target) and one with nobody in it"""
+    directory = str(tmp_path_factory.mktemp("videos"))
+    return {
+        "people": generate(FixtureSpec(320, 240, 10, 4, 3, name="people"), directory),
+        "empty": generate(FixtureSpec(320, 240, 10, 2, 0, name="empty"), directory)
+    }
+
+
+@pytest.fixture(scope="session")
+def service(tmp_path_factory):
+    """PersonReIDService with the stub YOLO and OSNet, without gallery, archive or artifacts"""
+    from benchmarks.stubs import StubReIDService
+
+    return StubReIDService(
+        os.path.join(SERVICE_DIR, "models"),
+        gallery_dir=None,
+        archive_dir=None,
+        artifact_dir=None,
+        profile_dir=str(tmp_path_factory.mktemp("profiles"))
+    )
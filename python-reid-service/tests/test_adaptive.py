@@ -0,0 +1,52 @@
+import pytest
+
+from adaptive import AdaptiveSampler
+
+
+def test_grid_is_global():
+    assert AdaptiveSampler.grid([(0, 10), (18, 30)], 4) == [0, 4, 8, 20, 24, 28]
+    assert AdaptiveSampler.grid([(0, 3), (2, 5)], 1) == [0, 1, 2, 3, 4, 5]
+
+
+def test_merge_windows_clipped_to_video():
+    sampler = AdaptiveSampler(step=16, interest_threshold=0.6, total_frames=100)
+    assert sampler.merge_windows([5, 12, 95], 4) == [(1, 16), (91, 99)]
+
+
+def observe_pass(sampler, frame_nums, interesting):
+    for frame_num in frame_nums:
+        similarity = 0.9 if frame_num in interesting else 0.1
+        sampler.observe({"frame_num": frame_num, "persons": [{"similarity": similarity}]})
+    sampler.finish_pass(len(frame_nums))
+
+
+def test_refinement_passes():
+    sampler = AdaptiveSampler(step=16, interest_threshold=0.6, total_frames=200)
+    # 80 and 112 of the window around 96 were sampled by the coarse pass already
+    observe_pass(sampler, list(range(0, 200, 16)), {96})
+
+    second = sampler.next_pass()
+    assert second == [84, 88, 92, 100, 104, 108]
+    observe_pass(sampler, second, {100})
+
+    third = sampler.next_pass()
+    assert third == [97, 98, 99, 101, 102, 103]
+    observe_pass(sampler, third, set())
+
+    assert sampler.next_pass() is None
+    assert [p["step"] for p in sampler.passes] == [16, 4, 1]
+    assert sampler.frames_processed == 13 + 6 + 6
+
+
+def test_nothing_interesting_stops_after_coarse_pass():
+    sampler = AdaptiveSampler(step=10, interest_threshold=0.6)
+    observe_pass(sampler, list(range(0, 100, 10)), set())
+    assert sampler.next_pass() is None
+    assert sampler.summary()["frames_processed"] == 10
+
+
+def test_invalid_settings():
+    with pytest.raises(ValueError):
+        AdaptiveSampler(step=0, interest_threshold=0.6)
+    with pytest.raises(ValueError):
+        AdaptiveSampler(step=10, interest_threshold=0.6, refine_factor=1)
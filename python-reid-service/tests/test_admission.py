@@ -0,0 +1,128 @@
+import pytest
+
+from admission import AdmissionController, AdmissionRejected, JobCost, estimate_cost
+
+HD_10_MINUTES = {"width": 1920, "height": 1080, "fps": 25.0, "total_frames": 15000}
+
+
+def test_estimate_cost():
+    cost = estimate_cost(HD_10_MINUTES, 0, buffered_frames=16, samples_per_second=5)
+    assert cost.frames == 3000
+    assert cost.work == pytest.approx(3000 * (1 + 1920 * 1080 / 1e6))
+    assert cost.memory_mb == pytest.approx(200 + 16 * 1920 * 1080 * 3 / 2**20)
+
+    adaptive = estimate_cost(HD_10_MINUTES, 0, 16, samples_per_second=5, search="adaptive")
+    assert adaptive.work == pytest.approx(1.5 * cost.work)
+
+    segmented = estimate_cost(HD_10_MINUTES, 0, 16, samples_per_second=5, segments=3)
+    assert segmented.parallel == 3
+    assert segmented.memory_mb == pytest.approx(3 * cost.memory_mb)
+
+
+def test_estimate_cost_without_metadata():
+    # 10 s at the fallback bitrate, 25 fps, every 30th frame
+    cost = estimate_cost(None, 5_000_000, 16, frame_interval=30)
+    assert cost.frames == 9
+    assert cost.work == pytest.approx(9 * (1 + 1920 * 1080 / 1e6))
+
+
+class Jobs:
+    """Submits jobs to a controller and records the order they start in"""
+
+    def __init__(self, controller, pool="analysis", workers=4):
+        self.controller = controller
+        self.pool = pool
+        self.started = []
+        controller.register_pool(pool, workers)
+
+    def submit(self, key, memory_mb=100.0, work=10.0, priority="normal", accept=True):
+        def start():
+            self.started.append(key)
+            return accept
+        return self.controller.submit(key, JobCost(memory_mb, work), priority, self.pool, start)
+
+
+def test_priority_order_within_memory_budget():
+    jobs = Jobs(AdmissionController(memory_budget_mb=1000), workers=10)
+    for key, priority in [("n1", "normal"), ("n2", "normal"), ("i1", "interactive"), ("n3", "normal"), ("b1", "batch")]:
+        jobs.submit(key, memory_mb=400, priority=priority)
+    assert jobs.started == ["n1", "n2"]
+
+    for key in ("n1", "n2", "i1"):
+        jobs.controller.release(key)
+    assert jobs.started == ["n1", "n2", "i1", "n3", "b1"]
+
+
+def test_worker_slots():
+    jobs = Jobs(AdmissionController(memory_budget_mb=10000), workers=1)
+    jobs.submit("a")
+    jobs.submit("b")
+    assert jobs.started == ["a"]
+    jobs.controller.release("a")
+    assert jobs.started == ["a", "b"]
+
+
+def test_job_over_budget_runs_alone():
+    jobs = Jobs(AdmissionController(memory_budget_mb=100))
+    jobs.submit("huge", memory_mb=500)
+    jobs.submit("small", memory_mb=10)
+    assert jobs.started == ["huge"]
+    jobs.controller.release("huge")
+    assert jobs.started == ["huge", "small"]
+
+
+def test_queue_full_is_rejected():
+    jobs = Jobs(AdmissionController(memory_budget_mb=10000, max_queued=1), workers=1)
+    jobs.submit("a")
+    jobs.submit("b")
+    with pytest.raises(AdmissionRejected) as rejected:
+        jobs.submit("c")
+    assert rejected.value.reason == "queue full"
+    assert rejected.value.retry_after >= 1
+
+
+def test_long_wait_is_rejected():
+    # 1000 units at the default 0.03 s per unit: the running job keeps the only worker ~30 s
+    jobs = Jobs(AdmissionController(memory_budget_mb=1000, max_wait_seconds=10), workers=1)
+    jobs.submit("a", work=1000)
+    with pytest.raises(AdmissionRejected) as rejected:
+        jobs.submit("b", work=1000)
+    assert rejected.value.reason.startswith("estimated wait")
+    assert rejected.value.retry_after == 20
+    with pytest.raises(AdmissionRejected):
+        jobs.controller.check(jobs.pool, "normal")
+
+
+def test_removed_job_never_starts():
+    jobs = Jobs(AdmissionController(memory_budget_mb=10000), workers=1)
+    jobs.submit("a")
+    jobs.submit("b")
+    jobs.controller.remove("b")
+    jobs.controller.release("a")
+    assert jobs.started == ["a"]
+    assert jobs.controller.stats()["running"] == 0
+
+
+def test_cancelled_start_frees_its_slot():
+    jobs = Jobs(AdmissionController(memory_budget_mb=10000), workers=1)
+    jobs.submit("a", accept=False)
+    jobs.submit("b")
+    assert jobs.started == ["a", "b"]
+    assert jobs.controller.stats()["running"] == 1
+
+
+def test_work_rate_follows_finished_jobs():
+    jobs = Jobs(AdmissionController(memory_budget_mb=10000))
+    jobs.submit("a", work=100)
+    jobs.controller.release("a", seconds=10)
+    # 0.03 + 0.2 * (0.1 - 0.03)
+    assert jobs.controller.seconds_per_unit == pytest.approx(0.044)
+    jobs.submit("b", work=100)
+    jobs.controller.release("b")
+    assert jobs.controller.seconds_per_unit == pytest.approx(0.044)
+
+
+def test_unknown_priority():
+    jobs = Jobs(AdmissionController(memory_budget_mb=10000))
+    with pytest.raises(ValueError):
+        jobs.submit("a", priority="urgent")
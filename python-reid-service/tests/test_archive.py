@@ -0,0 +1,112 @@
+import os
+from datetime import datetime
+
+import numpy as np
+
+from archive import FootageArchive, IVFPQQuantizer, QUANTIZER_FILE
+from scoring import normalize_rows
+
+RECORDED_AT = datetime(2026, 3, 1, 10, 0, 0)
+
+
+def random_features(rows: int, seed: int = 0) -> np.ndarray:
+    return normalize_rows(np.random.default_rng(seed).standard_normal((rows, 512)))
+
+
+def add_video(archive, features, video_hash, camera="gate", recorded_at=RECORDED_AT, fps=10.0):
+    frame_nums = np.arange(len(features))
+    bboxes = np.tile([0, 0, 10, 20], (len(features), 1))
+    return archive.add(features, frame_nums, bboxes, video_hash, camera, recorded_at, fps, f"{video_hash}.mp4")
+
+
+def test_quantizer_scores_approximate_inner_products(tmp_path):
+    vectors = random_features(2000)
+    quantizer = IVFPQQuantizer.train(vectors, lists=16)
+    lists = quantizer.assign(vectors)
+    codes = quantizer.encode(vectors, lists)
+    assert lists.shape == (2000,) and codes.shape == (2000, quantizer.subspaces)
+
+    queries = vectors[:5]
+    tables = quantizer.tables(queries)
+    approx = (queries @ quantizer.centroids.T)[:, lists] + tables[:, np.arange(quantizer.subspaces), codes].sum(axis=2)
+    exact = queries @ vectors.T
+    assert np.abs(approx - exact).mean() < 0.1
+    # Each query still ranks itself first
+    assert list(approx.argmax(axis=1)) == list(range(5))
+
+    path = str(tmp_path / QUANTIZER_FILE)
+    quantizer.save(path)
+    loaded = IVFPQQuantizer.load(path)
+    np.testing.assert_array_equal(loaded.centroids, quantizer.centroids)
+    np.testing.assert_array_equal(loaded.codebooks, quantizer.codebooks)
+
+
+def test_exact_search_and_filters(tmp_path):
+    archive = FootageArchive(str(tmp_path), "stub")
+    gate, lobby = random_features(50, seed=1), random_features(50, seed=2)
+    assert add_video(archive, gate, "v1", camera="gate") == 50
+    assert add_video(archive, lobby, "v2", camera="lobby") == 50
+    assert add_video(archive, gate, "v1", camera="gate") == 0
+    assert archive.contains("v1")
+
+    found = archive.search(gate[7], top_k=3)
+    assert found["search"]["mode"] == "exact"
+    best = found["results"][0]
+    assert (best["video_hash"], best["camera"], best["frame_number"]) == ("v1", "gate", 7)
+    assert best["similarity"] > 0.99
+    assert best["timestamp_seconds"] == 0.7
+
+    other = archive.search(gate[7], cameras=["lobby"])
+    assert {result["camera"] for result in other["results"]} == {"lobby"}
+
+    # Frames 10-19 were recorded between 1 and 2 seconds in
+    window = archive.search(gate[7], since=datetime(2026, 3, 1, 10, 0, 1), until=datetime(2026, 3, 1, 10, 0, 1, 900000))
+    assert sorted(result["frame_number"] for result in window["results"] if result["video_hash"] == "v1") == list(range(10, 20))
+    assert archive.search(gate[7], min_similarity=0.99)["results"] == [best]
+
+
+def test_video_across_midnight_is_split(tmp_path):
+    archive = FootageArchive(str(tmp_path), "stub")
+    add_video(archive, random_features(10), "night", recorded_at=datetime(2026, 3, 1, 23, 59, 55), fps=1.0)
+
+    shards = archive.shards()
+    assert [shard.read_info()["day"] for shard in shards] == ["2026-03-01", "2026-03-02"]
+    assert [shard.read_info()["count"] for shard in shards] == [5, 5]
+    assert archive.search(random_features(10)[8])["results"][0]["recorded_at"] == "2026-03-02T00:00:03.000"
+
+
+def test_training_runs_in_background(tmp_path):
+    archive = FootageArchive(str(tmp_path), "stub", train_size=2000, max_lists=16)
+    features = random_features(2000)
+    add_video(archive, features[:1000], "v1")
+    assert archive.quantizer() is None
+    add_video(archive, features[1000:], "v2", camera="lobby")
+    archive.wait(timeout=120)
+
+    assert archive.stats()["trained"] and archive.stats()["lists"] == 16
+    assert all(shard.read_info()["encoded"] == archive.quantizer().version for shard in archive.shards())
+    found = archive.search(features[1234], nprobe=4)
+    assert found["search"]["mode"] == "ivfpq"
+    assert found["search"]["candidates"] < 2000
+    assert (found["results"][0]["video_hash"], found["results"][0]["frame_number"]) == ("v2", 234)
+
+
+def test_stale_shard_is_searched_exactly_until_encoded(tmp_path):
+    archive = FootageArchive(str(tmp_path), "stub", train_size=2000, max_lists=16)
+    features = random_features(2000)
+    add_video(archive, features, "v1")
+    archive.wait(timeout=120)
+
+    (shard,) = archive.shards()
+    info = shard.read_info()
+    info["encoded"] = 999
+    shard.write_info(info)
+
+    found = archive.search(features[42], nprobe=1)
+    assert found["search"]["candidates"] == 2000
+    assert found["results"][0]["frame_number"] == 42
+
+    assert archive.maintain()
+    assert shard.read_info()["encoded"] == archive.quantizer().version
+    assert not [name for name in os.listdir(shard.path) if name.endswith(".tmp")]
+    assert archive.search(features[42], nprobe=1)["search"]["candidates"] < 2000
@@ -0,0 +1,43 @@
+import os
+import time
+
+import pytest
+from PIL import Image
+
+from artifacts import ArtifactStore
+
+
+def test_put_is_content_addressed(tmp_path):
+    store = ArtifactStore(str(tmp_path), max_size=(32, 64))
+    ref = store.put(Image.new("RGB", (64, 128), "red"))
+    assert (ref["width"], ref["height"]) == (32, 64)
+    assert ref["url"] == f"/artifacts/{ref['id']}.jpg"
+    assert os.path.getsize(store.path(ref["id"])) == ref["bytes"]
+    assert store.put(Image.new("RGB", (64, 128), "red"))["id"] == ref["id"]
+    assert store.path("../secret") is None
+
+
+def test_purge_removes_unused_thumbnails(tmp_path):
+    store = ArtifactStore(str(tmp_path))
+    old = store.put(Image.new("RGB", (20, 40), "red"))
+    reused = store.put(Image.new("RGB", (20, 40), "blue"))
+    served = store.put(Image.new("RGB", (20, 40), "white"))
+    fresh = store.put(Image.new("RGB", (20, 40), "green"))
+    long_ago = time.time() - 7200
+    for ref in (old, reused, served):
+        os.utime(store.path(ref["id"]), (long_ago, long_ago))
+    # Referenced again by a later result, or downloaded
+    store.put(Image.new("RGB", (20, 40), "blue"))
+    store.touch(store.path(served["id"]))
+
+    purged = store.purge(3600)
+    assert purged == {"removed": 1, "bytes": old["bytes"]}
+    assert store.path(old["id"]) is None
+    assert store.path(reused["id"]) is not None
+    assert store.path(served["id"]) is not None
+    assert store.path(fresh["id"]) is not None
+
+
+def test_invalid_quality(tmp_path):
+    with pytest.raises(ValueError):
+        ArtifactStore(str(tmp_path), quality=100)
@@ -0,0 +1,108 @@
+import os
+import shutil
+import time
+
+import numpy as np
+
+from gallery import CURRENT_FILE, FEATURE_DIM, GalleryIndex, STALE_VERSION_SECONDS, sampling_key
+from scoring import ReferenceSet
+
+
+def person(index: int, bbox):
+    vector = np.zeros(FEATURE_DIM, dtype=np.float32)
+    vector[index] = 2.0
+    return {"feature": vector, "bbox": bbox}
+
+
+def write_entry(index, tag="stub", persons=1):
+    writer = index.writer("video", "every30")
+    writer.add({"frame_num": 0, "persons": []})
+    writer.add({"frame_num": 30, "persons": [person(i, [i, 0, i + 10, 20]) for i in range(persons)]})
+    writer.commit({"model_tag": tag, "fps": 10.0})
+    return writer
+
+
+def test_sampling_key():
+    assert sampling_key(frame_interval=15) == "every15"
+    assert sampling_key(samples_per_second=2.5, motion_threshold=0.01, detector="d1") == "sps2.5-motion0.01-d1"
+
+
+def test_roundtrip(tmp_path):
+    index = GalleryIndex(str(tmp_path), "stub")
+    assert index.get("video", "every30") is None
+    write_entry(index, persons=2)
+
+    entry = index.get("video", "every30")
+    assert len(entry) == 2
+    assert entry.info["fps"] == 10.0
+    assert entry.frame_nums.tolist() == [30, 30]
+    assert entry.bboxes.tolist() == [[0, 0, 10, 20], [1, 0, 11, 20]]
+    sims = entry.similarities(ReferenceSet(np.eye(FEATURE_DIM, dtype=np.float32)[:2], ["a", "b"]))
+    np.testing.assert_allclose(sims, np.eye(2), atol=1e-3)
+
+
+def test_entry_without_detections(tmp_path):
+    index = GalleryIndex(str(tmp_path), "stub")
+    write_entry(index, persons=0)
+    entry = index.get("video", "every30")
+    assert len(entry) == 0
+    assert entry.similarities(ReferenceSet(np.eye(3), ["a", "b", "a"])).shape == (0, 2)
+
+
+def test_other_model_is_ignored(tmp_path):
+    write_entry(GalleryIndex(str(tmp_path), "stub"))
+    assert GalleryIndex(str(tmp_path), "other").get("video", "every30") is None
+
+
+def test_abort_leaves_nothing(tmp_path):
+    index = GalleryIndex(str(tmp_path), "stub")
+    writer = index.writer("video", "every30")
+    writer.add({"frame_num": 0, "persons": [person(0, [0, 0, 10, 20])]})
+    writer.abort()
+    assert index.get("video", "every30") is None
+    assert os.listdir(writer.entry_path) == []
+
+
+def test_concurrent_writers_last_commit_wins(tmp_path):
+    index = GalleryIndex(str(tmp_path), "stub")
+    first, second = index.writer("video", "every30"), index.writer("video", "every30")
+    first.add({"frame_num": 0, "persons": [person(0, [0, 0, 10, 20])]})
+    second.add({"frame_num": 5, "persons": [person(1, [5, 0, 15, 20])]})
+    second.commit({"model_tag": "stub"})
+    first.commit({"model_tag": "stub"})
+
+    entry = index.get("video", "every30")
+    assert entry.path == first.path
+    assert entry.frame_nums.tolist() == [0]
+    # The replaced version stays readable until it is stale
+    assert os.path.isdir(second.path)
+
+
+def test_stale_versions_are_pruned(tmp_path):
+    index = GalleryIndex(str(tmp_path), "stub")
+    first, second = write_entry(index), write_entry(index)
+    stale = time.time() - STALE_VERSION_SECONDS - 1
+    for writer in (first, second):
+        os.utime(writer.path, (stale, stale))
+    latest = write_entry(index)
+
+    # The version just replaced gets its full grace period; older ones go
+    assert sorted(os.listdir(latest.entry_path)) == sorted([CURRENT_FILE, second.version, latest.version])
+
+
+def test_entry_from_before_versions(tmp_path):
+    index = GalleryIndex(str(tmp_path), "stub")
+    writer = write_entry(index)
+    # Files directly in the entry directory, no CURRENT pointer
+    for name in os.listdir(writer.path):
+        shutil.move(os.path.join(writer.path, name), writer.entry_path)
+    os.rmdir(writer.path)
+    os.remove(os.path.join(writer.entry_path, CURRENT_FILE))
+
+    legacy = index.get("video", "every30")
+    assert legacy.path == writer.entry_path
+    assert len(legacy) == 1
+
+    replacement = write_entry(index, persons=2)
+    assert index.get("video", "every30").path == replacement.path
+    assert len(index.get("video", "every30")) == 2
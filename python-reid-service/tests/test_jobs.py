@@ -0,0 +1,39 @@
+import os
+import threading
+
+from jobs import COMPLETED, JobManager
+
+
+def test_files_in_use_until_job_finishes(tmp_path):
+    manager = JobManager(max_workers=1)
+    release = threading.Event()
+    upload = str(tmp_path / "video.mp4")
+    removed = []
+
+    def run(job):
+        release.wait(10)
+        return {"status": "success"}
+
+    running = manager.submit(run, files=[upload])
+    queued = manager.submit(run, files=[os.path.join(str(tmp_path), "other", "..", "ref.jpg")], cleanup=lambda: removed.append(True))
+    assert manager.files_in_use() == {upload, str(tmp_path / "ref.jpg")}
+
+    release.set()
+    running.future.result(10)
+    queued.future.result(10)
+    assert queued.status == COMPLETED and removed == [True]
+    assert manager.files_in_use() == set()
+    manager.shutdown()
+
+
+def test_cancelled_job_releases_its_files(tmp_path):
+    manager = JobManager(max_workers=1)
+    release = threading.Event()
+    first = manager.submit(lambda job: release.wait(10) and {"status": "success"})
+    queued = manager.submit(lambda job: {"status": "success"}, files=[str(tmp_path / "video.mp4")])
+
+    manager.cancel(queued.id)
+    assert manager.files_in_use() == set()
+    release.set()
+    first.future.result(10)
+    manager.shutdown()
@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+
+from scoring import ReferenceSet, ScoreTable, as_reference_set, normalize_rows, top_k_indices, top_k_per_identity
+
+
+def unit(*values):
+    return normalize_rows(np.array(values, dtype=np.float32))
+
+
+def test_normalize_rows():
+    rows = normalize_rows(np.array([[3.0, 4.0], [0.0, 0.0]]))
+    np.testing.assert_allclose(rows, [[0.6, 0.8], [0.0, 0.0]])
+    assert normalize_rows(np.empty((0, 4))).shape == (0, 4)
+
+
+def test_reference_set_fusion():
+    features = np.array([[1, 0, 0], [0, 1, 0], [0, 0, 1]], dtype=np.float32)
+    crops = np.array([[1, 0, 0], [0, 1, 0]], dtype=np.float32)
+
+    fused = ReferenceSet(features, ["a", "a", "b"], fusion="max")
+    assert fused.names == ["a", "b"]
+    assert fused.reference_counts == [2, 1]
+    np.testing.assert_allclose(fused.score(crops), [[1, 0], [1, 0]], atol=1e-6)
+
+    averaged = ReferenceSet(features, ["a", "a", "b"], fusion="mean")
+    np.testing.assert_allclose(averaged.score(crops), [[np.sqrt(0.5), 0], [np.sqrt(0.5), 0]], atol=1e-6)
+
+
+def test_reference_set_interleaved_identities():
+    features = np.array([[1, 0, 0], [0, 0, 1], [0, 1, 0]], dtype=np.float32)
+    references = ReferenceSet(features, ["a", "b", "a"])
+    assert len(references) == 2
+    np.testing.assert_allclose(references.score(np.eye(3)), [[1, 0], [1, 0], [0, 1]], atol=1e-6)
+
+
+def test_reference_set_no_crops():
+    references = ReferenceSet(np.eye(3), ["a", "b", "a"])
+    assert references.score(np.empty((0, 3))).shape == (0, 2)
+
+
+def test_reference_set_validation():
+    with pytest.raises(ValueError):
+        ReferenceSet(np.eye(2), fusion="median")
+    with pytest.raises(ValueError):
+        ReferenceSet(np.eye(2), ["a"])
+
+
+def test_as_reference_set():
+    references = as_reference_set(np.array([[2.0, 0.0]]))
+    assert len(references) == 1
+    np.testing.assert_allclose(references.score(unit([1, 0], [0, 1])), [[1], [0]], atol=1e-6)
+    assert as_reference_set(references) is references
+
+
+def test_top_k_indices():
+    sims = np.array([0.2, 0.9, 0.5, 0.7, 0.9])
+    assert list(top_k_indices(sims, 3)) == [1, 4, 3]
+    assert list(top_k_indices(sims, 10, threshold=0.6)) == [1, 4, 3]
+    assert len(top_k_indices(sims, 0)) == 0
+    assert len(top_k_indices(sims, 3, threshold=0.95)) == 0
+
+
+def test_top_k_per_identity():
+    sims = np.array([[0.9, 0.1], [0.2, 0.95], [0.8, 0.3], [0.5, 0.85]])
+    assert top_k_per_identity(sims, 2, threshold=0.5) == [(1, 1), (0, 0), (3, 1), (2, 0)]
+    assert top_k_per_identity(sims, 1) == [(1, 1), (0, 0)]
+    assert top_k_per_identity(np.empty((0, 2)), 3, threshold=0.5) == []
+
+
+def test_score_table_grows():
+    table = ScoreTable(columns=2, capacity=2)
+    assert table.append(np.array([[0.1, 0.2]]), 0, [[0, 0, 1, 1]]) == 0
+    assert table.append(np.array([[0.3, 0.4], [0.5, 0.6]]), 5, [[1, 1, 2, 2], [2, 2, 3, 3]]) == 1
+    assert table.append(np.empty((0, 2)), 6, np.empty((0, 4))) == 3
+
+    assert len(table) == 3
+    np.testing.assert_allclose(table.sims, [[0.1, 0.2], [0.3, 0.4], [0.5, 0.6]])
+    assert list(table.frame_nums) == [0, 5, 5]
+    assert table.bboxes.tolist() == [[0, 0, 1, 1], [1, 1, 2, 2], [2, 2, 3, 3]]
@@ -0,0 +1,106 @@
+"""End-to-end analyses on synthetic videos with the stub YOLO and OSNet"""
+
+import cv2
+import numpy as np
+import pytest
+
+from scoring import ReferenceSet
+from tracking import IoUTracker
+
+
+def analyze(service, fixture, references, **options):
+    return service.analyze(references, fixture["video"], samples_per_second=5, images="none", use_gallery=False, **options)
+
+
+@pytest.mark.parametrize("options", [{}, {"track": True}, {"search": "adaptive"}], ids=["fixed", "track", "adaptive"])
+def test_empty_video_with_several_identities(service, videos, options):
+    references = [videos["people"]["reference"], videos["empty"]["reference"]]
+    result = analyze(service, videos["empty"], references, identities=["a", "b"], **options)
+
+    assert result["status"] == "success", result.get("message")
+    assert result["matches"] == []
+    assert [identity["identity"] for identity in result["identities"]] == ["a", "b"]
+    for identity in result["identities"]:
+        assert identity["statistics"]["total_detections"] == 0
+        assert identity["matches"] == []
+
+
+def test_no_detections(service, videos):
+    result = analyze(service, videos["empty"], videos["people"]["reference"])
+    assert result["status"] == "success", result.get("message")
+    assert result["statistics"] == {
+        "total_detections": 0, "mean_similarity": 0, "max_similarity": 0, "matches_found": 0
+    }
+    assert result["matches"] == []
+
+
+def test_finds_target(service, videos):
+    result = analyze(service, videos["people"], videos["people"]["reference"], threshold=0.5)
+    assert result["status"] == "success", result.get("message")
+    assert result["statistics"]["total_detections"] > 0
+
+    best = result["matches"][0]
+    x1, y1, x2, y2 = videos["people"]["ground_truth"][str(best["frame_number"])][0]
+    bx1, by1, bx2, by2 = best["bbox"]
+    overlap = max(0, min(x2, bx2) - max(x1, bx1)) * max(0, min(y2, by2) - max(y1, by1))
+    assert overlap > 0.5 * (x2 - x1) * (y2 - y1)
+
+
+def test_tracked_analysis_reports_tracklets(service, videos):
+    result = analyze(service, videos["people"], videos["people"]["reference"], threshold=0.5, track=True)
+    assert result["status"] == "success", result.get("message")
+    tracking = result["tracking"]
+    assert 0 < tracking["crops_embedded"] < tracking["detections"]
+    track = result["matches"][0]["track"]
+    assert track["start_frame"] <= result["matches"][0]["frame_number"] <= track["end_frame"]
+
+
+def test_track_scores_as_its_best_crop(service):
+    tracker = IoUTracker(fps=10, crops_per_track=3, quality_gain=1.0, min_appearance=-1.0)
+    target = np.zeros(512, dtype=np.float32)
+    target[0] = 1.0
+    # Same box growing: every frame selects a better crop, each a bit closer to the target
+    for frame_num, weight in enumerate([0.2, 0.9, 0.5]):
+        bbox = [0, 0, 50 + frame_num, 100 + 2 * frame_num]
+        ((track, quality),) = tracker.update(frame_num, [bbox])
+        feature = np.zeros(512, dtype=np.float32)
+        feature[0], feature[1] = weight, 1.0 - weight
+        tracker.add_feature(track, feature, frame_num, bbox, quality)
+
+    matches, all_sims = service.find_track_matches(tracker, ReferenceSet(target[None]), fps=10, threshold=0.5)
+    assert all_sims.shape == (1, 1)
+    (match,) = matches
+    assert match["frame_num"] == 1
+    assert match["bbox"] == [0, 0, 51, 102]
+    assert match["similarity"] == pytest.approx(0.9 / np.hypot(0.9, 0.1), abs=1e-5)
+    assert match["track"]["crops_embedded"] == 3
+
+    empty, sims = service.find_track_matches(IoUTracker(fps=10), ReferenceSet(np.eye(2), ["a", "b"]), fps=10)
+    assert empty == [] and sims.shape == (0, 2)
+
+
+def test_intra_only_video_seeks_every_gap(service, videos, tmp_path, monkeypatch):
+    path = str(tmp_path / "mjpg.avi")
+    source = cv2.VideoCapture(videos["people"]["video"])
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), 10, (320, 240))
+    while True:
+        ok, frame = source.read()
+        if not ok:
+            break
+        writer.write(frame)
+    writer.release()
+
+    cap = cv2.VideoCapture(path)
+    assert service.is_intra_only(cap)
+    # Far below SEEK_MIN_GAP, still seeked
+    assert service.choose_sampling_mode(cap, 5, 40) == "seek"
+    cap.release()
+
+    decoded = list(service.extract_video_frames(path, frame_interval=5, sampling_mode="read"))
+    grabs = []
+    grab = cv2.VideoCapture.grab
+    monkeypatch.setattr(cv2.VideoCapture, "grab", lambda self: grabs.append(1) or grab(self))
+    seeked = list(service.extract_video_frames(path, frame_interval=5))
+    assert grabs == []
+    assert [frame_num for frame_num, _ in seeked] == [frame_num for frame_num, _ in decoded] == list(range(0, 40, 5))
+    assert all(np.array_equal(a, b) for (_, a), (_, b) in zip(seeked, decoded))
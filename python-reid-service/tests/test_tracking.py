@@ -0,0 +1,105 @@
+import numpy as np
+
+from tracking import IoUTracker, crop_quality, iou_matrix
+
+
+def feature(index: int) -> np.ndarray:
+    """One distinct unit appearance per person"""
+    vector = np.zeros(512, dtype=np.float32)
+    vector[index] = 1.0
+    return vector
+
+
+def embed_selected(tracker, frame_num, bboxes, people):
+    """update() one frame and embed the crops it selects, person i looking like feature(people[i])"""
+    results = tracker.update(frame_num, bboxes)
+    for (track, quality), bbox, person in zip(results, bboxes, people):
+        if quality is not None:
+            tracker.add_feature(track, feature(person), frame_num, bbox, quality)
+    return results
+
+
+def test_iou_matrix():
+    ious = iou_matrix([[0, 0, 10, 10]], [[0, 0, 10, 10], [20, 20, 30, 30], [5, 0, 15, 10]])
+    np.testing.assert_allclose(ious, [[1.0, 0.0, 1 / 3]], atol=1e-6)
+    assert iou_matrix(np.empty((0, 4)), [[0, 0, 1, 1]]).shape == (0, 1)
+
+
+def test_crop_quality_penalizes_squat_crops():
+    assert crop_quality([0, 0, 10, 20]) == 200
+    assert crop_quality([0, 0, 20, 10]) == 50
+
+
+def test_walking_person_is_one_tracklet():
+    tracker = IoUTracker(fps=10)
+    for frame_num in range(20):
+        x = 2 * frame_num
+        embed_selected(tracker, frame_num, [[x, 0, x + 50, 100]], [0])
+
+    (track,) = tracker.tracklets()
+    assert (track.start_frame, track.end_frame, track.detections) == (0, 19, 20)
+    assert 1 <= len(track.crops) <= tracker.crops_per_track
+    assert tracker.summary() == {"tracks": 1, "detections": 20, "crops_embedded": len(track.crops)}
+
+
+def test_people_apart_get_separate_tracklets():
+    tracker = IoUTracker(fps=10)
+    for frame_num in range(10):
+        embed_selected(tracker, frame_num, [[0, 0, 50, 100], [200, 0, 250, 100]], [0, 1])
+
+    tracks = tracker.tracklets()
+    assert len(tracks) == 2
+    assert [track.detections for track in tracks] == [10, 10]
+
+
+def test_gap_ends_tracklet():
+    tracker = IoUTracker(fps=10, max_gap_seconds=2.0)
+    embed_selected(tracker, 0, [[0, 0, 50, 100]], [0])
+    embed_selected(tracker, 30, [[0, 0, 50, 100]], [0])
+    assert len(tracker.tracklets()) == 2
+
+
+def test_sparse_sampling_keeps_tracklet():
+    # 3 s between samples is longer than max_gap_seconds, but only one sampling step
+    tracker = IoUTracker(fps=10, max_gap_seconds=2.0, sample_step=30)
+    for frame_num in (0, 30, 60):
+        x = frame_num
+        embed_selected(tracker, frame_num, [[x, 0, x + 50, 100]], [0])
+    (track,) = tracker.tracklets()
+    assert track.detections == 3
+
+
+def crossing_frames():
+    """Boxes 30 px apart every second (IoU 0.25: linked by centre distance only), person 0 then person 1"""
+    for frame_num in range(0, 100, 10):
+        x = 3 * frame_num
+        yield frame_num, [[x, 0, x + 50, 100]], [0 if frame_num < 50 else 1]
+
+
+def test_appearance_splits_tracklet():
+    tracker = IoUTracker(fps=10)
+    for frame_num, bboxes, people in crossing_frames():
+        embed_selected(tracker, frame_num, bboxes, people)
+
+    first, second = tracker.tracklets()
+    assert (first.start_frame, first.end_frame) == (0, 40)
+    assert (second.start_frame, second.end_frame) == (50, 90)
+    assert first.successor is second
+    assert first.detections + second.detections == 10
+    np.testing.assert_allclose(second.feature(), feature(1), atol=1e-6)
+
+
+def test_late_features_go_to_successor():
+    # Crops are embedded in batches, after update() has seen later frames
+    tracker = IoUTracker(fps=10)
+    pending = []
+    for frame_num, bboxes, people in crossing_frames():
+        for (track, quality), bbox, person in zip(tracker.update(frame_num, bboxes), bboxes, people):
+            if quality is not None:
+                pending.append((track, feature(person), frame_num, bbox, quality))
+    owners = [tracker.add_feature(*crop).id for crop in pending]
+
+    first, second = tracker.tracklets()
+    assert owners == [first.id if crop[2] < 50 else second.id for crop in pending]
+    assert (second.start_frame, second.end_frame) == (50, 90)
+    np.testing.assert_allclose(first.feature(), feature(0), atol=1e-6)
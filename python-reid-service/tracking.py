@@ -0,0 +1,277 @@
+"""
+Tracklet Association
+Links per-frame person detections into tracklets (IoU / centroid matching, checked
+against appearance) so each person is embedded a few times per appearance instead
+of on every sampled frame
+"""
+
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from scoring import normalize_rows
+
+
+def iou_matrix(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """
+    Pairwise IoU of two sets of [x1, y1, x2, y2] boxes
+
+    Returns:
+        ious: float32 array (len(a), len(b))
+    """
+    a = np.asarray(a, dtype=np.float32).reshape(-1, 4)
+    b = np.asarray(b, dtype=np.float32).reshape(-1, 4)
+
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    union = area_a[:, None] + area_b[None, :] - inter
+    return inter / np.maximum(union, 1e-6)
+
+
+def crop_quality(bbox: Sequence[int]) -> float:
+    """
+    How useful a crop is for re-identification
+
+    Larger crops score higher; crops much squatter than a standing person
+    (about 1:2, usually truncated or occluded) are penalized.
+    """
+    x1, y1, x2, y2 = bbox
+    width, height = max(x2 - x1, 1), max(y2 - y1, 1)
+    return float(width * height * min(1.0, (height / width) / 2.0))
+
+
+class Tracklet:
+    """One person's consecutive detections and the features of its selected crops"""
+
+    def __init__(self, track_id: int, frame_num: int, bbox: List[int]):
+        self.id = track_id
+        self.start_frame = frame_num
+        self.end_frame = frame_num
+        self.bbox = bbox
+        # Frame numbers of every detection
+        self.frames = [frame_num]
+        # Crops sent for embedding for their quality, the best quality among
+        # them, and the frame of the last crop sent for any reason
+        self.selected = 0
+        self.best_quality = 0.0
+        self.last_embedded = frame_num
+        # (quality, frame_num, bbox, feature) of every embedded crop
+        self.crops: List[Tuple[float, int, List[int], np.ndarray]] = []
+        # Tracklet that took over from start_frame on, if this one was split
+        self.successor: Optional["Tracklet"] = None
+
+    @property
+    def detections(self) -> int:
+        return len(self.frames)
+
+    def add_feature(self, feature: np.ndarray, frame_num: int, bbox: List[int], quality: float):
+        """Record the OSNet feature of one selected crop"""
+        self.crops.append((quality, frame_num, bbox, feature))
+
+    def features(self) -> np.ndarray:
+        """L2-normalized features of the embedded crops, (crops, 512)"""
+        return normalize_rows(np.stack([feature for _, _, _, feature in self.crops]))
+
+    def feature(self) -> np.ndarray:
+        """Aggregated feature: mean of the L2-normalized crop features, normalized again"""
+        return normalize_rows(self.features().mean(axis=0))
+
+
+class IoUTracker:
+    """
+    Greedy online association of detections to tracklets
+
+    Each new detection joins the live tracklet whose last box overlaps it
+    most (IoU), or failing that whose centre is close enough relative to the
+    box height, which covers people moving between sparse samples (the
+    allowed distance grows with the time since the tracklet was seen). A
+    tracklet dies after max_gap_seconds without a detection, or after two
+    sampling steps if those are longer.
+
+    update() also decides which crops are worth embedding: the first crop of
+    a tracklet, then up to crops_per_track in total, each only if it is
+    clearly better (quality_gain) than the best one embedded so far. A
+    detection linked by centre distance alone is embedded too (at most every
+    verify_seconds), since that link is the one most likely to have jumped
+    to another person.
+
+    Boxes alone cannot tell two people apart, so appearance has the last
+    word: add_feature() splits a tracklet when a new crop's feature does not
+    resemble the tracklet's (cosine below min_appearance).
+    """
+
+    def __init__(
+        self,
+        fps: float,
+        iou_threshold: float = 0.3,
+        max_center_distance: float = 0.75,
+        max_gap_seconds: float = 2.0,
+        crops_per_track: int = 3,
+        quality_gain: float = 1.2,
+        sample_step: float = 0,
+        min_appearance: float = 0.5,
+        verify_seconds: float = 1.0
+    ):
+        """
+        Args:
+            fps: Video frame rate (frame numbers are converted to time)
+            iou_threshold: Minimum IoU to continue a tracklet
+            max_center_distance: Max centre distance, as a fraction of the box height,
+                for detections that do not overlap enough (per second since the
+                tracklet's last detection, when that is longer than a second)
+            max_gap_seconds: Time without detections after which a tracklet ends
+            crops_per_track: Maximum crops embedded per tracklet (for crop quality)
+            quality_gain: Factor a crop must beat the best embedded one by
+            sample_step: Frames between sampled frames; a tracklet survives at
+                least one sample without a detection
+            min_appearance: Minimum cosine similarity of a new crop to its
+                tracklet's feature; below it the tracklet is split
+            verify_seconds: Shortest time between two crops embedded only to
+                check a centre-distance link
+        """
+        if crops_per_track < 1:
+            raise ValueError("crops_per_track must be >= 1")
+
+        self.fps = fps or 30.0
+        self.max_gap_frames = max(max_gap_seconds * self.fps, 2 * sample_step)
+        self.iou_threshold = iou_threshold
+        self.max_center_distance = max_center_distance
+        self.crops_per_track = crops_per_track
+        self.quality_gain = quality_gain
+        self.min_appearance = min_appearance
+        self.verify_frames = verify_seconds * self.fps
+
+        self.tracks: Dict[int, Tracklet] = {}
+        self._active: List[Tracklet] = []
+        self._next_id = 0
+
+    def _associate(self, frame_num: int, bboxes: np.ndarray) -> List[Tuple[Optional[Tracklet], bool]]:
+        """Match detections to live tracklets, best pairs first; per detection (tracklet, linked by IoU)"""
+        assigned: List[Tuple[Optional[Tracklet], bool]] = [(None, False)] * len(bboxes)
+        if not self._active or len(bboxes) == 0:
+            return assigned
+
+        previous = np.array([track.bbox for track in self._active], dtype=np.float32)
+        ious = iou_matrix(previous, bboxes)
+
+        centers_prev = (previous[:, :2] + previous[:, 2:]) / 2
+        centers_new = (bboxes[:, :2] + bboxes[:, 2:]) / 2
+        heights = np.maximum(previous[:, 3] - previous[:, 1], 1.0)
+        elapsed = np.array([frame_num - track.end_frame for track in self._active], dtype=np.float32) / self.fps
+        scale = heights * np.maximum(elapsed, 1.0)
+        distances = np.linalg.norm(centers_prev[:, None] - centers_new[None], axis=-1) / scale[:, None]
+
+        candidate = (ious >= self.iou_threshold) | (distances <= self.max_center_distance)
+        rows, cols = np.nonzero(candidate)
+        # Overlap first, centre distance breaks ties (and ranks non-overlapping pairs)
+        order = np.lexsort((distances[rows, cols], -ious[rows, cols]))
+
+        used_tracks, used_boxes = set(), set()
+        for k in order:
+            row, col = int(rows[k]), int(cols[k])
+            if row in used_tracks or col in used_boxes:
+                continue
+            used_tracks.add(row)
+            used_boxes.add(col)
+            assigned[col] = (self._active[row], bool(ious[row, col] >= self.iou_threshold))
+        return assigned
+
+    def update(self, frame_num: int, bboxes: List[List[int]]) -> List[Tuple[Tracklet, Optional[float]]]:
+        """
+        Add one sampled frame's detections
+
+        Args:
+            frame_num: Frame number (frames must arrive in increasing order)
+            bboxes: [x1, y1, x2, y2] per detection
+        Returns:
+            Per detection, its tracklet and the crop quality if the crop should
+            be embedded (None if the tracklet already has good enough crops)
+        """
+        self._active = [track for track in self._active if frame_num - track.end_frame <= self.max_gap_frames]
+
+        boxes = np.asarray(bboxes, dtype=np.float32).reshape(-1, 4)
+        assigned = self._associate(frame_num, boxes)
+
+        results = []
+        for bbox, (track, overlapping) in zip(bboxes, assigned):
+            bbox = [int(x) for x in bbox]
+            if track is None:
+                track = self._new_track(frame_num, bbox)
+                self._active.append(track)
+            else:
+                track.end_frame = frame_num
+                track.bbox = bbox
+                track.frames.append(frame_num)
+
+            quality = crop_quality(bbox)
+            selected = track.selected == 0 or (
+                track.selected < self.crops_per_track and quality > track.best_quality * self.quality_gain
+            )
+            if selected:
+                track.selected += 1
+                track.best_quality = max(track.best_quality, quality)
+            # Linked by centre distance only: embed to check it is the same person
+            embed = selected or (not overlapping and frame_num - track.last_embedded >= self.verify_frames)
+            if embed:
+                track.last_embedded = frame_num
+            results.append((track, quality if embed else None))
+
+        return results
+
+    def add_feature(self, track: Tracklet, feature: np.ndarray, frame_num: int, bbox: List[int], quality: float) -> Tracklet:
+        """
+        Record the OSNet feature of a crop update() asked for
+
+        Crops are embedded in batches, after update() has moved on, so a
+        crop from after a split goes to the tracklet that took over. A crop
+        that does not look like its tracklet means the boxes were linked to
+        another person: the tracklet is split at that frame.
+
+        Returns:
+            The tracklet that got the feature
+        """
+        while track.successor is not None and frame_num >= track.successor.start_frame:
+            track = track.successor
+        if track.crops and float(track.feature() @ normalize_rows(np.asarray(feature, dtype=np.float32))) < self.min_appearance:
+            track = self._split(track, frame_num, quality)
+        track.add_feature(feature, frame_num, bbox, quality)
+        return track
+
+    def _new_track(self, frame_num: int, bbox: List[int]) -> Tracklet:
+        track = Tracklet(self._next_id, frame_num, bbox)
+        self._next_id += 1
+        self.tracks[track.id] = track
+        return track
+
+    def _split(self, track: Tracklet, frame_num: int, quality: float) -> Tracklet:
+        """Hand the detections of track from frame_num on to a new tracklet"""
+        successor = self._new_track(frame_num, track.bbox)
+        successor.frames = [frame for frame in track.frames if frame >= frame_num]
+        successor.end_frame = track.end_frame
+        successor.selected = 1
+        successor.best_quality = quality
+        track.frames = [frame for frame in track.frames if frame < frame_num]
+        track.end_frame = track.frames[-1]
+        track.successor = successor
+        if track in self._active:
+            self._active[self._active.index(track)] = successor
+        return successor
+
+    def tracklets(self) -> List[Tracklet]:
+        """All tracklets with at least one embedded crop, in order of appearance"""
+        return [track for track in self.tracks.values() if track.crops]
+
+    def summary(self) -> Dict:
+        """Counts for the response: tracklets, detections and crops embedded"""
+        tracks = list(self.tracks.values())
+        return {
+            "tracks": len(tracks),
+            "detections": sum(track.detections for track in tracks),
+            "crops_embedded": sum(len(track.crops) for track in tracks)
+        }
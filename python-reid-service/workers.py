@@ -0,0 +1,361 @@
+"""
+Inference Worker Processes
+Forks analysis processes from a parent that has already loaded the models, so
+the weights are shared instead of loaded once per process, and hands each
+analysis to whichever worker is free
+"""
+
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional
+
+from pipeline import AnalysisCancelled
+from profiling import REGISTRY
+
+
+class WorkerCrashed(RuntimeError):
+    """A worker process died in the middle of an analysis"""
+
+
+def available_cpus() -> List[int]:
+    """CPUs this process may run on"""
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def cpu_slices(workers: int, cpus: Optional[List[int]] = None) -> List[List[int]]:
+    """
+    Split the CPUs into one contiguous slice per worker
+
+    With more workers than CPUs, workers share single CPUs round-robin.
+    """
+    cpus = cpus or available_cpus()
+    if workers >= len(cpus):
+        return [[cpus[i % len(cpus)]] for i in range(workers)]
+
+    size, extra = divmod(len(cpus), workers)
+    slices, start = [], 0
+    for i in range(workers):
+        end = start + size + (1 if i < extra else 0)
+        slices.append(cpus[start:end])
+        start = end
+    return slices
+
+
+def _worker_main(service, conn, cancel, cpus: List[int], num_threads: int, pin: bool):
+    """Worker process: run analyses received on conn until told to stop"""
+    if pin and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cpus)
+    service.prepare_worker(num_threads)
+    # Counts inherited from the parent are already in the parent's registry
+    REGISTRY.drain()
+
+    send_lock = threading.Lock()
+
+    def send(kind: str, data=None):
+        with send_lock:
+            conn.send((kind, data))
+
+    warmup_seconds = service.warm_up()
+    REGISTRY.drain()
+    send("ready", {"pid": os.getpid(), "cpus": cpus, "threads": num_threads, "warmup_seconds": round(warmup_seconds, 2)})
+
+    while True:
+        try:
+            task = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            break
+        if task is None:
+            break
+
+        method, kwargs = task
+        cancel.clear()
+        try:
+            result = getattr(service, method)(
+                progress=lambda progress: send("progress", progress),
+                on_match=lambda match: send("match", match),
+                cancel_event=cancel,
+                **kwargs
+            )
+        except AnalysisCancelled:
+            send("metrics", REGISTRY.drain())
+            send("cancelled")
+        except Exception as e:
+            send("metrics", REGISTRY.drain())
+            send("error", str(e))
+        else:
+            send("metrics", REGISTRY.drain())
+            send("result", result)
+
+
+class _Task:
+    """One analysis waiting for, or running on, a worker"""
+
+    def __init__(
+        self,
+        method: str,
+        kwargs: Dict,
+        progress: Optional[Callable[[Dict], None]],
+        on_match: Optional[Callable[[Dict], None]],
+        cancel_event: Optional[threading.Event]
+    ):
+        self.method = method
+        self.kwargs = kwargs
+        self.progress = progress
+        self.on_match = on_match
+        self.cancel_event = cancel_event
+        self.future = Future()
+
+
+class _Worker:
+    """Parent-side handle of one worker process"""
+
+    def __init__(self, index: int, cpus: List[int]):
+        self.index = index
+        self.cpus = cpus
+        self.process = None
+        self.conn = None
+        self.cancel = None
+        self.info: Dict = {}
+        self.busy = False
+        self.completed = 0
+        self.restarts = -1
+
+
+class WorkerPool:
+    """
+    N forked inference processes fed from one queue
+
+    The parent loads the models once and forks the workers after loading,
+    so the weight tensors stay in pages shared copy-on-write with every
+    worker. Each worker is pinned to its own slice of CPUs with a matching
+    torch thread count, so workers do not fight over cores. One dispatcher
+    thread per worker takes the next queued analysis whenever its worker is
+    idle, which keeps every worker busy while work is waiting.
+
+    Forking needs the models on the CPU: CUDA cannot be used in a forked child.
+    """
+
+    def __init__(self, service, workers: int, threads_per_worker: int = 0, pin: bool = True):
+        """
+        Args:
+            service: Loaded PersonReIDService, inherited by every worker
+            workers: Number of worker processes
+            threads_per_worker: Intra-op threads per worker (0 = the size of its CPU slice)
+            pin: Restrict each worker to its CPU slice (Linux)
+        """
+        if workers < 1:
+            raise ValueError("workers must be >= 1")
+        if service.device.type != "cpu":
+            raise ValueError("Worker processes are CPU-only; on a GPU use MAX_CONCURRENT_JOBS instead")
+        if "fork" not in multiprocessing.get_all_start_methods():
+            raise RuntimeError("Worker processes need the 'fork' start method (Linux, macOS)")
+
+        self.service = service
+        self.threads_per_worker = threads_per_worker
+        self.pin = pin
+        self._context = multiprocessing.get_context("fork")
+        self._workers = [_Worker(i, cpus) for i, cpus in enumerate(cpu_slices(workers))]
+        self._tasks: "queue.Queue[Optional[_Task]]" = queue.Queue()
+        self._threads: List[threading.Thread] = []
+        self._closed = False
+
+    def start(self, timeout: float = 300) -> float:
+        """
+        Fork the workers and wait until all have warmed up
+
+        Returns:
+            seconds: Time taken
+        """
+        print(f"🧵 Starting {len(self._workers)} worker processes...")
+        start = time.perf_counter()
+        for worker in self._workers:
+            self._spawn(worker)
+        for worker in self._workers:
+            self._wait_ready(worker, timeout)
+            print(f"   worker {worker.index}: pid {worker.info['pid']}, cpus {worker.cpus}, {worker.info['threads']} threads")
+
+        for worker in self._workers:
+            thread = threading.Thread(target=self._serve, args=(worker,), name=f"reid-dispatch-{worker.index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+        seconds = time.perf_counter() - start
+        print(f"✅ Workers ready in {seconds:.1f}s\n")
+        return seconds
+
+    def _spawn(self, worker: _Worker):
+        parent_conn, child_conn = self._context.Pipe()
+        worker.cancel = self._context.Event()
+        threads = self.threads_per_worker or len(worker.cpus)
+        worker.process = self._context.Process(
+            target=_worker_main,
+            args=(self.service, child_conn, worker.cancel, worker.cpus, threads, self.pin),
+            name=f"reid-worker-{worker.index}",
+            daemon=True
+        )
+        worker.process.start()
+        child_conn.close()
+        worker.conn = parent_conn
+        worker.restarts += 1
+
+    def _wait_ready(self, worker: _Worker, timeout: float):
+        if not worker.conn.poll(timeout):
+            raise WorkerCrashed(f"Worker {worker.index} did not start within {timeout:.0f}s")
+        try:
+            kind, info = worker.conn.recv()
+        except EOFError:
+            raise WorkerCrashed(f"Worker {worker.index} exited during startup (code {worker.process.exitcode})")
+        worker.info = info
+
+    def _serve(self, worker: _Worker):
+        """Dispatcher thread: feed one worker, one analysis at a time"""
+        while True:
+            task = self._tasks.get()
+            if task is None:
+                return
+            if not task.future.set_running_or_notify_cancel():
+                continue
+            if task.cancel_event is not None and task.cancel_event.is_set():
+                task.future.set_exception(AnalysisCancelled("Analysis cancelled"))
+                continue
+
+            worker.busy = True
+            try:
+                task.future.set_result(self._run(worker, task))
+            except BaseException as e:
+                task.future.set_exception(e)
+            finally:
+                worker.busy = False
+                worker.completed += 1
+
+    def _run(self, worker: _Worker, task: _Task):
+        worker.conn.send((task.method, task.kwargs))
+        while True:
+            if task.cancel_event is not None and task.cancel_event.is_set():
+                # Seen by the worker's pipeline at its next frame
+                worker.cancel.set()
+
+            try:
+                if not worker.conn.poll(0.1):
+                    if not worker.process.is_alive():
+                        raise EOFError
+                    continue
+                kind, data = worker.conn.recv()
+            except (EOFError, OSError):
+                worker.process.join(5)
+                code = worker.process.exitcode
+                self._restart(worker)
+                raise WorkerCrashed(f"Worker {worker.index} died during the analysis (exit code {code})")
+
+            if kind == "progress" and task.progress is not None:
+                task.progress(data)
+            elif kind == "match" and task.on_match is not None:
+                task.on_match(data)
+            elif kind == "metrics":
+                REGISTRY.merge(data)
+            elif kind == "result":
+                return data
+            elif kind == "cancelled":
+                raise AnalysisCancelled("Analysis cancelled")
+            elif kind == "error":
+                raise RuntimeError(data)
+
+    def _restart(self, worker: _Worker):
+        """Replace a dead worker with a fresh fork"""
+        if self._closed:
+            return
+        print(f"⚠️  Worker {worker.index} exited (exit code {worker.process.exitcode}), restarting...")
+        worker.conn.close()
+        self._spawn(worker)
+        try:
+            self._wait_ready(worker, 300)
+        except WorkerCrashed as e:
+            print(f"❌ {e}")
+
+    def submit(
+        self,
+        method: str,
+        kwargs: Dict,
+        progress: Optional[Callable[[Dict], None]] = None,
+        on_match: Optional[Callable[[Dict], None]] = None,
+        cancel_event: Optional[threading.Event] = None
+    ) -> Future:
+        """
+        Queue a call of a service method in the next free worker
+
+        Args:
+            method: PersonReIDService method taking progress, on_match and cancel_event
+            kwargs: Its other arguments (sent to the worker, so they must pickle)
+            progress: Called in the parent with each progress update
+            on_match: Called in the parent with each provisional match
+            cancel_event: Set to stop the analysis (the future raises AnalysisCancelled)
+        Returns:
+            future: Resolves to the method's return value
+        """
+        if self._closed:
+            raise RuntimeError("Worker pool is shut down")
+        task = _Task(method, kwargs, progress, on_match, cancel_event)
+        self._tasks.put(task)
+        return task.future
+
+    def analyze(
+        self,
+        progress: Optional[Callable[[Dict], None]] = None,
+        on_match: Optional[Callable[[Dict], None]] = None,
+        cancel_event: Optional[threading.Event] = None,
+        **kwargs
+    ) -> Dict:
+        """PersonReIDService.analyze in a worker process (blocks until it finishes)"""
+        return self.submit("analyze", kwargs, progress, on_match, cancel_event).result()
+
+    def stats(self) -> Dict:
+        return {
+            "workers": len(self._workers),
+            "busy": sum(worker.busy for worker in self._workers),
+            "queued": self._tasks.qsize(),
+            "processes": [
+                {
+                    "pid": worker.info.get("pid"),
+                    "cpus": worker.cpus,
+                    "threads": worker.info.get("threads"),
+                    "busy": worker.busy,
+                    "completed": worker.completed,
+                    "restarts": worker.restarts
+                }
+                for worker in self._workers
+            ]
+        }
+
+    def shutdown(self, timeout: float = 10):
+        """Cancel running analyses and stop the worker processes"""
+        self._closed = True
+        while True:
+            try:
+                task = self._tasks.get_nowait()
+            except queue.Empty:
+                break
+            if task is not None:
+                task.future.cancel()
+        for worker in self._workers:
+            if worker.cancel is not None:
+                worker.cancel.set()
+        for _ in self._threads:
+            self._tasks.put(None)
+        for thread in self._threads:
+            thread.join(timeout)
+        for worker in self._workers:
+            if worker.process is None:
+                continue
+            try:
+                worker.conn.send(None)
+            except OSError:
+                pass
+            worker.process.join(timeout)
+            if worker.process.is_alive():
+                worker.process.terminate()
@@ -5,6 +5,42 @@ import { revalidatePath } from "next/cache";
 import path from "path";
 import fs from "fs";
 
+const REID_SERVICE_URL = "http://localhost:8000";
+
+// Analysis parameters shared by the path and upload requests
+function analysisForm() {
+    const formData = new FormData();
+    formData.append("threshold", "0.60"); // Slightly lower threshold
+    formData.append("top_n", "5");
+    // Thumbnails are stored by the service; keepThumbnails copies them before the result is saved
+    formData.append("images", "ref");
+    return formData;
+}
+
+// The service may purge its thumbnails, so a saved result points at copies under
+// public/uploads/matches (named by content hash: each is written once)
+async function keepThumbnails(result: any) {
+    const matches = [
+        ...(result.matches || []),
+        ...(result.identities || []).flatMap((identity: any) => identity.matches || []),
+    ].filter((match: any) => match.image?.id);
+    if (matches.length === 0) return;
+
+    const dir = path.join(process.cwd(), "public", "uploads", "matches");
+    await fs.promises.mkdir(dir, { recursive: true });
+
+    for (const match of matches) {
+        const fileName = `${match.image.id}.jpg`;
+        const filePath = path.join(dir, fileName);
+        if (!fs.existsSync(filePath)) {
+            const response = await fetch(`${REID_SERVICE_URL}/artifacts/${fileName}`);
+            if (!response.ok) throw new Error(`Thumbnail ${match.image.id} not available`);
+            await fs.promises.writeFile(filePath, Buffer.from(await response.arrayBuffer()));
+        }
+        match.image.localUrl = `/uploads/matches/${fileName}`;
+    }
+}
+
 export async function analyzeCase(caseId: string) {
     try {
         const c = await prisma.case.findUnique({
@@ -24,62 +60,175 @@ export async function analyzeCase(caseId: string) {
         if (!fs.existsSync(absoluteImagePath)) throw new Error(`Image not found: ${absoluteImagePath}`);
         if (!fs.existsSync(absoluteVideoPath)) throw new Error(`Video not found: ${absoluteVideoPath}`);
 
-        // Prepare FormData for Python API
-        const formData = new FormData();
-
-        // We need to read the files to send them? 
-        // Wait, the Python service accepts file uploads via multipart/form-data.
-        // So we need to stream the files to the Python service.
+        // Same machine: pass paths so the service reads the files in place (no upload, no copy).
+        // Needs LOCAL_MEDIA_ROOTS on the service; otherwise it answers 400 and we upload instead.
+        const pathForm = analysisForm();
+        pathForm.append("reference_image_path", absoluteImagePath);
+        pathForm.append("video_path", absoluteVideoPath);
 
-        const imageBlob = new Blob([fs.readFileSync(absoluteImagePath)], { type: 'image/jpeg' });
-        const videoBlob = new Blob([fs.readFileSync(absoluteVideoPath)], { type: 'video/mp4' });
-
-        formData.append("reference_image", imageBlob, "ref.jpg");
-        formData.append("video", videoBlob, "video.mp4");
-        formData.append("threshold", "0.60"); // Slightly lower threshold
-        formData.append("top_n", "5");
-
-        // Call Python Service
-        const response = await fetch("http://localhost:8000/analyze", {
+        // Submit a background job; the Python service answers right away with a job id
+        let response = await fetch(`${REID_SERVICE_URL}/jobs`, {
             method: "POST",
-            body: formData,
+            body: pathForm,
         });
 
+        if (response.status === 400) {
+            // File-backed blobs: the body is streamed from disk, not buffered in memory,
+            // and /jobs/stream writes it once to its final path on the service
+            const uploadForm = analysisForm();
+            uploadForm.append("reference_image", await fs.openAsBlob(absoluteImagePath, { type: "image/jpeg" }), "ref.jpg");
+            uploadForm.append("video", await fs.openAsBlob(absoluteVideoPath, { type: "video/mp4" }), path.basename(absoluteVideoPath));
+
+            response = await fetch(`${REID_SERVICE_URL}/jobs/stream`, {
+                method: "POST",
+                body: uploadForm,
+            });
+        }
+
         if (!response.ok) {
             const errorText = await response.text();
             throw new Error(`AI Service Error: ${errorText}`);
         }
 
-        const result = await response.json();
-
-        // Save Result
-        await prisma.analysisResult.create({
-            data: {
-                caseId: c.id,
-                rawResult: JSON.stringify(result),
-                topMatch: result.matches && result.matches.length > 0 ? result.matches[0].confidence : 0,
-            },
-        });
+        const job = await response.json();
 
-        // Update Case Status
+        // The job id is the case's claim on the result: only this job may complete it
         await prisma.case.update({
             where: { id: caseId },
-            data: { status: result.matches && result.matches.length > 0 ? "SOLVED" : "ANALYZING" },
+            data: { status: "ANALYZING", jobId: job.job_id },
         });
 
-        // Send Email Notification
-        if (c.user && c.user.email) {
+        // Finish on the server, so the result is saved even if nobody keeps polling
+        void watchAnalysisJob(caseId, job.job_id);
+
+        return { success: true, jobId: job.job_id as string };
+
+    } catch (error: any) {
+        console.error("Analysis failed:", error);
+        return { success: false, error: error.message };
+    }
+}
+
+const WATCH_INTERVAL_MS = 5000;
+// Consecutive errors (service unreachable) before the watcher gives up; polling resumes it
+const WATCH_MAX_FAILURES = 60;
+const watching = new Set<string>();
+
+async function watchAnalysisJob(caseId: string, jobId: string) {
+    if (watching.has(jobId)) return;
+    watching.add(jobId);
+    try {
+        for (let failures = 0; failures < WATCH_MAX_FAILURES;) {
+            await new Promise((resolve) => setTimeout(resolve, WATCH_INTERVAL_MS));
             try {
-                const { sendAnalysisCompletionEmail } = await import("@/lib/mail");
-                await sendAnalysisCompletionEmail(c.user.email, c.title, c.id, result);
-            } catch (emailError) {
-                console.error("Failed to send email notification:", emailError);
-                // Don't fail the request if email fails
+                if ((await finishAnalysisJob(caseId, jobId)).done) return;
+                failures = 0;
+            } catch (error) {
+                failures++;
+                console.error(`Watching job ${jobId} failed:`, error);
             }
         }
+    } finally {
+        watching.delete(jobId);
+    }
+}
 
-        revalidatePath(`/admin/cases/${caseId}`);
-        return { success: true };
+// Put a case whose job failed, was cancelled or expired back to PENDING (unless a newer job took over)
+async function releaseCase(caseId: string, jobId: string) {
+    await prisma.case.updateMany({
+        where: { id: caseId, jobId, status: "ANALYZING" },
+        data: { status: "PENDING" },
+    });
+}
+
+// Look at a job once and, if it has finished, settle its case. Safe to call any number of
+// times from anywhere: the conditional update lets exactly one caller save the result.
+async function finishAnalysisJob(caseId: string, jobId: string) {
+    const response = await fetch(`${REID_SERVICE_URL}/jobs/${jobId}`, { cache: "no-store" });
+
+    if (response.status === 404) {
+        // Service restarted, or the result expired (result_ttl) before anyone collected it
+        await releaseCase(caseId, jobId);
+        return { done: true, status: "lost", error: "Analysis job no longer exists" };
+    }
+    if (!response.ok) {
+        const errorText = await response.text();
+        throw new Error(`AI Service Error: ${errorText}`);
+    }
+
+    const job = await response.json();
+
+    if (job.status === "queued" || job.status === "running") {
+        return { done: false, status: job.status, progress: job.progress };
+    }
+
+    if (job.status !== "completed") {
+        await releaseCase(caseId, jobId);
+        return { done: true, status: job.status, error: job.error || `Analysis ${job.status}` };
+    }
+
+    const c = await prisma.case.findUnique({
+        where: { id: caseId },
+        include: { user: true },
+    });
+
+    if (!c) throw new Error("Case not found");
+    if (c.jobId !== jobId || c.status !== "ANALYZING") {
+        // Already saved by another caller, or superseded by a newer analysis
+        return { done: true, status: job.status };
+    }
+
+    const result = job.result;
+    await keepThumbnails(result);
+    const hasMatches = result.matches && result.matches.length > 0;
+
+    // Save Result and Update Case Status, once per job
+    const saved = await prisma.$transaction(async (tx) => {
+        const claimed = await tx.case.updateMany({
+            where: { id: caseId, jobId, status: "ANALYZING" },
+            data: { status: hasMatches ? "SOLVED" : "PENDING" },
+        });
+        if (claimed.count === 0) return false;
+
+        const data = {
+            rawResult: JSON.stringify(result),
+            topMatch: hasMatches ? result.matches[0].confidence : 0,
+        };
+        await tx.analysisResult.upsert({
+            where: { caseId },
+            create: { caseId, ...data },
+            update: data,
+        });
+        return true;
+    });
+
+    // Send Email Notification
+    if (saved && c.user && c.user.email) {
+        try {
+            const { sendAnalysisCompletionEmail } = await import("@/lib/mail");
+            await sendAnalysisCompletionEmail(c.user.email, c.title, c.id, result);
+        } catch (emailError) {
+            console.error("Failed to send email notification:", emailError);
+            // Don't fail the request if email fails
+        }
+    }
+
+    return { done: true, status: job.status };
+}
+
+// Poll a job started by analyzeCase (or resume watching one after a reload)
+export async function checkAnalysisJob(caseId: string, jobId: string) {
+    try {
+        const status = await finishAnalysisJob(caseId, jobId);
+
+        if (status.error) throw new Error(status.error);
+        if (status.done) {
+            revalidatePath(`/admin/cases/${caseId}`);
+        } else {
+            // No-op if already watched; restarts the watcher after a server restart
+            void watchAnalysisJob(caseId, jobId);
+        }
+        return { success: true, ...status };
 
     } catch (error: any) {
         console.error("Analysis failed:", error);
@@ -48,7 +48,7 @@ export default async function CaseDetail({ params }: { params: { id: string } })
                 </div>
 
                 {c.status !== 'SOLVED' && (
-                    <AnalyzeButton caseId={c.id} />
+                    <AnalyzeButton caseId={c.id} activeJobId={c.status === 'ANALYZING' ? c.jobId : null} />
                 )}
             </div>
 
@@ -137,9 +137,9 @@ export default async function CaseDetail({ params }: { params: { id: string } })
                                         <div className="flex items-start gap-4">
                                             {/* Match Image */}
                                             <div className="relative h-20 w-20 flex-shrink-0 overflow-hidden rounded-lg border border-zinc-700 bg-black">
-                                                {match.image_base64 && (
+                                                {(match.image || match.image_base64) && (
                                                     <img
-                                                        src={match.image_base64}
+                                                        src={match.image ? (match.image.localUrl ?? `/api/artifacts/${match.image.id}`) : match.image_base64}
                                                         alt={`Match ${i + 1}`}
                                                         className="h-full w-full object-cover"
                                                     />
@@ -0,0 +1,21 @@
+const REID_SERVICE_URL = "http://localhost:8000";
+
+// Match thumbnails live in the Re-ID service's artifact store; ids are content hashes,
+// so the response never changes and can be cached for good
+export async function GET(req: Request, { params }: { params: { id: string } }) {
+    if (!/^[0-9a-f]{64}$/.test(params.id)) {
+        return new Response("Not found", { status: 404 });
+    }
+
+    const response = await fetch(`${REID_SERVICE_URL}/artifacts/${params.id}.jpg`);
+    if (!response.ok) {
+        return new Response("Not found", { status: 404 });
+    }
+
+    return new Response(response.body, {
+        headers: {
+            "Content-Type": "image/jpeg",
+            "Cache-Control": "public, max-age=31536000, immutable",
+        },
+    });
+}
@@ -1,23 +1,44 @@
 "use client";
 
-import { analyzeCase } from "@/app/actions/analyze";
+import { analyzeCase, checkAnalysisJob } from "@/app/actions/analyze";
 import { Loader2, Play } from "lucide-react";
-import { useState } from "react";
+import { useEffect, useState } from "react";
 import { useRouter } from "next/navigation";
 
-export default function AnalyzeButton({ caseId }: { caseId: string }) {
+const POLL_INTERVAL_MS = 2000;
+
+// activeJobId: job of a case that is already ANALYZING; its progress is followed on load
+export default function AnalyzeButton({ caseId, activeJobId }: { caseId: string; activeJobId?: string | null }) {
     const [loading, setLoading] = useState(false);
+    const [framesDone, setFramesDone] = useState<number | null>(null);
     const router = useRouter();
 
-    const handleAnalyze = async () => {
-        setLoading(true);
-        try {
-            const result = await analyzeCase(caseId);
-            if (result.success) {
+    // Poll the job instead of holding one request open for the whole analysis
+    // (the server saves the result on its own; polling only shows progress)
+    const followJob = async (jobId: string) => {
+        while (true) {
+            await new Promise((resolve) => setTimeout(resolve, POLL_INTERVAL_MS));
+            const status = await checkAnalysisJob(caseId, jobId);
+
+            if (!status.success) {
+                alert("Analysis failed: " + status.error);
                 router.refresh();
-            } else {
-                alert("Analysis failed: " + result.error);
+                return;
             }
+            if (status.done) {
+                router.refresh();
+                return;
+            }
+            setFramesDone(status.progress?.frames_detected ?? null);
+        }
+    };
+
+    const run = async (start: () => Promise<string | null>) => {
+        setLoading(true);
+        setFramesDone(null);
+        try {
+            const jobId = await start();
+            if (jobId) await followJob(jobId);
         } catch (error) {
             alert("Something went wrong");
         } finally {
@@ -25,6 +46,20 @@ export default function AnalyzeButton({ caseId }: { caseId: string }) {
         }
     };
 
+    useEffect(() => {
+        if (activeJobId) run(async () => activeJobId);
+        // eslint-disable-next-line react-hooks/exhaustive-deps
+    }, [activeJobId]);
+
+    const handleAnalyze = () => run(async () => {
+        const started = await analyzeCase(caseId);
+        if (!started.success || !started.jobId) {
+            alert("Analysis failed: " + started.error);
+            return null;
+        }
+        return started.jobId;
+    });
+
     return (
         <button
             onClick={handleAnalyze}
@@ -34,7 +69,7 @@ export default function AnalyzeButton({ caseId }: { caseId: string }) {
             {loading ? (
                 <>
                     <Loader2 className="h-4 w-4 animate-spin" />
-                    Analyzing...
+                    {framesDone !== null ? `Analyzing... (${framesDone} frames)` : "Analyzing..."}
                 </>
             ) : (
                 <>